@@ -1,14 +1,19 @@
 """Admin API routes"""
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime, timezone
+import base64
 import secrets
+import time
 from ..core.auth import AuthManager
 from ..core.database import Database
 from ..core.config import config
 from ..services.token_manager import TokenManager
 from ..services.proxy_manager import ProxyManager
+from ..services.load_balancer import STRATEGIES
+from ..services.media_worker import media_workers
 
 router = APIRouter()
 
@@ -16,17 +21,37 @@ router = APIRouter()
 token_manager: TokenManager = None
 proxy_manager: ProxyManager = None
 db: Database = None
+generation_handler = None
 
 # Store active admin session tokens (in production, use Redis or database)
 active_admin_tokens = set()
 
+# Short-lived cache for dashboard endpoints: key -> (expires_at, registry version, value)
+_response_cache = {}
 
-def set_dependencies(tm: TokenManager, pm: ProxyManager, database: Database):
+
+async def _cached_response(key: str, build):
+    """在 TTL 内且 Token 注册表未变化时复用上一次的响应"""
+    ttl = config.admin_stats_cache_ttl
+    entry = _response_cache.get(key)
+    now = time.monotonic()
+    if entry and entry[0] > now and entry[1] == token_manager.version:
+        return entry[2]
+
+    version = token_manager.version
+    value = await build()
+    if ttl > 0:
+        _response_cache[key] = (now + ttl, version, value)
+    return value
+
+
+def set_dependencies(tm: TokenManager, pm: ProxyManager, database: Database, gh=None):
     """Set service instances"""
-    global token_manager, proxy_manager, db
+    global token_manager, proxy_manager, db, generation_handler
     token_manager = tm
     proxy_manager = pm
     db = database
+    generation_handler = gh
 
 
 # ========== Request Models ==========
@@ -68,6 +93,11 @@ class GenerationConfigRequest(BaseModel):
     video_timeout: int
 
 
+class LoadBalanceConfigRequest(BaseModel):
+    image_strategy: str
+    video_strategy: str
+
+
 class ChangePasswordRequest(BaseModel):
     username: Optional[str] = None
     old_password: str
@@ -187,11 +217,16 @@ async def change_password(
 @router.get("/api/tokens")
 async def get_tokens(token: str = Depends(verify_admin_token)):
     """Get all tokens with statistics"""
+    return await _cached_response("tokens", _build_tokens_response)
+
+
+async def _build_tokens_response():
     tokens = await token_manager.get_all_tokens()
+    all_stats = await token_manager.get_all_token_stats()
     result = []
 
     for t in tokens:
-        stats = await db.get_token_stats(t.id)
+        stats = all_stats.get(t.id)
 
         result.append({
             "id": t.id,
@@ -600,11 +635,45 @@ async def get_system_info(token: str = Depends(verify_admin_token)):
             "total_tokens": len(tokens),
             "active_tokens": len(active_tokens),
             "total_credits": total_credits,
+            "upstream_sessions": token_manager.flow_client.get_session_pool_stats(),
+            "upload_cache": token_manager.flow_client.get_upload_cache_stats(),
+            "media_workers": media_workers.get_stats(),
+            "leases": generation_handler.concurrency_manager.get_lease_stats() if generation_handler else None,
+            "token_stats_buffer": token_manager.stats_buffer.get_stats(),
+            "request_log_queue": generation_handler.request_log_queue.get_stats() if generation_handler else None,
+            "log_retention": generation_handler.log_retention.get_stats() if generation_handler else None,
+            "config_version": config.version,
             "version": "1.0.0"
         }
     }
 
 
+@router.get("/api/poll/stats")
+async def get_poll_stats(token: str = Depends(verify_admin_token)):
+    """Get learned per-model completion percentiles and batched poller counters"""
+    if not generation_handler:
+        raise HTTPException(status_code=503, detail="Generation handler not initialized")
+
+    return {
+        "success": True,
+        "scheduler": generation_handler.poll_scheduler.get_stats(),
+        "poller": generation_handler.video_poller.get_stats()
+    }
+
+
+@router.get("/api/queue/stats")
+async def get_queue_stats(token: str = Depends(verify_admin_token)):
+    """Get admission queue depth/wait-time metrics and token lease counters"""
+    if not generation_handler:
+        raise HTTPException(status_code=503, detail="Generation handler not initialized")
+
+    return {
+        "success": True,
+        "queue": generation_handler.concurrency_manager.get_queue_stats(),
+        "leases": generation_handler.concurrency_manager.get_lease_stats()
+    }
+
+
 # ========== Additional Routes for Frontend Compatibility ==========
 
 @router.post("/api/login")
@@ -622,8 +691,13 @@ async def logout(token: str = Depends(verify_admin_token)):
 @router.get("/api/stats")
 async def get_stats(token: str = Depends(verify_admin_token)):
     """Get statistics for dashboard"""
+    return await _cached_response("stats", _build_stats_response)
+
+
+async def _build_stats_response():
     tokens = await token_manager.get_all_tokens()
     active_tokens = [t for t in tokens if t.is_active]
+    all_stats = await token_manager.get_all_token_stats()
 
     # Calculate totals
     total_images = 0
@@ -634,7 +708,7 @@ async def get_stats(token: str = Depends(verify_admin_token)):
     today_errors = 0
 
     for t in tokens:
-        stats = await db.get_token_stats(t.id)
+        stats = all_stats.get(t.id)
         if stats:
             total_images += stats.image_count
             total_videos += stats.video_count
@@ -655,15 +729,82 @@ async def get_stats(token: str = Depends(verify_admin_token)):
     }
 
 
+def _encode_log_cursor(log: dict) -> str:
+    """编码分页游标 (最后一条日志的 created_at 和 id)"""
+    raw = f"{log.get('created_at')}|{log.get('id')}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_log_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, log_id = raw.rsplit("|", 1)
+        return created_at, int(log_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_log_time(value: Optional[str], name: str) -> Optional[str]:
+    """将 ISO 时间转换为 request_logs.created_at 的存储格式 (UTC)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}, expected ISO 8601 time")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
 @router.get("/api/logs")
 async def get_logs(
-    limit: int = 100,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    token_id: Optional[int] = None,
+    operation: Optional[str] = None,
+    status_code: Optional[int] = None,
+    start_time: Optional[str] = None,
+    end_time: Optional[str] = None,
+    include_bodies: bool = True,
     token: str = Depends(verify_admin_token)
 ):
-    """Get request logs with token email"""
-    logs = await db.get_logs(limit=limit)
+    """Get request logs with token email (newest first)
+
+    Pagination is keyset based: when more rows exist the X-Next-Cursor response
+    header holds the cursor for the next page. include_bodies=false omits
+    request_body/response_body; use /api/logs/{log_id} to fetch them.
+    """
+    logs = await db.query_logs(
+        limit=limit,
+        before=_decode_log_cursor(cursor) if cursor else None,
+        token_id=token_id,
+        operation=operation,
+        status_code=status_code,
+        start_time=_parse_log_time(start_time, "start_time"),
+        end_time=_parse_log_time(end_time, "end_time"),
+        include_bodies=include_bodies
+    )
 
-    return [{
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = _encode_log_cursor(logs[-1])
+
+    return [_format_log(log, include_bodies) for log in logs]
+
+
+@router.get("/api/logs/{log_id}")
+async def get_log_detail(log_id: int, token: str = Depends(verify_admin_token)):
+    """Get a single request log including request/response bodies"""
+    log = await db.get_log(log_id)
+    if not log:
+        raise HTTPException(status_code=404, detail="Log not found")
+
+    return {"success": True, "log": _format_log(log, include_bodies=True)}
+
+
+def _format_log(log: dict, include_bodies: bool) -> dict:
+    item = {
         "id": log.get("id"),
         "token_id": log.get("token_id"),
         "token_email": log.get("token_email"),
@@ -671,10 +812,12 @@ async def get_logs(
         "operation": log.get("operation"),
         "status_code": log.get("status_code"),
         "duration": log.get("duration"),
-        "created_at": log.get("created_at"),
-        "request_body": log.get("request_body"),
-        "response_body": log.get("response_body")
-    } for log in logs]
+        "created_at": log.get("created_at")
+    }
+    if include_bodies:
+        item["request_body"] = log.get("request_body")
+        item["response_body"] = log.get("response_body")
+    return item
 
 
 @router.delete("/api/logs")
@@ -709,6 +852,9 @@ async def update_admin_config(
     # Update error_ban_threshold in database
     await db.update_admin_config(error_ban_threshold=request.error_ban_threshold)
 
+    # 🔥 Hot reload: sync database config to memory
+    await db.reload_config_to_memory()
+
     return {"success": True, "message": "配置更新成功"}
 
 
@@ -773,6 +919,41 @@ async def update_generation_timeout(
     return {"success": True, "message": "生成配置更新成功"}
 
 
+# ========== Load Balance Config ==========
+
+@router.get("/api/load-balance/config")
+async def get_load_balance_config(token: str = Depends(verify_admin_token)):
+    """Get token selection strategy configuration"""
+    lb_config = await db.get_load_balance_config()
+    return {
+        "success": True,
+        "config": {
+            "image_strategy": lb_config.image_strategy,
+            "video_strategy": lb_config.video_strategy
+        },
+        "strategies": list(STRATEGIES),
+        "latency": generation_handler.load_balancer.get_latency_stats() if generation_handler else {}
+    }
+
+
+@router.post("/api/load-balance/config")
+async def update_load_balance_config(
+    request: LoadBalanceConfigRequest,
+    token: str = Depends(verify_admin_token)
+):
+    """Update token selection strategy configuration"""
+    for strategy in (request.image_strategy, request.video_strategy):
+        if strategy not in STRATEGIES:
+            raise HTTPException(status_code=400, detail=f"不支持的负载均衡策略: {strategy}")
+
+    await db.update_load_balance_config(request.image_strategy, request.video_strategy)
+
+    # 🔥 Hot reload: sync database config to memory
+    await db.reload_config_to_memory()
+
+    return {"success": True, "message": "负载均衡策略更新成功"}
+
+
 # ========== AT Auto Refresh Config ==========
 
 @router.get("/api/token-refresh/config")
@@ -782,7 +963,9 @@ async def get_token_refresh_config(token: str = Depends(verify_admin_token)):
         "success": True,
         "config": {
             "at_auto_refresh_enabled": True  # Flow2API默认启用AT自动刷新
-        }
+        },
+        "scheduler": token_manager.refresh_scheduler.get_stats(),
+        "single_flight": token_manager.single_flight.get_stats()
     }
 
 
@@ -814,7 +997,9 @@ async def get_cache_config(token: str = Depends(verify_admin_token)):
             "timeout": cache_config.cache_timeout,
             "base_url": cache_config.cache_base_url or "",
             "effective_base_url": effective_base_url
-        }
+        },
+        "downloads": generation_handler.file_cache.get_download_stats() if generation_handler else None,
+        "cache": generation_handler.file_cache.get_cache_stats() if generation_handler else None
     }
 
 
@@ -943,6 +1128,15 @@ async def get_captcha_config(token: str = Depends(verify_admin_token)):
     }
 
 
+@router.get("/api/captcha/stats")
+async def get_captcha_stats(token: str = Depends(verify_admin_token)):
+    """Get per-provider latency and success metrics of API captcha services"""
+    return {
+        "success": True,
+        "stats": token_manager.flow_client.captcha_client.get_stats()
+    }
+
+
 # ========== Plugin Configuration Endpoints ==========
 
 @router.get("/api/plugin/config")
@@ -2,22 +2,24 @@
 from fastapi import APIRouter, Depends, HTTPException,Request
 from fastapi.responses import StreamingResponse, JSONResponse
 from typing import List, Optional
-import base64
 import re
 import json
 import time
 from urllib.parse import urlparse
 from curl_cffi.requests import AsyncSession
 from ..core.auth import verify_api_key_header
-from ..core.models import ChatCompletionRequest
+from ..core.models import ChatCompletionRequest, VideoGenerationRequest
 from ..services.generation_handler import GenerationHandler, MODEL_CONFIG
 from ..core.logger import debug_logger
+from ..services.video_job_manager import VideoJobManager
 from ..services.flow_client import TM_TASKS, TM_RESULTS
+from ..services.media_worker import media_workers
 
 router = APIRouter()
 
 # Dependency injection will be set up in main.py
 generation_handler: GenerationHandler = None
+video_job_manager: VideoJobManager = None
 
 
 def set_generation_handler(handler: GenerationHandler):
@@ -26,6 +28,12 @@ def set_generation_handler(handler: GenerationHandler):
     generation_handler = handler
 
 
+def set_video_job_manager(manager: VideoJobManager):
+    """Set video job manager instance"""
+    global video_job_manager
+    video_job_manager = manager
+
+
 async def retrieve_image_data(url: str) -> Optional[bytes]:
     """
     智能获取图片数据：
@@ -42,6 +50,7 @@ async def retrieve_image_data(url: str) -> Optional[bytes]:
             if local_file_path.exists() and local_file_path.is_file():
                 data = local_file_path.read_bytes()
                 if data:
+                    generation_handler.file_cache.touch(filename)
                     return data
     except Exception as e:
         debug_logger.log_warning(f"[CONTEXT] 本地缓存读取失败: {str(e)}")
@@ -119,7 +128,7 @@ async def create_chat_completion(
                         match = re.search(r"base64,(.+)", image_url)
                         if match:
                             image_base64 = match.group(1)
-                            image_bytes = base64.b64decode(image_base64)
+                            image_bytes = await media_workers.b64decode(image_base64)
                             images.append(image_bytes)
                     elif image_url.startswith("http://") or image_url.startswith("https://"):
                         # Download remote image URL
@@ -140,7 +149,7 @@ async def create_chat_completion(
                 match = re.search(r"base64,(.+)", request.image)
                 if match:
                     image_base64 = match.group(1)
-                    image_bytes = base64.b64decode(image_base64)
+                    image_bytes = await media_workers.b64decode(image_base64)
                     images.append(image_bytes)
 
         # 自动参考图：仅对图片模型生效
@@ -251,6 +260,53 @@ async def create_chat_completion(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/v1/videos")
+async def create_video_job(
+    request: VideoGenerationRequest,
+    api_key: str = Depends(verify_api_key_header)
+):
+    """Submit an async video generation job and return its id immediately"""
+    model_config = MODEL_CONFIG.get(request.model)
+    if not model_config or model_config["type"] != "video":
+        raise HTTPException(status_code=400, detail=f"不支持的视频模型: {request.model}")
+    if not request.prompt:
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+    if request.webhook_url and not request.webhook_url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="webhook_url must start with http:// or https://")
+
+    images: List[bytes] = []
+    for image_url in request.images or []:
+        if image_url.startswith("data:image"):
+            match = re.search(r"base64,(.+)", image_url)
+            if match:
+                images.append(await media_workers.b64decode(match.group(1)))
+        elif image_url.startswith("http://") or image_url.startswith("https://"):
+            downloaded_bytes = await retrieve_image_data(image_url)
+            if not downloaded_bytes:
+                raise HTTPException(status_code=400, detail=f"图片下载失败: {image_url}")
+            images.append(downloaded_bytes)
+
+    job = await video_job_manager.submit(
+        model=request.model,
+        prompt=request.prompt,
+        images=images if images else None,
+        webhook_url=request.webhook_url
+    )
+    return JSONResponse(status_code=202, content=VideoJobManager.to_response(job))
+
+
+@router.get("/v1/videos/{job_id}")
+async def get_video_job(
+    job_id: str,
+    api_key: str = Depends(verify_api_key_header)
+):
+    """Get async video job status"""
+    job = await video_job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    return VideoJobManager.to_response(job)
+
+
 @router.get("/tm/task")
 async def get_tm_task(project_id: str):
     """油猴脚本来要任务的接口"""
@@ -10,6 +10,8 @@ class Config:
         self._config = self._load_config()
         self._admin_username: Optional[str] = None
         self._admin_password: Optional[str] = None
+        # 每次从数据库重新加载运行时配置后递增，依赖配置的缓存可据此判断是否失效
+        self._version = 0
 
     def _load_config(self) -> Dict[str, Any]:
         """Load configuration from setting.toml"""
@@ -25,6 +27,15 @@ class Config:
         """Get raw configuration dictionary"""
         return self._config
 
+    @property
+    def version(self) -> int:
+        """Version of the in-memory runtime configuration snapshot"""
+        return self._version
+
+    def bump_version(self):
+        """Mark the in-memory configuration as changed (called after admin updates)"""
+        self._version += 1
+
     @property
     def admin_username(self) -> str:
         # If admin_username is set from database, use it; otherwise fall back to config file
@@ -68,6 +79,41 @@ class Config:
     def max_poll_attempts(self) -> int:
         return self._config["flow"]["max_poll_attempts"]
 
+    @property
+    def poll_batch_window(self) -> float:
+        """Seconds to gather status checks into one batched upstream call"""
+        return self._config["flow"].get("poll_batch_window", 1.0)
+
+    @property
+    def poll_batch_size(self) -> int:
+        """Max operations per batched status check call"""
+        return self._config["flow"].get("poll_batch_size", 50)
+
+    @property
+    def flow_session_idle_timeout(self) -> float:
+        """Seconds before an idle pooled upstream session is closed"""
+        return self._config["flow"].get("session_idle_timeout", 300.0)
+
+    @property
+    def flow_upload_cache_ttl(self) -> float:
+        """Seconds an uploaded reference image media_id is reused (0 = disabled)"""
+        return self._config["flow"].get("upload_cache_ttl", 3600.0)
+
+    @property
+    def flow_upload_cache_max_entries(self) -> int:
+        """Max (project_id, sha256) -> media_id entries kept in the upload cache"""
+        return self._config["flow"].get("upload_cache_max_entries", 1000)
+
+    @property
+    def flow_upload_concurrency(self) -> int:
+        """Max reference images uploaded in parallel for one request"""
+        return self._config["flow"].get("upload_concurrency", 4)
+
+    @property
+    def flow_session_max_clients(self) -> int:
+        """Max concurrent curl handles per pooled upstream session"""
+        return self._config["flow"].get("session_max_clients", 64)
+
     @property
     def server_host(self) -> str:
         return self._config["server"]["host"]
@@ -156,6 +202,142 @@ class Config:
             self._config["generation"] = {}
         self._config["generation"]["upsample_timeout"] = timeout
 
+    @property
+    def lease_max_age(self) -> int:
+        """Seconds after which an unreleased token concurrency lease is reclaimed"""
+        return self._config.get("generation", {}).get("lease_max_age", 3600)
+
+    # AT refresh scheduler configuration
+    @property
+    def at_refresh_lead_time(self) -> float:
+        """Seconds before AT expiry at which the background scheduler refreshes it"""
+        return self._config.get("token_refresh", {}).get("lead_time", 7200)
+
+    @property
+    def at_refresh_concurrency(self) -> int:
+        """Max number of tokens refreshed in parallel by the background scheduler"""
+        return self._config.get("token_refresh", {}).get("concurrency", 4)
+
+    # Token stats write-behind configuration
+    @property
+    def token_stats_flush_interval(self) -> float:
+        """Seconds between batched token stats flushes"""
+        return self._config.get("token_stats", {}).get("flush_interval_ms", 500) / 1000
+
+    @property
+    def token_stats_flush_max_events(self) -> int:
+        """Flush token stats early once this many events are buffered"""
+        return self._config.get("token_stats", {}).get("flush_max_events", 100)
+
+    @property
+    def error_ban_threshold(self) -> int:
+        """Consecutive errors after which a token is auto-disabled"""
+        return self._config.get("admin", {}).get("error_ban_threshold", 3)
+
+    def set_error_ban_threshold(self, threshold: int):
+        """Set consecutive error auto-disable threshold"""
+        if "admin" not in self._config:
+            self._config["admin"] = {}
+        self._config["admin"]["error_ban_threshold"] = threshold
+
+    # Proxy configuration
+    @property
+    def proxy_enabled(self) -> bool:
+        """Get proxy enabled status"""
+        return self._config.get("proxy", {}).get("proxy_enabled", False)
+
+    @property
+    def proxy_url(self) -> Optional[str]:
+        """Get proxy URL"""
+        return self._config.get("proxy", {}).get("proxy_url") or None
+
+    def set_proxy_config(self, enabled: bool, proxy_url: Optional[str]):
+        """Set proxy enabled status and URL"""
+        if "proxy" not in self._config:
+            self._config["proxy"] = {}
+        self._config["proxy"]["proxy_enabled"] = enabled
+        self._config["proxy"]["proxy_url"] = proxy_url or ""
+
+    @property
+    def admin_stats_cache_ttl(self) -> float:
+        """Seconds the admin /api/stats and /api/tokens responses are cached (0 = no cache)"""
+        return self._config.get("admin", {}).get("stats_cache_ttl", 2.0)
+
+    # Request log queue configuration
+    @property
+    def request_log_queue_size(self) -> int:
+        """Max request logs buffered in memory before the overflow policy applies"""
+        return self._config.get("request_log", {}).get("queue_size", 10000)
+
+    @property
+    def request_log_batch_size(self) -> int:
+        """Max request logs inserted per transaction"""
+        return self._config.get("request_log", {}).get("batch_size", 200)
+
+    @property
+    def request_log_flush_interval(self) -> float:
+        """Seconds between batched request log writes"""
+        return self._config.get("request_log", {}).get("flush_interval_ms", 500) / 1000
+
+    @property
+    def request_log_overflow_policy(self) -> str:
+        """What to do when the request log queue is full: drop_oldest / drop_newest / block"""
+        return self._config.get("request_log", {}).get("overflow_policy", "drop_oldest")
+
+    @property
+    def request_log_retention_days(self) -> int:
+        """Delete request logs older than this many days (0 = keep forever)"""
+        return self._config.get("request_log", {}).get("retention_days", 0)
+
+    @property
+    def request_log_cleanup_interval(self) -> float:
+        """Seconds between request log retention runs"""
+        return self._config.get("request_log", {}).get("cleanup_interval", 3600)
+
+    @property
+    def request_log_cleanup_batch_size(self) -> int:
+        """Max request logs deleted per transaction during retention"""
+        return self._config.get("request_log", {}).get("cleanup_batch_size", 1000)
+
+    @property
+    def request_log_archive_enabled(self) -> bool:
+        """Archive expired request logs to gzip JSONL files before deleting them"""
+        return self._config.get("request_log", {}).get("archive_enabled", False)
+
+    @property
+    def request_log_archive_dir(self) -> str:
+        """Directory for archived request logs"""
+        return self._config.get("request_log", {}).get("archive_dir", "data/log_archive")
+
+    # Load balance configuration
+    def get_load_balance_strategy(self, generation_type: str) -> str:
+        """Get token selection strategy for image/video generation"""
+        return self._config.get("load_balance", {}).get(f"{generation_type}_strategy", "random")
+
+    def set_load_balance_strategy(self, generation_type: str, strategy: str):
+        """Set token selection strategy for image/video generation"""
+        if "load_balance" not in self._config:
+            self._config["load_balance"] = {}
+        self._config["load_balance"][f"{generation_type}_strategy"] = strategy
+
+    # Admission queue configuration
+    @property
+    def queue_image_timeout(self) -> float:
+        """Max seconds an image request waits for a free token slot (0 = fail immediately)"""
+        return self._config.get("queue", {}).get("image_timeout", 60)
+
+    @property
+    def queue_video_timeout(self) -> float:
+        """Max seconds a video request waits for a free token slot (0 = fail immediately)"""
+        return self._config.get("queue", {}).get("video_timeout", 300)
+
+    def get_queue_timeout(self, model: str, generation_type: str) -> float:
+        """Get admission queue deadline for a model, falling back to the per-type default"""
+        model_timeouts = self._config.get("queue", {}).get("model_timeouts", {})
+        if model in model_timeouts:
+            return model_timeouts[model]
+        return self.queue_image_timeout if generation_type == "image" else self.queue_video_timeout
+
     # Cache configuration
     @property
     def cache_enabled(self) -> bool:
@@ -190,6 +372,61 @@ class Config:
             self._config["cache"] = {}
         self._config["cache"]["base_url"] = base_url
 
+    @property
+    def cache_max_download_size(self) -> int:
+        """Max bytes accepted for a single cached download (0 = unlimited)"""
+        return int(self._config.get("cache", {}).get("max_download_size_mb", 2048) * 1024 * 1024)
+
+    @property
+    def media_worker_mode(self) -> str:
+        """Worker pool for base64/hash/transcode work: "thread" or "process" """
+        return self._config.get("media", {}).get("worker_mode", "thread")
+
+    @property
+    def media_worker_count(self) -> int:
+        """Number of media worker threads/processes"""
+        return self._config.get("media", {}).get("worker_count", 2)
+
+    @property
+    def media_worker_inline_threshold(self) -> int:
+        """Payloads smaller than this many bytes are processed inline on the event loop"""
+        return int(self._config.get("media", {}).get("inline_threshold_kb", 64) * 1024)
+
+    @property
+    def media_upload_max_side(self) -> int:
+        """Reference images with a longer side are downscaled before upload (0 = off)"""
+        return self._config.get("media", {}).get("upload_max_side", 4096)
+
+    @property
+    def media_upload_max_bytes(self) -> int:
+        """Reference images larger than this are re-encoded before upload (0 = off)"""
+        return int(self._config.get("media", {}).get("upload_max_size_mb", 8) * 1024 * 1024)
+
+    @property
+    def media_upload_jpeg_quality(self) -> int:
+        """JPEG quality used when re-encoding reference images"""
+        return self._config.get("media", {}).get("upload_jpeg_quality", 90)
+
+    @property
+    def cache_max_size(self) -> int:
+        """Total bytes the tmp cache directory may use before LRU eviction (0 = unlimited)"""
+        return int(self._config.get("cache", {}).get("max_size_mb", 10240) * 1024 * 1024)
+
+    @property
+    def cache_download_retries(self) -> int:
+        """Attempts made with the built-in downloader before falling back"""
+        return self._config.get("cache", {}).get("download_retries", 3)
+
+    @property
+    def cache_system_downloaders(self) -> bool:
+        """Fall back to system wget/curl when the built-in downloader fails"""
+        return self._config.get("cache", {}).get("system_downloaders", True)
+
+    @property
+    def cache_subprocess_concurrency(self) -> int:
+        """Max concurrent wget/curl fallback processes"""
+        return self._config.get("cache", {}).get("subprocess_concurrency", 2)
+
     # Captcha configuration
     @property
     def captcha_method(self) -> str:
@@ -290,6 +527,21 @@ class Config:
             self._config["captcha"] = {}
         self._config["captcha"]["capsolver_base_url"] = base_url
 
+    @property
+    def captcha_api_poll_interval(self) -> float:
+        """Seconds between getTaskResult polls for API captcha services"""
+        return self._config.get("captcha", {}).get("api_poll_interval", 3.0)
+
+    @property
+    def captcha_api_timeout(self) -> float:
+        """Max seconds to wait for one API captcha task"""
+        return self._config.get("captcha", {}).get("api_timeout", 120.0)
+
+    @property
+    def captcha_api_max_concurrent(self) -> int:
+        """Max API captcha tasks solved at the same time"""
+        return self._config.get("captcha", {}).get("api_max_concurrent", 20)
+
 
 # Global config instance
 config = Config()
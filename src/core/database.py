@@ -1,27 +1,133 @@
 """Database storage layer for Flow2API"""
+import asyncio
 import aiosqlite
 import json
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, AsyncIterator, Optional, List, Dict
 from pathlib import Path
-from .models import Token, TokenStats, Task, RequestLog, AdminConfig, ProxyConfig, GenerationConfig, CacheConfig, Project, CaptchaConfig, PluginConfig
+from .models import Token, TokenStats, Task, VideoJob, RequestLog, AdminConfig, ProxyConfig, GenerationConfig, CacheConfig, Project, CaptchaConfig, PluginConfig, LoadBalanceConfig
 
 
 class Database:
-    """SQLite database manager"""
+    """SQLite database manager
 
-    def __init__(self, db_path: str = None):
+    使用持久连接代替每次查询新建连接: 一个专用写连接 (通过锁串行化写事务)
+    和一个小型只读连接池，数据库运行在 WAL 模式下，读操作不会被写操作阻塞。
+    连接在首次使用时打开，应用关闭时调用 close()。
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        read_pool_size: int = 4,
+        cache_size_kb: int = 16384,
+        mmap_size: int = 256 * 1024 * 1024,
+        busy_timeout_ms: int = 5000
+    ):
+        """
+        Args:
+            db_path: 数据库文件路径
+            read_pool_size: 只读连接数量
+            cache_size_kb: 每个连接的页缓存大小 (KB)
+            mmap_size: 内存映射读取的最大字节数
+            busy_timeout_ms: 锁等待超时 (毫秒)
+        """
         if db_path is None:
             # Store database in data directory
             data_dir = Path(__file__).parent.parent.parent / "data"
             data_dir.mkdir(exist_ok=True)
             db_path = str(data_dir / "flow.db")
         self.db_path = db_path
+        self.read_pool_size = read_pool_size
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._readers: asyncio.Queue = asyncio.Queue()
+        self._reader_conns: List[aiosqlite.Connection] = []
+        self._closed = False
 
     def db_exists(self) -> bool:
         """Check if database file exists"""
         return Path(self.db_path).exists()
 
+    # ========== Connection management ==========
+
+    async def _connect(self, readonly: bool) -> aiosqlite.Connection:
+        """打开一个持久连接并应用 PRAGMA 设置"""
+        conn = aiosqlite.connect(self.db_path)
+        # 持久连接的工作线程设为守护线程，未调用 close() 时不阻塞进程退出
+        conn.daemon = True
+        await conn
+        conn.row_factory = aiosqlite.Row
+        await conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if not readonly:
+            await conn.execute("PRAGMA journal_mode = WAL")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        await conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        await conn.execute("PRAGMA temp_store = MEMORY")
+        if readonly:
+            await conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    async def _get_writer(self) -> aiosqlite.Connection:
+        if self._writer is None:
+            async with self._open_lock:
+                if self._writer is None:
+                    if self._closed:
+                        raise RuntimeError("Database is closed")
+                    self._writer = await self._connect(readonly=False)
+        return self._writer
+
+    @asynccontextmanager
+    async def _write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """获取写连接 (独占)，退出时提交，异常时回滚"""
+        conn = await self._get_writer()
+        async with self._write_lock:
+            try:
+                yield conn
+                if conn.in_transaction:
+                    await conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    await conn.rollback()
+                raise
+
+    @asynccontextmanager
+    async def _read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """从只读连接池借出一个连接"""
+        # 写连接负责切换到 WAL 模式，需先于读连接打开
+        await self._get_writer()
+        if self._readers.empty() and len(self._reader_conns) < self.read_pool_size:
+            async with self._open_lock:
+                if self._readers.empty() and len(self._reader_conns) < self.read_pool_size:
+                    conn = await self._connect(readonly=True)
+                    self._reader_conns.append(conn)
+                    self._readers.put_nowait(conn)
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    async def close(self):
+        """关闭所有持久连接 (应用关闭时调用)"""
+        self._closed = True
+        async with self._open_lock:
+            async with self._write_lock:
+                if self._writer is not None:
+                    await self._writer.close()
+                    self._writer = None
+            for conn in self._reader_conns:
+                await conn.close()
+            self._reader_conns = []
+            self._readers = asyncio.Queue()
+
     async def _table_exists(self, db, table_name: str) -> bool:
         """Check if a table exists in the database"""
         cursor = await db.execute(
@@ -176,6 +282,23 @@ class Database:
                 VALUES (1, '', 1)
             """)
 
+        # Ensure load_balance_config has a row
+        cursor = await db.execute("SELECT COUNT(*) FROM load_balance_config")
+        count = await cursor.fetchone()
+        if count[0] == 0:
+            image_strategy = "random"
+            video_strategy = "random"
+
+            if config_dict:
+                load_balance_config = config_dict.get("load_balance", {})
+                image_strategy = load_balance_config.get("image_strategy", "random")
+                video_strategy = load_balance_config.get("video_strategy", "random")
+
+            await db.execute("""
+                INSERT INTO load_balance_config (id, image_strategy, video_strategy)
+                VALUES (1, ?, ?)
+            """, (image_strategy, video_strategy))
+
     async def check_and_migrate_db(self, config_dict: dict = None):
         """Check database integrity and perform migrations if needed
 
@@ -189,7 +312,7 @@ class Database:
                         Used only to initialize missing config rows with default values.
                         Existing config rows will NOT be overwritten.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             print("Checking database integrity and performing migrations...")
 
             # ========== Step 1: Create missing tables ==========
@@ -244,6 +367,19 @@ class Database:
                     )
                 """)
 
+            # Check and create load_balance_config table if missing
+            if not await self._table_exists(db, "load_balance_config"):
+                print("  ✓ Creating missing table: load_balance_config")
+                await db.execute("""
+                    CREATE TABLE load_balance_config (
+                        id INTEGER PRIMARY KEY DEFAULT 1,
+                        image_strategy TEXT DEFAULT 'random',
+                        video_strategy TEXT DEFAULT 'random',
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+
             # ========== Step 2: Add missing columns to existing tables ==========
             # Check and add missing columns to tokens table
             if await self._table_exists(db, "tokens"):
@@ -343,7 +479,7 @@ class Database:
 
     async def init_db(self):
         """Initialize database tables"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             # Tokens table (Flow2API版本)
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS tokens (
@@ -424,6 +560,26 @@ class Database:
                 )
             """)
 
+            # Video jobs table (async video job API)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS video_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT UNIQUE NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    task_id TEXT,
+                    token_id INTEGER,
+                    result_url TEXT,
+                    error_message TEXT,
+                    webhook_url TEXT,
+                    webhook_status TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    completed_at TIMESTAMP
+                )
+            """)
+
             # Request logs table
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS request_logs (
@@ -531,14 +687,33 @@ class Database:
                 )
             """)
 
+            # Load balance config table
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS load_balance_config (
+                    id INTEGER PRIMARY KEY DEFAULT 1,
+                    image_strategy TEXT DEFAULT 'random',
+                    video_strategy TEXT DEFAULT 'random',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
             # Create indexes
             await db.execute("CREATE INDEX IF NOT EXISTS idx_task_id ON tasks(task_id)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_model ON tasks(status, model)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_video_jobs_task_id ON video_jobs(task_id)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_token_st ON tokens(st)")
             await db.execute("CREATE INDEX IF NOT EXISTS idx_project_id ON projects(project_id)")
 
             # Migrate request_logs table if needed
             await self._migrate_request_logs(db)
 
+            # request_logs indexes (created after migration, which may recreate the table)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_request_logs_created_at ON request_logs(created_at, id)")
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_request_logs_token_created ON request_logs(token_id, created_at, id)"
+            )
+
             await db.commit()
 
     async def _migrate_request_logs(self, db):
@@ -598,7 +773,7 @@ class Database:
     # Token operations
     async def add_token(self, token: Token) -> int:
         """Add a new token"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("""
                 INSERT INTO tokens (st, at, at_expires, email, name, remark, is_active,
                                    credits, user_paygate_tier, current_project_id, current_project_name,
@@ -622,8 +797,7 @@ class Database:
 
     async def get_token(self, token_id: int) -> Optional[Token]:
         """Get token by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens WHERE id = ?", (token_id,))
             row = await cursor.fetchone()
             if row:
@@ -632,8 +806,7 @@ class Database:
 
     async def get_token_by_st(self, st: str) -> Optional[Token]:
         """Get token by ST"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens WHERE st = ?", (st,))
             row = await cursor.fetchone()
             if row:
@@ -642,8 +815,7 @@ class Database:
 
     async def get_token_by_email(self, email: str) -> Optional[Token]:
         """Get token by email"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens WHERE email = ?", (email,))
             row = await cursor.fetchone()
             if row:
@@ -652,23 +824,21 @@ class Database:
 
     async def get_all_tokens(self) -> List[Token]:
         """Get all tokens"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens ORDER BY created_at DESC")
             rows = await cursor.fetchall()
             return [Token(**dict(row)) for row in rows]
 
     async def get_active_tokens(self) -> List[Token]:
         """Get all active tokens"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tokens WHERE is_active = 1 ORDER BY last_used_at ASC")
             rows = await cursor.fetchall()
             return [Token(**dict(row)) for row in rows]
 
     async def update_token(self, token_id: int, **kwargs):
         """Update token fields"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             updates = []
             params = []
 
@@ -685,7 +855,7 @@ class Database:
 
     async def delete_token(self, token_id: int):
         """Delete token and related data"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM token_stats WHERE token_id = ?", (token_id,))
             await db.execute("DELETE FROM projects WHERE token_id = ?", (token_id,))
             await db.execute("DELETE FROM tokens WHERE id = ?", (token_id,))
@@ -694,7 +864,7 @@ class Database:
     # Project operations
     async def add_project(self, project: Project) -> int:
         """Add a new project"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("""
                 INSERT INTO projects (project_id, token_id, project_name, tool_name, is_active)
                 VALUES (?, ?, ?, ?, ?)
@@ -705,8 +875,7 @@ class Database:
 
     async def get_project_by_id(self, project_id: str) -> Optional[Project]:
         """Get project by UUID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM projects WHERE project_id = ?", (project_id,))
             row = await cursor.fetchone()
             if row:
@@ -715,8 +884,7 @@ class Database:
 
     async def get_projects_by_token(self, token_id: int) -> List[Project]:
         """Get all projects for a token"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute(
                 "SELECT * FROM projects WHERE token_id = ? ORDER BY created_at DESC",
                 (token_id,)
@@ -726,14 +894,14 @@ class Database:
 
     async def delete_project(self, project_id: str):
         """Delete project"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM projects WHERE project_id = ?", (project_id,))
             await db.commit()
 
     # Task operations
     async def create_task(self, task: Task) -> int:
         """Create a new task"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("""
                 INSERT INTO tasks (task_id, token_id, model, prompt, status, progress, scene_id)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -744,8 +912,7 @@ class Database:
 
     async def get_task(self, task_id: str) -> Optional[Task]:
         """Get task by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,))
             row = await cursor.fetchone()
             if row:
@@ -758,7 +925,7 @@ class Database:
 
     async def update_task(self, task_id: str, **kwargs):
         """Update task"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             updates = []
             params = []
 
@@ -776,6 +943,99 @@ class Database:
                 await db.execute(query, params)
                 await db.commit()
 
+    async def get_processing_tasks(self) -> List[Task]:
+        """Get all tasks still in processing status (used to resume polling on startup)"""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT * FROM tasks WHERE status = 'processing' ORDER BY id")
+            rows = await cursor.fetchall()
+            tasks = []
+            for row in rows:
+                task_dict = dict(row)
+                if task_dict.get("result_urls"):
+                    task_dict["result_urls"] = json.loads(task_dict["result_urls"])
+                tasks.append(Task(**task_dict))
+            return tasks
+
+    # Video job operations
+    async def create_video_job(self, job: VideoJob) -> int:
+        """Create a new video job"""
+        async with self._write() as db:
+            cursor = await db.execute("""
+                INSERT INTO video_jobs (job_id, model, prompt, status, webhook_url)
+                VALUES (?, ?, ?, ?, ?)
+            """, (job.job_id, job.model, job.prompt, job.status, job.webhook_url))
+            await db.commit()
+            return cursor.lastrowid
+
+    async def get_video_job(self, job_id: str) -> Optional[VideoJob]:
+        """Get video job by job ID"""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT * FROM video_jobs WHERE job_id = ?", (job_id,))
+            row = await cursor.fetchone()
+            if row:
+                return VideoJob(**dict(row))
+            return None
+
+    async def get_video_job_by_task(self, task_id: str) -> Optional[VideoJob]:
+        """Get video job by its current upstream task ID"""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT * FROM video_jobs WHERE task_id = ?", (task_id,))
+            row = await cursor.fetchone()
+            if row:
+                return VideoJob(**dict(row))
+            return None
+
+    async def get_queued_video_jobs(self) -> List[VideoJob]:
+        """Get jobs that never got an upstream task (submission was interrupted)"""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT * FROM video_jobs WHERE status = 'queued'")
+            rows = await cursor.fetchall()
+            return [VideoJob(**dict(row)) for row in rows]
+
+    async def update_video_job(self, job_id: str, **kwargs):
+        """Update video job"""
+        async with self._write() as db:
+            updates = []
+            params = []
+
+            for key, value in kwargs.items():
+                if value is not None:
+                    updates.append(f"{key} = ?")
+                    params.append(value)
+
+            if updates:
+                updates.append("updated_at = CURRENT_TIMESTAMP")
+                params.append(job_id)
+                query = f"UPDATE video_jobs SET {', '.join(updates)} WHERE job_id = ?"
+                await db.execute(query, params)
+                await db.commit()
+
+    async def get_task_durations(self, per_model_limit: int = 200) -> Dict[str, List[float]]:
+        """Get recent completion durations (seconds) of completed tasks, grouped by model
+
+        created_at is stored as a UTC timestamp string while completed_at is a unix
+        timestamp, so the duration is computed in SQL from both representations.
+        """
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT model, duration FROM (
+                    SELECT model,
+                           completed_at - CAST(strftime('%s', created_at) AS REAL) AS duration,
+                           ROW_NUMBER() OVER (PARTITION BY model ORDER BY id DESC) AS rn
+                    FROM tasks
+                    WHERE status = 'completed'
+                      AND completed_at IS NOT NULL
+                      AND typeof(completed_at) IN ('real', 'integer')
+                )
+                WHERE rn <= ? AND duration > 0
+            """, (per_model_limit,))
+            rows = await cursor.fetchall()
+
+        durations: Dict[str, List[float]] = {}
+        for model, duration in rows:
+            durations.setdefault(model, []).append(float(duration))
+        return durations
+
     # Token stats operations (kept for compatibility, now delegates to specific methods)
     async def increment_token_stats(self, token_id: int, stat_type: str):
         """Increment token statistics (delegates to specific methods)"""
@@ -788,18 +1048,38 @@ class Database:
 
     async def get_token_stats(self, token_id: int) -> Optional[TokenStats]:
         """Get token statistics"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM token_stats WHERE token_id = ?", (token_id,))
             row = await cursor.fetchone()
             if row:
                 return TokenStats(**dict(row))
             return None
 
+    async def get_all_token_stats(self) -> Dict[int, TokenStats]:
+        """Get statistics of all tokens in one query (token_id -> TokenStats)
+
+        Today's counters are reported as 0 when today_date is not the current local date.
+        """
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT
+                    token_id, image_count, video_count, success_count, error_count,
+                    last_success_at, last_error_at, today_date, consecutive_error_count,
+                    CASE WHEN today_date = date('now', 'localtime') THEN today_image_count ELSE 0 END
+                        AS today_image_count,
+                    CASE WHEN today_date = date('now', 'localtime') THEN today_video_count ELSE 0 END
+                        AS today_video_count,
+                    CASE WHEN today_date = date('now', 'localtime') THEN today_error_count ELSE 0 END
+                        AS today_error_count
+                FROM token_stats
+            """)
+            rows = await cursor.fetchall()
+            return {row["token_id"]: TokenStats(**dict(row)) for row in rows}
+
     async def increment_image_count(self, token_id: int):
         """Increment image generation count with daily reset"""
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -828,7 +1108,7 @@ class Database:
     async def increment_video_count(self, token_id: int):
         """Increment video generation count with daily reset"""
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -863,7 +1143,7 @@ class Database:
         - today_error_count: Today's errors (reset on date change)
         """
         from datetime import date
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             today = str(date.today())
             # Get current stats
             cursor = await db.execute("SELECT today_date FROM token_stats WHERE token_id = ?", (token_id,))
@@ -902,17 +1182,70 @@ class Database:
 
         Note: error_count (total historical errors) is NEVER reset
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE token_stats SET consecutive_error_count = 0 WHERE token_id = ?
             """, (token_id,))
             await db.commit()
 
+    async def get_consecutive_error_counts(self) -> Dict[int, int]:
+        """Get consecutive error count of every token (token_id -> count)"""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT token_id, consecutive_error_count FROM token_stats")
+            rows = await cursor.fetchall()
+            return {row["token_id"]: row["consecutive_error_count"] or 0 for row in rows}
+
+    async def apply_token_stats_deltas(self, deltas: Dict[int, Any]):
+        """Apply buffered per-token stats deltas in a single transaction
+
+        Args:
+            deltas: token_id -> StatsDelta (image/video/error counts, consecutive errors,
+                use_count and timestamps)
+
+        The daily counters are reset in SQL when today_date differs from the local date.
+        """
+        stats_rows = []
+        usage_rows = []
+        for token_id, d in deltas.items():
+            stats_rows.append({
+                "token_id": token_id,
+                "image": d.image,
+                "video": d.video,
+                "error": d.error,
+                "consecutive": d.consecutive,
+                "reset": 1 if d.reset_consecutive else 0,
+                "last_error_at": d.last_error_at
+            })
+            if d.use_count:
+                usage_rows.append((d.use_count, d.last_used_at, token_id))
+
+        async with self._write() as db:
+            await db.executemany("""
+                UPDATE token_stats
+                SET image_count = image_count + :image,
+                    video_count = video_count + :video,
+                    error_count = error_count + :error,
+                    today_image_count = CASE WHEN today_date = date('now', 'localtime')
+                        THEN today_image_count ELSE 0 END + :image,
+                    today_video_count = CASE WHEN today_date = date('now', 'localtime')
+                        THEN today_video_count ELSE 0 END + :video,
+                    today_error_count = CASE WHEN today_date = date('now', 'localtime')
+                        THEN today_error_count ELSE 0 END + :error,
+                    consecutive_error_count = CASE WHEN :reset
+                        THEN 0 ELSE consecutive_error_count END + :consecutive,
+                    last_error_at = COALESCE(:last_error_at, last_error_at),
+                    today_date = date('now', 'localtime')
+                WHERE token_id = :token_id
+            """, stats_rows)
+            if usage_rows:
+                await db.executemany("""
+                    UPDATE tokens SET use_count = use_count + ?, last_used_at = ? WHERE id = ?
+                """, usage_rows)
+
     # Config operations
     async def get_admin_config(self) -> Optional[AdminConfig]:
         """Get admin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM admin_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -921,7 +1254,7 @@ class Database:
 
     async def update_admin_config(self, **kwargs):
         """Update admin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             updates = []
             params = []
 
@@ -938,8 +1271,7 @@ class Database:
 
     async def get_proxy_config(self) -> Optional[ProxyConfig]:
         """Get proxy configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM proxy_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -948,7 +1280,7 @@ class Database:
 
     async def update_proxy_config(self, enabled: bool, proxy_url: Optional[str] = None):
         """Update proxy configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE proxy_config
                 SET enabled = ?, proxy_url = ?, updated_at = CURRENT_TIMESTAMP
@@ -958,8 +1290,7 @@ class Database:
 
     async def get_generation_config(self) -> Optional[GenerationConfig]:
         """Get generation configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM generation_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -968,7 +1299,7 @@ class Database:
 
     async def update_generation_config(self, image_timeout: int, video_timeout: int):
         """Update generation configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE generation_config
                 SET image_timeout = ?, video_timeout = ?, updated_at = CURRENT_TIMESTAMP
@@ -976,10 +1307,29 @@ class Database:
             """, (image_timeout, video_timeout))
             await db.commit()
 
+    async def get_load_balance_config(self) -> LoadBalanceConfig:
+        """Get token selection strategy configuration"""
+        async with self._read() as db:
+            cursor = await db.execute("SELECT * FROM load_balance_config WHERE id = 1")
+            row = await cursor.fetchone()
+            if row:
+                return LoadBalanceConfig(**dict(row))
+            return LoadBalanceConfig()
+
+    async def update_load_balance_config(self, image_strategy: str, video_strategy: str):
+        """Update token selection strategy configuration"""
+        async with self._write() as db:
+            await db.execute("""
+                UPDATE load_balance_config
+                SET image_strategy = ?, video_strategy = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = 1
+            """, (image_strategy, video_strategy))
+            await db.commit()
+
     # Request log operations
     async def add_request_log(self, log: RequestLog):
         """Add request log"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 INSERT INTO request_logs (token_id, operation, request_body, response_body, status_code, duration)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -987,58 +1337,151 @@ class Database:
                   log.status_code, log.duration))
             await db.commit()
 
+    async def add_request_logs(self, logs: List[RequestLog]):
+        """Add a batch of request logs in a single transaction"""
+        async with self._write() as db:
+            await db.executemany("""
+                INSERT INTO request_logs (token_id, operation, request_body, response_body, status_code, duration)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(log.token_id, log.operation, log.request_body, log.response_body,
+                   log.status_code, log.duration) for log in logs])
+
     async def get_logs(self, limit: int = 100, token_id: Optional[int] = None):
         """Get request logs with token email"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        return await self.query_logs(limit=limit, token_id=token_id)
 
-            if token_id:
-                cursor = await db.execute("""
-                    SELECT
-                        rl.id,
-                        rl.token_id,
-                        rl.operation,
-                        rl.request_body,
-                        rl.response_body,
-                        rl.status_code,
-                        rl.duration,
-                        rl.created_at,
-                        t.email as token_email,
-                        t.name as token_username
-                    FROM request_logs rl
-                    LEFT JOIN tokens t ON rl.token_id = t.id
-                    WHERE rl.token_id = ?
-                    ORDER BY rl.created_at DESC
-                    LIMIT ?
-                """, (token_id, limit))
-            else:
-                cursor = await db.execute("""
-                    SELECT
-                        rl.id,
-                        rl.token_id,
-                        rl.operation,
-                        rl.request_body,
-                        rl.response_body,
-                        rl.status_code,
-                        rl.duration,
-                        rl.created_at,
-                        t.email as token_email,
-                        t.name as token_username
-                    FROM request_logs rl
-                    LEFT JOIN tokens t ON rl.token_id = t.id
-                    ORDER BY rl.created_at DESC
-                    LIMIT ?
-                """, (limit,))
+    async def query_logs(
+        self,
+        limit: int = 100,
+        before: Optional[tuple] = None,
+        token_id: Optional[int] = None,
+        operation: Optional[str] = None,
+        status_code: Optional[int] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        include_bodies: bool = True
+    ) -> List[dict]:
+        """Get request logs newest first using keyset pagination on (created_at, id)
 
+        Args:
+            limit: Max rows to return
+            before: (created_at, id) of the last row of the previous page
+            token_id: Only logs of this token
+            operation: Only logs of this operation
+            status_code: Only logs with this status code
+            start_time: Only logs created at or after this UTC time ("YYYY-MM-DD HH:MM:SS")
+            end_time: Only logs created before this UTC time ("YYYY-MM-DD HH:MM:SS")
+            include_bodies: Whether to return request_body/response_body
+
+        Returns:
+            List of log dicts with token_email and token_username
+        """
+        conditions = []
+        params: List[Any] = []
+        if before is not None:
+            conditions.append("(rl.created_at, rl.id) < (?, ?)")
+            params.extend(before)
+        if token_id is not None:
+            conditions.append("rl.token_id = ?")
+            params.append(token_id)
+        if operation:
+            conditions.append("rl.operation = ?")
+            params.append(operation)
+        if status_code is not None:
+            conditions.append("rl.status_code = ?")
+            params.append(status_code)
+        if start_time:
+            conditions.append("rl.created_at >= ?")
+            params.append(start_time)
+        if end_time:
+            conditions.append("rl.created_at < ?")
+            params.append(end_time)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        bodies = "rl.request_body, rl.response_body," if include_bodies else ""
+        params.append(limit)
+
+        async with self._read() as db:
+            cursor = await db.execute(f"""
+                SELECT
+                    rl.id,
+                    rl.token_id,
+                    rl.operation,
+                    {bodies}
+                    rl.status_code,
+                    rl.duration,
+                    rl.created_at,
+                    t.email as token_email,
+                    t.name as token_username
+                FROM request_logs rl
+                LEFT JOIN tokens t ON rl.token_id = t.id
+                {where}
+                ORDER BY rl.created_at DESC, rl.id DESC
+                LIMIT ?
+            """, params)
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
+    async def get_log(self, log_id: int) -> Optional[dict]:
+        """Get a single request log including request/response bodies"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT
+                    rl.*,
+                    t.email as token_email,
+                    t.name as token_username
+                FROM request_logs rl
+                LEFT JOIN tokens t ON rl.token_id = t.id
+                WHERE rl.id = ?
+            """, (log_id,))
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
     async def clear_all_logs(self):
         """Clear all request logs"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("DELETE FROM request_logs")
             await db.commit()
 
+    async def get_expired_request_logs(self, retention_days: int, limit: int) -> List[dict]:
+        """Get the oldest request logs created more than retention_days ago"""
+        async with self._read() as db:
+            cursor = await db.execute("""
+                SELECT id, token_id, operation, request_body, response_body, status_code, duration, created_at
+                FROM request_logs
+                WHERE created_at < datetime('now', ?)
+                ORDER BY created_at, id
+                LIMIT ?
+            """, (f"-{retention_days} days", limit))
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def delete_request_logs(self, log_ids: List[int]) -> int:
+        """Delete request logs by id"""
+        if not log_ids:
+            return 0
+        placeholders = ",".join("?" * len(log_ids))
+        async with self._write() as db:
+            cursor = await db.execute(f"DELETE FROM request_logs WHERE id IN ({placeholders})", log_ids)
+            return cursor.rowcount
+
+    async def delete_expired_request_logs(self, retention_days: int, limit: int) -> int:
+        """Delete at most limit of the oldest request logs created more than retention_days ago
+
+        Returns:
+            Number of deleted rows
+        """
+        async with self._write() as db:
+            cursor = await db.execute("""
+                DELETE FROM request_logs WHERE id IN (
+                    SELECT id FROM request_logs
+                    WHERE created_at < datetime('now', ?)
+                    ORDER BY created_at, id
+                    LIMIT ?
+                )
+            """, (f"-{retention_days} days", limit))
+            return cursor.rowcount
+
     async def init_config_from_toml(self, config_dict: dict, is_first_startup: bool = True):
         """
         Initialize database configuration from setting.toml
@@ -1048,7 +1491,7 @@ class Database:
             is_first_startup: If True, initialize all config rows from setting.toml.
                             If False (upgrade mode), only ensure missing config rows exist with default values.
         """
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             if is_first_startup:
                 # First startup: Initialize all config tables with values from setting.toml
                 await self._ensure_config_rows(db, config_dict)
@@ -1067,7 +1510,7 @@ class Database:
         - Admin config (username, password, api_key)
         - Cache config (enabled, timeout, base_url)
         - Generation config (image_timeout, video_timeout)
-        - Proxy config will be handled by ProxyManager
+        - Proxy config (enabled, proxy_url)
         """
         from .config import config
 
@@ -1077,6 +1520,12 @@ class Database:
             config.set_admin_username_from_db(admin_config.username)
             config.set_admin_password_from_db(admin_config.password)
             config.api_key = admin_config.api_key
+            config.set_error_ban_threshold(admin_config.error_ban_threshold)
+
+        # Reload proxy config
+        proxy_config = await self.get_proxy_config()
+        if proxy_config:
+            config.set_proxy_config(proxy_config.enabled, proxy_config.proxy_url)
 
         # Reload cache config
         cache_config = await self.get_cache_config()
@@ -1091,6 +1540,11 @@ class Database:
             config.set_image_timeout(generation_config.image_timeout)
             config.set_video_timeout(generation_config.video_timeout)
 
+        # Reload load balance config
+        load_balance_config = await self.get_load_balance_config()
+        config.set_load_balance_strategy("image", load_balance_config.image_strategy)
+        config.set_load_balance_strategy("video", load_balance_config.video_strategy)
+
         # Reload debug config
         debug_config = await self.get_debug_config()
         if debug_config:
@@ -1109,11 +1563,12 @@ class Database:
             config.set_capsolver_api_key(captcha_config.capsolver_api_key)
             config.set_capsolver_base_url(captcha_config.capsolver_base_url)
 
+        config.bump_version()
+
     # Cache config operations
     async def get_cache_config(self) -> CacheConfig:
         """Get cache configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM cache_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -1123,8 +1578,7 @@ class Database:
 
     async def update_cache_config(self, enabled: bool = None, timeout: int = None, base_url: Optional[str] = None):
         """Update cache configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._write() as db:
             # Get current values
             cursor = await db.execute("SELECT * FROM cache_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1162,8 +1616,7 @@ class Database:
     async def get_debug_config(self) -> 'DebugConfig':
         """Get debug configuration"""
         from .models import DebugConfig
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM debug_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -1179,8 +1632,7 @@ class Database:
         mask_token: bool = None
     ):
         """Update debug configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._write() as db:
             # Get current values
             cursor = await db.execute("SELECT * FROM debug_config WHERE id = 1")
             row = await cursor.fetchone()
@@ -1215,8 +1667,7 @@ class Database:
     # Captcha config operations
     async def get_captcha_config(self) -> CaptchaConfig:
         """Get captcha configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM captcha_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -1239,8 +1690,7 @@ class Database:
         browser_count: int = None
     ):
         """Update captcha configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._write() as db:
             cursor = await db.execute("SELECT * FROM captcha_config WHERE id = 1")
             row = await cursor.fetchone()
 
@@ -1296,8 +1746,7 @@ class Database:
     # Plugin config operations
     async def get_plugin_config(self) -> PluginConfig:
         """Get plugin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             cursor = await db.execute("SELECT * FROM plugin_config WHERE id = 1")
             row = await cursor.fetchone()
             if row:
@@ -1306,8 +1755,7 @@ class Database:
 
     async def update_plugin_config(self, connection_token: str, auto_enable_on_update: bool = True):
         """Update plugin configuration"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._write() as db:
             cursor = await db.execute("SELECT * FROM plugin_config WHERE id = 1")
             row = await cursor.fetchone()
 
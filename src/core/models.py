@@ -88,6 +88,24 @@ class Task(BaseModel):
     completed_at: Optional[datetime] = None
 
 
+class VideoJob(BaseModel):
+    """Async video generation job"""
+    id: Optional[int] = None
+    job_id: str
+    model: str
+    prompt: str
+    status: str = "queued"  # queued, processing, completed, failed
+    task_id: Optional[str] = None  # 当前对应的 Flow API operation name
+    token_id: Optional[int] = None
+    result_url: Optional[str] = None
+    error_message: Optional[str] = None
+    webhook_url: Optional[str] = None
+    webhook_status: Optional[str] = None  # delivered, failed
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+
 class RequestLog(BaseModel):
     """API request log"""
     id: Optional[int] = None
@@ -123,6 +141,15 @@ class GenerationConfig(BaseModel):
     video_timeout: int = 1500  # seconds
 
 
+class LoadBalanceConfig(BaseModel):
+    """Token selection strategy configuration"""
+    id: int = 1
+    image_strategy: str = "random"  # random, least_outstanding, power_of_two, ewma_latency, credits_weighted
+    video_strategy: str = "random"
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 class CacheConfig(BaseModel):
     """Cache configuration"""
     id: int = 1
@@ -191,3 +218,11 @@ class ChatCompletionRequest(BaseModel):
     # Flow2API specific parameters
     image: Optional[str] = None  # Base64 encoded image (deprecated, use messages)
     video: Optional[str] = None  # Base64 encoded video (deprecated)
+
+
+class VideoGenerationRequest(BaseModel):
+    """Async video job request"""
+    model: str
+    prompt: str
+    images: Optional[List[str]] = None  # data:image/...;base64 或 http(s) 图片地址
+    webhook_url: Optional[str] = None  # 任务结束后回调的地址
@@ -15,6 +15,8 @@ from .services.token_manager import TokenManager
 from .services.load_balancer import LoadBalancer
 from .services.concurrency_manager import ConcurrencyManager
 from .services.generation_handler import GenerationHandler
+from .services.video_job_manager import VideoJobManager
+from .services.media_worker import media_workers
 from .api import routes, admin
 import webbrowser
 import sqlite3
@@ -145,12 +147,21 @@ async def lifespan(app: FastAPI):
         await db.check_and_migrate_db(config_dict)
         print("✓ Database migration check completed.")
 
+    # Load all tokens into the in-memory registry
+    await token_manager.load()
+
     # Load admin config from database
     admin_config = await db.get_admin_config()
     if admin_config:
         config.set_admin_username_from_db(admin_config.username)
         config.set_admin_password_from_db(admin_config.password)
         config.api_key = admin_config.api_key
+        config.set_error_ban_threshold(admin_config.error_ban_threshold)
+
+    # Load proxy configuration from database
+    proxy_config = await db.get_proxy_config()
+    if proxy_config:
+        config.set_proxy_config(proxy_config.enabled, proxy_config.proxy_url)
 
     # Load cache configuration from database
     cache_config = await db.get_cache_config()
@@ -163,6 +174,11 @@ async def lifespan(app: FastAPI):
     config.set_image_timeout(generation_config.image_timeout)
     config.set_video_timeout(generation_config.video_timeout)
 
+    # Load token selection strategies from database
+    load_balance_config = await db.get_load_balance_config()
+    config.set_load_balance_strategy("image", load_balance_config.image_strategy)
+    config.set_load_balance_strategy("video", load_balance_config.video_strategy)
+
     # Load debug configuration from database
     debug_config = await db.get_debug_config()
     config.set_debug_enabled(debug_config.enabled)
@@ -212,10 +228,26 @@ async def lifespan(app: FastAPI):
     tokens = await token_manager.get_all_tokens()
 
     await concurrency_manager.initialize(tokens)
+    await concurrency_manager.start()
+
+    # Start proactive AT refresh scheduler and token stats flusher
+    await token_manager.refresh_scheduler.start()
+    await token_manager.stats_buffer.start()
 
     # Start file cache cleanup task
     await generation_handler.file_cache.start_cleanup_task()
 
+    # Start batched request log writer and log retention cleanup
+    await generation_handler.request_log_queue.start()
+    await generation_handler.log_retention.start()
+
+    # Start batched video status poller and adaptive poll scheduler
+    await generation_handler.video_poller.start()
+    await generation_handler.poll_scheduler.start()
+
+    # Resume video tasks left in processing state by the previous run
+    await video_job_manager.resume_pending()
+
     # Start 429 auto-unban task
     async def auto_unban_task():
         """定时任务：每小时检查并解禁429被禁用的token"""
@@ -233,6 +265,8 @@ async def lifespan(app: FastAPI):
     print(f"✓ Total tokens: {len(tokens)}")
     print(f"✓ Cache: {'Enabled' if config.cache_enabled else 'Disabled'} (timeout: {config.cache_timeout}s)")
     print(f"✓ File cache cleanup task started")
+    print(f"✓ Batched video status poller started")
+    print(f"✓ AT refresh scheduler started (lead time: {config.at_refresh_lead_time}s)")
     print(f"✓ 429 auto-unban task started (runs every hour)")
     print(f"✓ Server running on http://{config.server_host}:{config.server_port}")
     print("=" * 60)
@@ -248,6 +282,14 @@ async def lifespan(app: FastAPI):
         pass
     # Stop file cache cleanup task
     await generation_handler.file_cache.stop_cleanup_task()
+    # Cancel background video jobs (unfinished tasks resume on next startup)
+    await video_job_manager.shutdown()
+    # Stop batched video status poller and adaptive poll scheduler
+    await generation_handler.video_poller.stop()
+    await generation_handler.poll_scheduler.stop()
+    # Stop lease reclaim task and AT refresh scheduler
+    await concurrency_manager.stop()
+    await token_manager.refresh_scheduler.stop()
     # Stop auto-unban task
     restart_task_handle.cancel()
     auto_unban_task_handle.cancel()
@@ -255,12 +297,27 @@ async def lifespan(app: FastAPI):
         await auto_unban_task_handle
     except asyncio.CancelledError:
         pass
+    # Close pooled upstream sessions
+    await flow_client.close()
+    print("✓ Upstream session pool closed")
+    # Shut down media worker pool
+    media_workers.shutdown()
+    print("✓ Media worker pool stopped")
     # Close browser if initialized
     if browser_service:
         await browser_service.close()
         print("✓ Browser captcha service closed")
     print("✓ File cache cleanup task stopped")
     print("✓ 429 auto-unban task stopped")
+    # Drain queued request logs and flush buffered token stats before closing the database
+    await generation_handler.log_retention.stop()
+    await generation_handler.request_log_queue.stop()
+    print("✓ Request log queue drained")
+    await token_manager.stats_buffer.stop()
+    print("✓ Token stats flushed")
+    # Close persistent database connections
+    await db.close()
+    print("✓ Database connections closed")
 
 
 # Initialize components
@@ -278,10 +335,12 @@ generation_handler = GenerationHandler(
     concurrency_manager,
     proxy_manager  # 添加 proxy_manager 参数
 )
+video_job_manager = VideoJobManager(generation_handler, token_manager, db)
 
 # Set dependencies
 routes.set_generation_handler(generation_handler)
-admin.set_dependencies(token_manager, proxy_manager, db)
+routes.set_video_job_manager(video_job_manager)
+admin.set_dependencies(token_manager, proxy_manager, db, generation_handler)
 
 # Create FastAPI app
 app = FastAPI(
@@ -0,0 +1,202 @@
+"""Proactive background AT refresh scheduler"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from datetime import timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+class ATRefreshScheduler:
+    """后台 AT 刷新调度器
+
+    以 at_expires 为键维护最小堆，在 AT 过期前提前刷新 (带随机抖动，避免大量
+    Token 同时刷新)，并通过信号量限制并行刷新数量。请求路径上只有 AT 缺失
+    或即将失效时才会同步刷新。
+    """
+
+    def __init__(
+        self,
+        token_manager,
+        lead_time: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        jitter_ratio: float = 0.1,
+        retry_delay: float = 300.0,
+        min_delay: float = 5.0
+    ):
+        """
+        Args:
+            token_manager: TokenManager instance
+            lead_time: 在过期前多少秒刷新
+            max_concurrency: 最多同时刷新的 Token 数量
+            jitter_ratio: 随机抖动占提前量的比例
+            retry_delay: 刷新失败后重试的间隔(秒)
+            min_delay: 两次刷新之间的最小间隔(秒)，防止刷新后仍已过期的 Token 反复刷新
+        """
+        self.token_manager = token_manager
+        self.lead_time = lead_time if lead_time is not None else config.at_refresh_lead_time
+        self.max_concurrency = max_concurrency if max_concurrency is not None else config.at_refresh_concurrency
+        self.jitter_ratio = jitter_ratio
+        self.retry_delay = retry_delay
+        self.min_delay = min_delay
+        # (due_time, seq, token_id)，过期条目通过 _due 惰性删除
+        self._heap: List[Tuple[float, int, int]] = []
+        self._due: Dict[int, float] = {}
+        self._seq = itertools.count()
+        self._running: Set[int] = set()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self._stats = {
+            "refreshed": 0,  # 成功刷新次数
+            "failed": 0,     # 刷新失败次数
+            "requested": 0   # 请求路径触发的提前刷新次数
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        """Schedule all loaded tokens and start background refresh task"""
+        for token in await self.token_manager.get_all_tokens():
+            self.schedule(token)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_loop())
+
+    async def stop(self):
+        """Stop background refresh task and in-flight refreshes"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        tasks = list(self._refresh_tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _next_due(self, token) -> float:
+        """计算下一次刷新时间"""
+        now = time.time()
+        earliest = now + self.min_delay
+        if not token.at or not token.at_expires:
+            return earliest
+
+        at_expires = token.at_expires
+        if at_expires.tzinfo is None:
+            at_expires = at_expires.replace(tzinfo=timezone.utc)
+        remaining = at_expires.timestamp() - now
+
+        # 有效期短于提前量时在剩余时间过半时刷新，避免刷新后立即再次到期
+        lead = self.lead_time if remaining >= self.lead_time else max(remaining, 0) / 2
+        jitter = random.uniform(0, lead * self.jitter_ratio)
+        return max(earliest, at_expires.timestamp() - lead - jitter)
+
+    def schedule(self, token, due: Optional[float] = None):
+        """登记或更新 Token 的刷新时间 (禁用的 Token 不刷新)"""
+        if not token.is_active:
+            self.unschedule(token.id)
+            return
+
+        due = due if due is not None else self._next_due(token)
+        self._due[token.id] = due
+        heapq.heappush(self._heap, (due, next(self._seq), token.id))
+        self._wakeup.set()
+
+    def unschedule(self, token_id: int):
+        """取消 Token 的刷新计划"""
+        self._due.pop(token_id, None)
+
+    def request_refresh(self, token_id: int):
+        """请求尽快在后台刷新 (由请求路径在 AT 即将过期时调用)"""
+        if token_id in self._running:
+            return
+        if self._due.get(token_id, float("inf")) <= time.time():
+            return
+        self._stats["requested"] += 1
+        self._due[token_id] = time.time()
+        heapq.heappush(self._heap, (self._due[token_id], next(self._seq), token_id))
+        self._wakeup.set()
+
+    async def _run_loop(self):
+        """Background task: pop due tokens and refresh them"""
+        while True:
+            try:
+                self._wakeup.clear()
+                now = time.time()
+
+                while self._heap and self._heap[0][0] <= now:
+                    due, _, token_id = heapq.heappop(self._heap)
+                    if self._due.get(token_id) != due or token_id in self._running:
+                        continue
+                    del self._due[token_id]
+                    self._running.add(token_id)
+                    task = asyncio.create_task(self._refresh(token_id))
+                    self._refresh_tasks.add(task)
+                    task.add_done_callback(self._refresh_tasks.discard)
+
+                timeout = self._heap[0][0] - now if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(
+                    error_message=f"AT refresh scheduler error: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+                await asyncio.sleep(1)
+
+    async def _refresh(self, token_id: int):
+        """刷新单个 Token 并安排下一次刷新"""
+        try:
+            async with self._semaphore:
+                token = await self.token_manager.get_token(token_id)
+                if not token or not token.is_active:
+                    return
+
+                debug_logger.log_info(f"[AT_SCHEDULER] Token {token_id}: 后台刷新AT")
+                success = await self.token_manager.refresh_at(token_id)
+                self._stats["refreshed" if success else "failed"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            success = False
+            self._stats["failed"] += 1
+            debug_logger.log_warning(f"[AT_SCHEDULER] Token {token_id}: 后台刷新异常 - {str(e)}")
+        finally:
+            self._running.discard(token_id)
+
+        token = await self.token_manager.get_token(token_id)
+        if not token:
+            return
+        if success:
+            self.schedule(token)
+        elif token.is_active:
+            # 刷新失败但 Token 未被禁用 (如网络问题)，稍后重试
+            self.schedule(token, due=time.time() + self.retry_delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计信息"""
+        now = time.time()
+        next_due = min(self._due.values()) if self._due else None
+        return {
+            "scheduled_tokens": len(self._due),
+            "refreshing": len(self._running),
+            "next_refresh_in": round(max(next_due - now, 0), 1) if next_due is not None else None,
+            "lead_time": self.lead_time,
+            "max_concurrency": self.max_concurrency,
+            **self._stats
+        }
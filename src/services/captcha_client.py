@@ -0,0 +1,249 @@
+"""Asynchronous client for API captcha services (YesCaptcha / CapMonster / EzCaptcha / CapSolver)"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from curl_cffi.requests import AsyncSession
+from ..core.config import config
+from ..core.logger import debug_logger
+
+# 打码服务 -> reCAPTCHA v3 任务类型
+PROVIDER_TASK_TYPES = {
+    "yescaptcha": "RecaptchaV3TaskProxylessM1",
+    "capmonster": "RecaptchaV3TaskProxyless",
+    "ezcaptcha": "ReCaptchaV3TaskProxylessS9",
+    "capsolver": "ReCaptchaV3EnterpriseTaskProxyLess"
+}
+
+WEBSITE_KEY = "6LdsFiUsAAAAAIjVDZcuLhaHiDn5nnHVXVRQGeMV"
+
+
+class _ProviderMetrics:
+    """单个打码服务的耗时与成功率统计"""
+
+    def __init__(self, window: int = 200):
+        self.requests = 0
+        self.success = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.polls = 0
+        self.last_error: Optional[str] = None
+        # 最近 window 次成功的耗时(秒)
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2)
+
+        finished = self.success + self.failed + self.timeouts
+        return {
+            "requests": self.requests,
+            "success": self.success,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "polls": self.polls,
+            "success_rate": round(self.success / finished, 4) if finished else None,
+            "latency_avg": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "last_error": self.last_error
+        }
+
+
+class CaptchaClient:
+    """API 打码客户端
+
+    所有打码请求共用一个 AsyncSession (keep-alive)，轮询使用 asyncio.sleep，
+    等待结果时不占用事件循环，多个请求可以同时打码 (最多 max_concurrent 个)。
+    """
+
+    def __init__(
+        self,
+        poll_interval: Optional[float] = None,
+        timeout: Optional[float] = None,
+        max_concurrent: Optional[int] = None
+    ):
+        """
+        Args:
+            poll_interval: 查询任务结果的间隔(秒)
+            timeout: 单个打码任务的最长等待时间(秒)
+            max_concurrent: 同时进行的打码任务数上限
+        """
+        self.poll_interval = poll_interval if poll_interval is not None else config.captcha_api_poll_interval
+        self.timeout = timeout if timeout is not None else config.captcha_api_timeout
+        self.max_concurrent = max_concurrent if max_concurrent is not None else config.captcha_api_max_concurrent
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._session: Optional[AsyncSession] = None
+        self._metrics: Dict[str, _ProviderMetrics] = {}
+        self._waiting = 0
+
+    def _get_session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = AsyncSession(max_clients=self.max_concurrent, impersonate="chrome110")
+        return self._session
+
+    async def close(self):
+        """关闭共享会话 (应用关闭时调用)"""
+        if self._session is not None:
+            try:
+                await self._session.close()
+            except Exception as e:
+                debug_logger.log_warning(f"[reCAPTCHA] 关闭打码会话失败: {str(e)}")
+            self._session = None
+
+    def _provider_metrics(self, method: str) -> _ProviderMetrics:
+        metrics = self._metrics.get(method)
+        if metrics is None:
+            metrics = self._metrics[method] = _ProviderMetrics()
+        return metrics
+
+    async def solve(self, method: str, project_id: str, action: str = "IMAGE_GENERATION") -> Optional[str]:
+        """创建打码任务并等待结果
+
+        Args:
+            method: 打码服务类型 (yescaptcha / capmonster / ezcaptcha / capsolver)
+            project_id: 项目ID
+            action: reCAPTCHA action类型 (IMAGE_GENERATION 或 VIDEO_GENERATION)
+
+        Returns:
+            gRecaptchaResponse，失败时返回 None
+        """
+        task_type = PROVIDER_TASK_TYPES.get(method)
+        if task_type is None:
+            debug_logger.log_error(f"[reCAPTCHA] Unknown API method: {method}")
+            return None
+
+        client_key = getattr(config, f"{method}_api_key")
+        base_url = getattr(config, f"{method}_base_url")
+        if not client_key:
+            debug_logger.log_info(f"[reCAPTCHA] {method} API key not configured, skipping")
+            return None
+
+        metrics = self._provider_metrics(method)
+        metrics.requests += 1
+        self._waiting += 1
+        acquired = False
+        try:
+            async with self._semaphore:
+                acquired = True
+                self._waiting -= 1
+                return await self._solve_timed(method, base_url, client_key, task_type, project_id, action, metrics)
+        finally:
+            # 排队期间被取消时还原等待计数
+            if not acquired:
+                self._waiting -= 1
+
+    async def _solve_timed(
+        self,
+        method: str,
+        base_url: str,
+        client_key: str,
+        task_type: str,
+        project_id: str,
+        action: str,
+        metrics: _ProviderMetrics
+    ) -> Optional[str]:
+        """执行打码任务并记录耗时 / 成功率"""
+        metrics.in_flight += 1
+        started = time.monotonic()
+        try:
+            token = await asyncio.wait_for(
+                self._solve(method, base_url, client_key, task_type, project_id, action, metrics),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            metrics.last_error = "timeout"
+            debug_logger.log_error(f"[reCAPTCHA {method}] Timeout waiting for token")
+            return None
+        except Exception as e:
+            metrics.failed += 1
+            metrics.last_error = str(e)
+            debug_logger.log_error(f"[reCAPTCHA {method}] error: {str(e)}")
+            return None
+        finally:
+            metrics.in_flight -= 1
+
+        if token:
+            metrics.success += 1
+            metrics.latencies.append(time.monotonic() - started)
+        else:
+            metrics.failed += 1
+        return token
+
+    async def _solve(
+        self,
+        method: str,
+        base_url: str,
+        client_key: str,
+        task_type: str,
+        project_id: str,
+        action: str,
+        metrics: _ProviderMetrics
+    ) -> Optional[str]:
+        session = self._get_session()
+        create_data = {
+            "clientKey": client_key,
+            "task": {
+                "websiteURL": f"https://labs.google/fx/tools/flow/project/{project_id}",
+                "websiteKey": WEBSITE_KEY,
+                "type": task_type,
+                "pageAction": action
+            }
+        }
+
+        result = await session.post(f"{base_url}/createTask", json=create_data, timeout=30)
+        result_json = result.json()
+        task_id = result_json.get("taskId")
+
+        debug_logger.log_info(f"[reCAPTCHA {method}] created task_id: {task_id}")
+
+        if not task_id:
+            error_desc = result_json.get("errorDescription", "Unknown error")
+            metrics.last_error = error_desc
+            debug_logger.log_error(f"[reCAPTCHA {method}] Failed to create task: {error_desc}")
+            return None
+
+        get_url = f"{base_url}/getTaskResult"
+        get_data = {"clientKey": client_key, "taskId": task_id}
+        polls = 0
+        while True:
+            # 打码需要数秒，先等待再查询
+            await asyncio.sleep(self.poll_interval)
+            polls += 1
+            metrics.polls += 1
+            result = await session.post(get_url, json=get_data, timeout=30)
+            result_json = result.json()
+
+            debug_logger.log_info(f"[reCAPTCHA {method}] polling #{polls}: {result_json}")
+
+            if result_json.get("errorId"):
+                error_desc = result_json.get("errorDescription") or result_json.get("errorCode") or "Unknown error"
+                metrics.last_error = error_desc
+                debug_logger.log_error(f"[reCAPTCHA {method}] Task failed: {error_desc}")
+                return None
+
+            if result_json.get("status") == "ready":
+                response = result_json.get("solution", {}).get("gRecaptchaResponse")
+                if response:
+                    debug_logger.log_info(f"[reCAPTCHA {method}] Token获取成功")
+                    return response
+                metrics.last_error = "empty solution"
+                debug_logger.log_error(f"[reCAPTCHA {method}] Task ready without token")
+                return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各打码服务的统计信息"""
+        return {
+            "poll_interval": self.poll_interval,
+            "timeout": self.timeout,
+            "max_concurrent": self.max_concurrent,
+            "waiting": self._waiting,
+            "providers": {method: metrics.to_dict() for method, metrics in self._metrics.items()}
+        }
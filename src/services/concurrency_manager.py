@@ -1,17 +1,88 @@
 """Concurrency manager for token-based rate limiting"""
 import asyncio
-from typing import Dict, Optional
+import itertools
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+from ..core.config import config
 from ..core.logger import debug_logger
 
 
+class TokenLease:
+    """Token 并发槽位租约
+
+    由 ConcurrencyManager.reserve 在选择 Token 的同时占用槽位后返回，
+    支持 async with 自动释放；release 可重复调用。
+    """
+
+    def __init__(self, manager: "ConcurrencyManager", lease_id: int, token, kind: str):
+        self.manager = manager
+        self.lease_id = lease_id
+        self.token = token
+        self.kind = kind  # "image" / "video"
+        self.acquired_at = time.time()
+        self.released = False
+
+    @property
+    def token_id(self) -> int:
+        return self.token.id
+
+    @property
+    def age(self) -> float:
+        """租约已持有的秒数"""
+        return time.time() - self.acquired_at
+
+    async def release(self):
+        """释放槽位 (重复调用无副作用)"""
+        await self.manager.release_lease(self)
+
+    async def __aenter__(self) -> "TokenLease":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+
+class QueueTicket:
+    """等待并发槽位的排队凭证"""
+
+    def __init__(self, kind: str, model: Optional[str] = None):
+        self.kind = kind
+        self.model = model
+        self.enqueued_at = time.time()
+        self._wakeup = asyncio.Event()
+
+    @property
+    def waited(self) -> float:
+        """已等待的秒数"""
+        return time.time() - self.enqueued_at
+
+
 class ConcurrencyManager:
     """Manages concurrent request limits for each token"""
 
-    def __init__(self):
-        """Initialize concurrency manager"""
-        self._image_concurrency: Dict[int, int] = {}  # token_id -> remaining image concurrency
-        self._video_concurrency: Dict[int, int] = {}  # token_id -> remaining video concurrency
+    def __init__(self, reclaim_interval: int = 60):
+        """Initialize concurrency manager
+
+        Args:
+            reclaim_interval: 检查超时租约的间隔(秒)
+        """
+        # kind -> token_id -> concurrency limit (不在字典中表示不限制)
+        self._limits: Dict[str, Dict[int, int]] = {"image": {}, "video": {}}
+        # kind -> token_id -> slots in use
+        self._in_use: Dict[str, Dict[int, int]] = {"image": {}, "video": {}}
         self._lock = asyncio.Lock()  # Protect concurrent access
+        self._leases: Dict[int, TokenLease] = {}
+        self._lease_ids = itertools.count(1)
+        self._reclaim_interval = reclaim_interval
+        self._reclaim_task: Optional[asyncio.Task] = None
+        self._reclaimed = 0
+        # kind -> FIFO 等待队列
+        self._waiters: Dict[str, Deque[QueueTicket]] = {"image": deque(), "video": deque()}
+        self._queue_stats: Dict[str, Dict[str, Any]] = {
+            kind: {"enqueued": 0, "admitted": 0, "timed_out": 0, "max_depth": 0, "waits": deque(maxlen=500)}
+            for kind in ("image", "video")
+        }
 
     async def initialize(self, tokens: list):
         """
@@ -22,13 +93,66 @@ class ConcurrencyManager:
         """
         async with self._lock:
             for token in tokens:
-                if token.image_concurrency and token.image_concurrency > 0:
-                    self._image_concurrency[token.id] = token.image_concurrency
-                if token.video_concurrency and token.video_concurrency > 0:
-                    self._video_concurrency[token.id] = token.video_concurrency
+                self._set_limit("image", token.id, token.image_concurrency)
+                self._set_limit("video", token.id, token.video_concurrency)
 
             debug_logger.log_info(f"Concurrency manager initialized with {len(tokens)} tokens")
 
+    def _set_limit(self, kind: str, token_id: int, limit: Optional[int]):
+        """设置并发上限 (None 或 <= 0 表示不限制)"""
+        if limit and limit > 0:
+            self._limits[kind][token_id] = limit
+        else:
+            self._limits[kind].pop(token_id, None)
+
+    def _remaining(self, kind: str, token_id: int) -> Optional[int]:
+        """剩余槽位数，不限制时返回 None"""
+        limit = self._limits[kind].get(token_id)
+        if limit is None:
+            return None
+        return limit - self._in_use[kind].get(token_id, 0)
+
+    def _has_capacity(self, kind: str, token_id: int) -> bool:
+        remaining = self._remaining(kind, token_id)
+        return remaining is None or remaining > 0
+
+    def _take(self, kind: str, token_id: int):
+        self._in_use[kind][token_id] = self._in_use[kind].get(token_id, 0) + 1
+
+    def _give_back(self, kind: str, token_id: int):
+        in_use = self._in_use[kind].get(token_id, 0)
+        if in_use <= 1:
+            self._in_use[kind].pop(token_id, None)
+        else:
+            self._in_use[kind][token_id] = in_use - 1
+
+    def in_flight(self, kind: str, token_id: int) -> int:
+        """Token 当前占用的槽位数 (同步读取，供选择策略在 reserve 锁内使用)"""
+        return self._in_use[kind].get(token_id, 0)
+
+    async def _can_use(self, kind: str, token_id: int) -> bool:
+        async with self._lock:
+            if self._has_capacity(kind, token_id):
+                return True
+            debug_logger.log_info(f"Token {token_id} {kind} concurrency exhausted (remaining: {self._remaining(kind, token_id)})")
+            return False
+
+    async def _acquire(self, kind: str, token_id: int) -> bool:
+        async with self._lock:
+            if not self._has_capacity(kind, token_id):
+                return False
+            self._take(kind, token_id)
+            if token_id in self._limits[kind]:
+                debug_logger.log_info(f"Token {token_id} acquired {kind} slot (remaining: {self._remaining(kind, token_id)})")
+            return True
+
+    async def _release(self, kind: str, token_id: int):
+        async with self._lock:
+            self._give_back(kind, token_id)
+            self._notify(kind)
+            if token_id in self._limits[kind]:
+                debug_logger.log_info(f"Token {token_id} released {kind} slot (remaining: {self._remaining(kind, token_id)})")
+
     async def can_use_image(self, token_id: int) -> bool:
         """
         Check if token can be used for image generation
@@ -39,17 +163,7 @@ class ConcurrencyManager:
         Returns:
             True if token has available image concurrency, False if concurrency is 0
         """
-        async with self._lock:
-            # If not in dict, it means no limit (-1)
-            if token_id not in self._image_concurrency:
-                return True
-
-            remaining = self._image_concurrency[token_id]
-            if remaining <= 0:
-                debug_logger.log_info(f"Token {token_id} image concurrency exhausted (remaining: {remaining})")
-                return False
-
-            return True
+        return await self._can_use("image", token_id)
 
     async def can_use_video(self, token_id: int) -> bool:
         """
@@ -61,17 +175,7 @@ class ConcurrencyManager:
         Returns:
             True if token has available video concurrency, False if concurrency is 0
         """
-        async with self._lock:
-            # If not in dict, it means no limit (-1)
-            if token_id not in self._video_concurrency:
-                return True
-
-            remaining = self._video_concurrency[token_id]
-            if remaining <= 0:
-                debug_logger.log_info(f"Token {token_id} video concurrency exhausted (remaining: {remaining})")
-                return False
-
-            return True
+        return await self._can_use("video", token_id)
 
     async def acquire_image(self, token_id: int) -> bool:
         """
@@ -83,17 +187,7 @@ class ConcurrencyManager:
         Returns:
             True if acquired, False if not available
         """
-        async with self._lock:
-            if token_id not in self._image_concurrency:
-                # No limit
-                return True
-
-            if self._image_concurrency[token_id] <= 0:
-                return False
-
-            self._image_concurrency[token_id] -= 1
-            debug_logger.log_info(f"Token {token_id} acquired image slot (remaining: {self._image_concurrency[token_id]})")
-            return True
+        return await self._acquire("image", token_id)
 
     async def acquire_video(self, token_id: int) -> bool:
         """
@@ -105,17 +199,7 @@ class ConcurrencyManager:
         Returns:
             True if acquired, False if not available
         """
-        async with self._lock:
-            if token_id not in self._video_concurrency:
-                # No limit
-                return True
-
-            if self._video_concurrency[token_id] <= 0:
-                return False
-
-            self._video_concurrency[token_id] -= 1
-            debug_logger.log_info(f"Token {token_id} acquired video slot (remaining: {self._video_concurrency[token_id]})")
-            return True
+        return await self._acquire("video", token_id)
 
     async def release_image(self, token_id: int):
         """
@@ -124,10 +208,7 @@ class ConcurrencyManager:
         Args:
             token_id: Token ID
         """
-        async with self._lock:
-            if token_id in self._image_concurrency:
-                self._image_concurrency[token_id] += 1
-                debug_logger.log_info(f"Token {token_id} released image slot (remaining: {self._image_concurrency[token_id]})")
+        await self._release("image", token_id)
 
     async def release_video(self, token_id: int):
         """
@@ -136,10 +217,7 @@ class ConcurrencyManager:
         Args:
             token_id: Token ID
         """
-        async with self._lock:
-            if token_id in self._video_concurrency:
-                self._video_concurrency[token_id] += 1
-                debug_logger.log_info(f"Token {token_id} released video slot (remaining: {self._video_concurrency[token_id]})")
+        await self._release("video", token_id)
 
     async def get_image_remaining(self, token_id: int) -> Optional[int]:
         """
@@ -152,7 +230,7 @@ class ConcurrencyManager:
             Remaining count or None if no limit
         """
         async with self._lock:
-            return self._image_concurrency.get(token_id)
+            return self._remaining("image", token_id)
 
     async def get_video_remaining(self, token_id: int) -> Optional[int]:
         """
@@ -165,7 +243,7 @@ class ConcurrencyManager:
             Remaining count or None if no limit
         """
         async with self._lock:
-            return self._video_concurrency.get(token_id)
+            return self._remaining("video", token_id)
 
     async def reset_token(self, token_id: int, image_concurrency: int = -1, video_concurrency: int = -1):
         """
@@ -177,14 +255,210 @@ class ConcurrencyManager:
             video_concurrency: New video concurrency limit (-1 for no limit)
         """
         async with self._lock:
-            if image_concurrency > 0:
-                self._image_concurrency[token_id] = image_concurrency
-            elif token_id in self._image_concurrency:
-                del self._image_concurrency[token_id]
-
-            if video_concurrency > 0:
-                self._video_concurrency[token_id] = video_concurrency
-            elif token_id in self._video_concurrency:
-                del self._video_concurrency[token_id]
+            # 仅修改上限，正在执行的请求仍占用槽位
+            self._set_limit("image", token_id, image_concurrency)
+            self._set_limit("video", token_id, video_concurrency)
+            self._notify("image")
+            self._notify("video")
 
             debug_logger.log_info(f"Token {token_id} concurrency reset (image: {image_concurrency}, video: {video_concurrency})")
+
+    # ========== 租约 (选择 Token 与占用槽位合并为一步) ==========
+
+    async def reserve(
+        self,
+        tokens: List[Any],
+        kind: str,
+        choose: Callable[[List[Any]], Any]
+    ) -> Optional[TokenLease]:
+        """在候选 Token 中选择一个并原子地占用槽位
+
+        Args:
+            tokens: 候选 Token 列表
+            kind: "image" / "video"
+            choose: 从有空闲槽位的 Token 中挑选一个的函数 (负载均衡策略)
+
+        Returns:
+            TokenLease，所有候选 Token 并发已满时返回 None
+        """
+        async with self._lock:
+            available = []
+            for token in tokens:
+                # 以内存注册表中的当前配置为准，管理后台修改并发上限后立即生效
+                self._set_limit(kind, token.id, getattr(token, f"{kind}_concurrency", None))
+                if self._has_capacity(kind, token.id):
+                    available.append(token)
+
+            if not available:
+                return None
+
+            token = choose(available)
+            self._take(kind, token.id)
+            lease = TokenLease(self, next(self._lease_ids), token, kind)
+            self._leases[lease.lease_id] = lease
+            debug_logger.log_info(
+                f"Token {token.id} reserved {kind} slot (lease {lease.lease_id}, remaining: {self._remaining(kind, token.id)})"
+            )
+            return lease
+
+    async def release_lease(self, lease: TokenLease):
+        """释放租约占用的槽位"""
+        async with self._lock:
+            if lease.released:
+                return
+            lease.released = True
+            self._leases.pop(lease.lease_id, None)
+            self._give_back(lease.kind, lease.token_id)
+            self._notify(lease.kind)
+            debug_logger.log_info(
+                f"Token {lease.token_id} released {lease.kind} slot (lease {lease.lease_id}, held {lease.age:.1f}s)"
+            )
+
+    async def reclaim_expired_leases(self, max_age: Optional[float] = None) -> int:
+        """回收持有时间超过上限的租约 (请求异常退出未释放时兜底)
+
+        Returns:
+            回收的租约数量
+        """
+        max_age = max_age if max_age is not None else config.lease_max_age
+        expired = [lease for lease in list(self._leases.values()) if lease.age > max_age]
+        for lease in expired:
+            debug_logger.log_warning(
+                f"[CONCURRENCY] 回收超时租约 {lease.lease_id}: Token {lease.token_id} {lease.kind} (已持有 {lease.age:.0f}s)"
+            )
+            await self.release_lease(lease)
+        self._reclaimed += len(expired)
+        return len(expired)
+
+    # ========== 等待队列 (所有Token并发已满时按到达顺序排队) ==========
+
+    def queue_depth(self, kind: str) -> int:
+        """当前排队请求数"""
+        return len(self._waiters[kind])
+
+    def enqueue(self, kind: str, model: Optional[str] = None) -> QueueTicket:
+        """加入等待队列
+
+        Args:
+            kind: "image" / "video"
+            model: 请求的模型 (仅用于日志)
+
+        Returns:
+            QueueTicket，结束等待时必须调用 leave()
+        """
+        ticket = QueueTicket(kind, model)
+        waiters = self._waiters[kind]
+        waiters.append(ticket)
+        stats = self._queue_stats[kind]
+        stats["enqueued"] += 1
+        stats["max_depth"] = max(stats["max_depth"], len(waiters))
+        debug_logger.log_info(f"[QUEUE] {kind} 请求进入等待队列 (模型={model}, 队列长度={len(waiters)})")
+        return ticket
+
+    def queue_position(self, ticket: QueueTicket) -> int:
+        """排队位置 (1 表示队首)"""
+        try:
+            return self._waiters[ticket.kind].index(ticket) + 1
+        except ValueError:
+            return 0
+
+    async def wait_turn(self, ticket: QueueTicket, timeout: float) -> bool:
+        """等待槽位释放的通知
+
+        Args:
+            ticket: 排队凭证
+            timeout: 最长等待秒数
+
+        Returns:
+            True 表示被唤醒，False 表示等待超时
+        """
+        try:
+            await asyncio.wait_for(ticket._wakeup.wait(), timeout=max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            ticket._wakeup.clear()
+
+    def leave(self, ticket: QueueTicket, admitted: bool):
+        """离开等待队列并记录等待时间
+
+        Args:
+            ticket: 排队凭证
+            admitted: 是否成功获得槽位
+        """
+        waiters = self._waiters[ticket.kind]
+        try:
+            waiters.remove(ticket)
+        except ValueError:
+            return
+
+        stats = self._queue_stats[ticket.kind]
+        stats["admitted" if admitted else "timed_out"] += 1
+        stats["waits"].append(ticket.waited)
+        # 可能还有其他空闲槽位，让新的队首重新尝试
+        self._notify(ticket.kind)
+
+    def _notify(self, kind: str):
+        """唤醒队首请求"""
+        waiters = self._waiters[kind]
+        if waiters:
+            waiters[0]._wakeup.set()
+
+    def get_queue_stats(self) -> Dict[str, Any]:
+        """获取等待队列统计信息"""
+        result = {}
+        for kind, stats in self._queue_stats.items():
+            waits = sorted(stats["waits"])
+            result[kind] = {
+                "depth": len(self._waiters[kind]),
+                "max_depth": stats["max_depth"],
+                "enqueued": stats["enqueued"],
+                "admitted": stats["admitted"],
+                "timed_out": stats["timed_out"],
+                "avg_wait": round(sum(waits) / len(waits), 2) if waits else 0.0,
+                "p95_wait": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2) if waits else 0.0,
+                "max_wait": round(waits[-1], 2) if waits else 0.0
+            }
+        return result
+
+    async def start(self):
+        """Start background lease reclaim task"""
+        if self._reclaim_task is None:
+            self._reclaim_task = asyncio.create_task(self._reclaim_loop())
+
+    async def stop(self):
+        """Stop background lease reclaim task"""
+        if self._reclaim_task:
+            self._reclaim_task.cancel()
+            try:
+                await self._reclaim_task
+            except asyncio.CancelledError:
+                pass
+            self._reclaim_task = None
+
+    async def _reclaim_loop(self):
+        """Background task to reclaim leaked leases"""
+        while True:
+            try:
+                await asyncio.sleep(self._reclaim_interval)
+                await self.reclaim_expired_leases()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(
+                    error_message=f"Lease reclaim error: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+
+    def get_lease_stats(self) -> Dict[str, Any]:
+        """获取租约统计信息"""
+        leases = list(self._leases.values())
+        return {
+            "active_leases": len(leases),
+            "image_leases": sum(1 for lease in leases if lease.kind == "image"),
+            "video_leases": sum(1 for lease in leases if lease.kind == "video"),
+            "oldest_lease_age": round(max((lease.age for lease in leases), default=0.0), 1),
+            "reclaimed": self._reclaimed
+        }
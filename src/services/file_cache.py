@@ -2,32 +2,101 @@
 import os
 import asyncio
 import hashlib
+import shutil
 import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta
+from curl_cffi.curl import CURL_WRITEFUNC_ERROR
 from curl_cffi.requests import AsyncSession
 from ..core.config import config
 from ..core.logger import debug_logger
+from .single_flight import SingleFlight
+from .media_worker import media_workers
+
+
+class FileTooLargeError(Exception):
+    """Raised when a download exceeds the configured size limit"""
+
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"File too large: {size} bytes exceeds limit of {limit} bytes")
+        self.size = size
+        self.limit = limit
+
+
+class DownloadHTTPError(Exception):
+    """Raised when the download server answers with a non-200 status"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code == 429 or self.status_code >= 500
+
+
+@dataclass
+class CacheEntry:
+    """缓存目录中单个文件的索引信息"""
+    size: int
+    media_type: str
+    last_access: float
 
 
 class FileCache:
-    """File caching service for videos"""
+    """File caching service for videos
 
-    def __init__(self, cache_dir: str = "tmp", default_timeout: int = 7200, proxy_manager=None):
+    缓存目录中的文件由内存索引 (OrderedDict, 按最近访问排序) 管理，启动时扫描一次目录重建。
+    命中判断只查索引；文件在 timeout 秒内未被访问即过期，总大小超过 max_size 时淘汰最久未访问的文件。
+    """
+
+    CLEANUP_INTERVAL = 300  # 过期清理间隔(秒)
+    CLEANUP_BATCH_SIZE = 200  # 每批删除的文件数
+
+    def __init__(self, cache_dir: str = "tmp", default_timeout: Optional[int] = None, proxy_manager=None):
         """
         Initialize file cache
 
         Args:
             cache_dir: Cache directory path
-            default_timeout: Default cache timeout in seconds (default: 2 hours)
+            default_timeout: Cache timeout in seconds (default: follow config.cache_timeout)
             proxy_manager: ProxyManager instance for downloading files
         """
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
-        self.default_timeout = default_timeout
+        self._timeout = default_timeout
         self.proxy_manager = proxy_manager
         self._cleanup_task = None
+        # 同一 URL 的并发下载合并为一次
+        self._single_flight = SingleFlight()
+        # filename -> CacheEntry，最久未访问的在最前
+        self._index: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # filename -> 正在后台线程中删除该文件的任务
+        self._pending_unlinks: Dict[str, asyncio.Task] = {}
+        self._total_bytes = 0
+        self._cache_stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,         # 因超时淘汰的文件数
+            "evicted": 0,         # 因超出容量淘汰的文件数
+            "evicted_bytes": 0
+        }
+        self._rebuild_index()
+        # 限制同时运行的 wget / curl 子进程数量
+        self._subprocess_semaphore = asyncio.Semaphore(config.cache_subprocess_concurrency)
+        self._download_stats = {
+            "downloads": 0,       # 成功下载次数
+            "failed": 0,          # 失败次数
+            "bytes": 0,           # 累计下载字节数
+            "seconds": 0.0,       # 累计下载耗时
+            "too_large": 0,       # 超过大小限制被中止的次数
+            "last": None,         # 最近一次下载 {method, bytes, seconds, mbps}
+            "methods": {}         # 按下载方式统计的尝试次数与耗时
+        }
 
     async def start_cleanup_task(self):
         """Start background cleanup task"""
@@ -43,13 +112,17 @@ class FileCache:
             except asyncio.CancelledError:
                 pass
             self._cleanup_task = None
+        # 等待后台删除完成
+        pending = set(self._pending_unlinks.values())
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
 
     async def _cleanup_loop(self):
         """Background task to clean up expired files"""
         while True:
             try:
-                await asyncio.sleep(300)  # Check every 5 minutes
                 await self._cleanup_expired_files()
+                await asyncio.sleep(self.CLEANUP_INTERVAL)
             except asyncio.CancelledError:
                 break
             except Exception as e:
@@ -58,23 +131,30 @@ class FileCache:
                     status_code=0,
                     response_text=""
                 )
+                await asyncio.sleep(self.CLEANUP_INTERVAL)
 
     async def _cleanup_expired_files(self):
-        """Remove expired cache files"""
+        """Remove expired cache files
+
+        索引按最近访问排序，过期文件都在最前面：只需从头弹出直到遇到未过期的条目，
+        每批删除 CLEANUP_BATCH_SIZE 个文件并让出事件循环。
+        """
         try:
-            current_time = time.time()
             removed_count = 0
-
-            for file_path in self.cache_dir.iterdir():
-                if file_path.is_file():
-                    # Check file age
-                    file_age = current_time - file_path.stat().st_mtime
-                    if file_age > self.default_timeout:
-                        try:
-                            file_path.unlink()
-                            removed_count += 1
-                        except Exception:
-                            pass
+            while True:
+                deadline = time.time() - self.default_timeout
+                batch: List[str] = []
+                while self._index and len(batch) < self.CLEANUP_BATCH_SIZE:
+                    filename, entry = next(iter(self._index.items()))
+                    if entry.last_access > deadline:
+                        break
+                    self._remove_entry(filename)
+                    batch.append(filename)
+                if not batch:
+                    break
+                await self._unlink_async(batch)
+                self._cache_stats["expired"] += len(batch)
+                removed_count += len(batch)
 
             if removed_count > 0:
                 debug_logger.log_info(f"Cleanup: removed {removed_count} expired cache files")
@@ -86,6 +166,151 @@ class FileCache:
                 response_text=""
             )
 
+    def _rebuild_index(self):
+        """启动时扫描一次缓存目录重建索引 (以 mtime 作为最近访问时间)，并删除残留的临时文件"""
+        entries = []
+        for file_path in self.cache_dir.iterdir():
+            try:
+                if not file_path.is_file():
+                    continue
+                if file_path.name.endswith(".part"):
+                    # 上次运行中断留下的未完成下载
+                    file_path.unlink()
+                    continue
+                stat = file_path.stat()
+                entries.append((stat.st_mtime, file_path.name, stat.st_size))
+            except Exception:
+                pass
+
+        self._index.clear()
+        self._total_bytes = 0
+        for mtime, filename, size in sorted(entries):
+            self._index[filename] = CacheEntry(size=size, media_type=self._media_type_of(filename), last_access=mtime)
+            self._total_bytes += size
+
+        if entries:
+            debug_logger.log_info(
+                f"Cache index rebuilt: {len(entries)} files, {self._total_bytes / 1024 / 1024:.1f} MB"
+            )
+
+    @staticmethod
+    def _media_type_of(filename: str) -> str:
+        if filename.endswith(".mp4"):
+            return "video"
+        if filename.endswith(".jpg"):
+            return "image"
+        return "other"
+
+    def _lookup(self, filename: str) -> bool:
+        """查询索引 (O(1))：命中时更新最近访问时间，已过期的条目立即删除"""
+        entry = self._index.get(filename)
+        if entry is None:
+            return False
+        now = time.time()
+        if now - entry.last_access >= self.default_timeout:
+            self._remove_entry(filename)
+            self._schedule_unlink([filename])
+            self._cache_stats["expired"] += 1
+            return False
+        entry.last_access = now
+        self._index.move_to_end(filename)
+        return True
+
+    def touch(self, filename: str):
+        """标记文件刚被读取 (不改变命中统计)"""
+        entry = self._index.get(filename)
+        if entry is not None:
+            entry.last_access = time.time()
+            self._index.move_to_end(filename)
+
+    def _add_entry(self, filename: str, size: int, media_type: str):
+        """登记新写入的文件，并在超出容量时按 LRU 淘汰其它文件"""
+        old = self._index.pop(filename, None)
+        if old is not None:
+            self._total_bytes -= old.size
+        self._index[filename] = CacheEntry(size=size, media_type=media_type, last_access=time.time())
+        self._total_bytes += size
+        self._enforce_budget(keep=filename)
+
+    def _remove_entry(self, filename: str) -> Optional[CacheEntry]:
+        entry = self._index.pop(filename, None)
+        if entry is not None:
+            self._total_bytes -= entry.size
+        return entry
+
+    def _enforce_budget(self, keep: str):
+        """总大小超过 max_size 时从最久未访问的一端淘汰 (不淘汰刚写入的文件)"""
+        max_size = config.cache_max_size
+        if not max_size or self._total_bytes <= max_size:
+            return
+        evicted: List[str] = []
+        while self._total_bytes > max_size and len(self._index) > 1:
+            filename = next(iter(self._index))
+            if filename == keep:
+                self._index.move_to_end(filename)
+                continue
+            entry = self._remove_entry(filename)
+            evicted.append(filename)
+            self._cache_stats["evicted_bytes"] += entry.size
+        if evicted:
+            self._schedule_unlink(evicted)
+            self._cache_stats["evicted"] += len(evicted)
+            debug_logger.log_info(
+                f"Cache over budget: evicted {len(evicted)} least recently used files"
+            )
+
+    def _schedule_unlink(self, filenames: List[str]) -> asyncio.Task:
+        """在后台线程中删除文件，命中判断和写入索引不等待磁盘删除"""
+        task = asyncio.create_task(asyncio.to_thread(self._unlink_files, filenames))
+        for filename in filenames:
+            self._pending_unlinks[filename] = task
+
+        def forget(t: asyncio.Task):
+            for filename in filenames:
+                if self._pending_unlinks.get(filename) is t:
+                    del self._pending_unlinks[filename]
+
+        task.add_done_callback(forget)
+        return task
+
+    async def _unlink_async(self, filenames: List[str]):
+        """删除文件并等待完成 (不阻塞事件循环)"""
+        await asyncio.shield(self._schedule_unlink(filenames))
+
+    async def _wait_unlink(self, filename: str):
+        """等待同名文件的后台删除完成，避免删除掉随后重新写入的文件"""
+        task = self._pending_unlinks.get(filename)
+        if task is not None:
+            await asyncio.shield(task)
+
+    def _unlink_files(self, filenames: List[str]):
+        for filename in filenames:
+            try:
+                (self.cache_dir / filename).unlink()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                debug_logger.log_warning(f"Failed to remove cache file {filename}: {str(e)}")
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取缓存目录统计信息 (命中率、文件数、字节数)"""
+        hits = self._cache_stats["hits"]
+        lookups = hits + self._cache_stats["misses"]
+        by_type: Dict[str, Dict[str, int]] = {}
+        for entry in self._index.values():
+            item = by_type.setdefault(entry.media_type, {"files": 0, "bytes": 0})
+            item["files"] += 1
+            item["bytes"] += entry.size
+        return {
+            "files": len(self._index),
+            "bytes": self._total_bytes,
+            "max_size": config.cache_max_size,
+            "timeout": self.default_timeout,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "by_type": by_type,
+            **self._cache_stats
+        }
+
     def _generate_cache_filename(self, url: str, media_type: str) -> str:
         """Generate unique filename for cached file"""
         # Use URL hash as filename
@@ -113,20 +338,25 @@ class FileCache:
             Local cache filename
         """
         filename = self._generate_cache_filename(url, media_type)
-        file_path = self.cache_dir / filename
 
         # Check if already cached and not expired
-        if file_path.exists():
-            file_age = time.time() - file_path.stat().st_mtime
-            if file_age < self.default_timeout:
-                debug_logger.log_info(f"Cache hit: {filename}")
-                return filename
-            else:
-                # Remove expired file
-                try:
-                    file_path.unlink()
-                except Exception:
-                    pass
+        if self._lookup(filename):
+            self._cache_stats["hits"] += 1
+            debug_logger.log_info(f"Cache hit: {filename}")
+            return filename
+
+        # 同一文件正在下载时等待该下载完成，而不是重复下载
+        return await self._single_flight.do("download", filename, self._download_once, url, media_type, filename)
+
+    async def _download_once(self, url: str, media_type: str, filename: str) -> str:
+        """实际下载文件 (每个文件同一时间只有一个该调用在执行)"""
+        # 等待期间可能刚有一次下载完成
+        if self._lookup(filename):
+            self._cache_stats["hits"] += 1
+            return filename
+        self._cache_stats["misses"] += 1
+        await self._wait_unlink(filename)
+        file_path = self.cache_dir / filename
 
         # Download file
         debug_logger.log_info(f"Downloading file from: {url}")
@@ -134,135 +364,248 @@ class FileCache:
         # Get proxy if available
         proxy_url = None
         if self.proxy_manager:
-            proxy_config = await self.proxy_manager.get_proxy_config()
-            if proxy_config and proxy_config.enabled and proxy_config.proxy_url:
-                proxy_url = proxy_config.proxy_url
-
-        # Try method 1: curl_cffi with browser impersonation
-        try:
-            async with AsyncSession() as session:
-                proxies = {"http": proxy_url, "https": proxy_url} if proxy_url else None
-                headers = {
-                    "Accept": "*/*",
-                    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-                    "Accept-Encoding": "gzip, deflate, br",
-                    "Connection": "keep-alive",
-                    "Sec-Fetch-Dest": "document",
-                    "Sec-Fetch-Mode": "navigate",
-                    "Sec-Fetch-Site": "none",
-                    "Upgrade-Insecure-Requests": "1"
-                }
-                response = await session.get(
-                    url,
-                    timeout=60,
-                    proxies=proxies,
-                    headers=headers,
-                    impersonate="chrome120",
-                    verify=False
-                )
+            proxy_url = await self.proxy_manager.get_proxy_url()
 
-                if response.status_code == 200:
-                    with open(file_path, 'wb') as f:
-                        f.write(response.content)
-                    debug_logger.log_info(f"File cached (curl_cffi): {filename} ({len(response.content)} bytes)")
+        # Method 1: curl_cffi with browser impersonation (streamed to disk), retried with backoff
+        retries = max(1, config.cache_download_retries)
+        last_error: Optional[Exception] = None
+        for attempt in range(retries):
+            started = time.time()
+            try:
+                size = await self._download_curl_cffi(url, file_path, proxy_url)
+                self._record_attempt("curl_cffi", True, time.time() - started)
+                self._add_entry(filename, size, media_type)
+                debug_logger.log_info(f"File cached (curl_cffi): {filename} ({size} bytes)")
+                return filename
+            except FileTooLargeError:
+                self._record_attempt("curl_cffi", False, time.time() - started)
+                self._download_stats["failed"] += 1
+                self._download_stats["too_large"] += 1
+                raise
+            except Exception as e:
+                self._record_attempt("curl_cffi", False, time.time() - started)
+                last_error = e
+                debug_logger.log_warning(f"curl_cffi failed (attempt {attempt + 1}/{retries}): {str(e)}")
+                if isinstance(e, DownloadHTTPError) and not e.retryable:
+                    break
+                if attempt + 1 < retries:
+                    await asyncio.sleep(min(2 ** attempt, 10))
+
+        # Method 2/3: system wget / curl (optional, run as non-blocking subprocesses)
+        if config.cache_system_downloaders:
+            for method in ("wget", "curl"):
+                if not shutil.which(method):
+                    debug_logger.log_warning(f"{method} not found, skipping")
+                    continue
+                started = time.time()
+                try:
+                    size = await self._download_subprocess(method, url, file_path, proxy_url)
+                    self._record_attempt(method, True, time.time() - started)
+                    self._record_download(method, size, time.time() - started)
+                    self._add_entry(filename, size, media_type)
+                    debug_logger.log_info(f"File cached ({method}): {filename} ({size} bytes)")
                     return filename
-                else:
-                    debug_logger.log_warning(f"curl_cffi failed with HTTP {response.status_code}, trying wget...")
-
-        except Exception as e:
-            debug_logger.log_warning(f"curl_cffi failed: {str(e)}, trying wget...")
+                except Exception as e:
+                    self._record_attempt(method, False, time.time() - started)
+                    last_error = e
+                    debug_logger.log_warning(f"{method} failed: {str(e)}")
+
+        self._download_stats["failed"] += 1
+        debug_logger.log_error(
+            error_message=f"Failed to download file: {str(last_error)}",
+            status_code=0,
+            response_text=str(last_error)
+        )
+        raise Exception(f"Failed to cache file: {str(last_error)}")
+
+    def _subprocess_command(self, method: str, url: str, output: Path, proxy_url: Optional[str]):
+        """构造 wget / curl 命令
 
-        # Try method 2: wget command
-        try:
-            import subprocess
-
-            wget_cmd = [
+        Returns:
+            (命令参数列表, 环境变量)
+        """
+        user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        if method == "wget":
+            cmd = [
                 "wget",
                 "-q",  # Quiet mode
-                "-O", str(file_path),  # Output file
+                "-O", str(output),  # Output file
                 "--timeout=60",
                 "--tries=3",
-                "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+                f"--user-agent={user_agent}",
                 "--header=Accept: */*",
                 "--header=Accept-Language: zh-CN,zh;q=0.9,en;q=0.8",
-                "--header=Connection: keep-alive"
+                "--header=Connection: keep-alive",
+                url
             ]
-
-            # Add proxy if configured
+            env = None
             if proxy_url:
                 # wget uses environment variables for proxy
                 env = os.environ.copy()
                 env['http_proxy'] = proxy_url
                 env['https_proxy'] = proxy_url
-            else:
-                env = None
-
-            # Add URL
-            wget_cmd.append(url)
+            return cmd, env
+
+        cmd = [
+            "curl",
+            "-L",  # Follow redirects
+            "-s",  # Silent mode
+            "-f",  # Fail on HTTP errors
+            "-o", str(output),  # Output file
+            "--max-time", "60",
+            "-H", "Accept: */*",
+            "-H", "Accept-Language: zh-CN,zh;q=0.9,en;q=0.8",
+            "-H", "Connection: keep-alive",
+            "-A", user_agent
+        ]
+        max_size = config.cache_max_download_size
+        if max_size:
+            cmd.extend(["--max-filesize", str(max_size)])
+        if proxy_url:
+            cmd.extend(["-x", proxy_url])
+        cmd.append(url)
+        return cmd, None
+
+    async def _download_subprocess(self, method: str, url: str, file_path: Path, proxy_url: Optional[str]) -> int:
+        """用 wget / curl 子进程下载到临时文件 (不阻塞事件循环，取消或超时时结束子进程)
 
-            # Execute wget
-            result = subprocess.run(wget_cmd, capture_output=True, timeout=90, env=env)
-
-            if result.returncode == 0 and file_path.exists():
-                file_size = file_path.stat().st_size
-                if file_size > 0:
-                    debug_logger.log_info(f"File cached (wget): {filename} ({file_size} bytes)")
-                    return filename
-                else:
-                    raise Exception("Downloaded file is empty")
-            else:
-                error_msg = result.stderr.decode('utf-8', errors='ignore') if result.stderr else "Unknown error"
-                debug_logger.log_warning(f"wget failed: {error_msg}, trying curl...")
-
-        except FileNotFoundError:
-            debug_logger.log_warning("wget not found, trying curl...")
-        except Exception as e:
-            debug_logger.log_warning(f"wget failed: {str(e)}, trying curl...")
+        Returns:
+            下载的字节数
+        """
+        tmp_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex}.part")
+        cmd, env = self._subprocess_command(method, url, tmp_path, proxy_url)
 
-        # Try method 3: system curl command
         try:
-            import subprocess
-
-            curl_cmd = [
-                "curl",
-                "-L",  # Follow redirects
-                "-s",  # Silent mode
-                "-o", str(file_path),  # Output file
-                "--max-time", "60",
-                "-H", "Accept: */*",
-                "-H", "Accept-Language: zh-CN,zh;q=0.9,en;q=0.8",
-                "-H", "Connection: keep-alive",
-                "-A", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            ]
+            async with self._subprocess_semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                    env=env
+                )
+                try:
+                    _, stderr = await asyncio.wait_for(process.communicate(), timeout=90)
+                except BaseException:
+                    # 超时或请求被取消时结束子进程
+                    if process.returncode is None:
+                        process.kill()
+                        await process.wait()
+                    raise
+
+            if process.returncode != 0:
+                error_msg = stderr.decode('utf-8', errors='ignore').strip() if stderr else ""
+                raise Exception(f"{method} exited with code {process.returncode}: {error_msg or 'Unknown error'}")
+            if not tmp_path.exists() or tmp_path.stat().st_size == 0:
+                raise Exception("Downloaded file is empty")
+
+            size = tmp_path.stat().st_size
+            max_size = config.cache_max_download_size
+            if max_size and size > max_size:
+                raise FileTooLargeError(size, max_size)
+            os.replace(tmp_path, file_path)
+            return size
+        finally:
+            if tmp_path.exists():
+                try:
+                    tmp_path.unlink()
+                except Exception:
+                    pass
 
-            # Add proxy if configured
-            if proxy_url:
-                curl_cmd.extend(["-x", proxy_url])
+    async def _download_curl_cffi(self, url: str, file_path: Path, proxy_url: Optional[str]) -> int:
+        """边下载边写入临时文件，完成后原子重命名到 file_path
 
-            # Add URL
-            curl_cmd.append(url)
+        Returns:
+            下载的字节数
+        """
+        max_size = config.cache_max_download_size
+        proxies = {"http": proxy_url, "https": proxy_url} if proxy_url else None
+        headers = {
+            "Accept": "*/*",
+            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Connection": "keep-alive",
+            "Sec-Fetch-Dest": "document",
+            "Sec-Fetch-Mode": "navigate",
+            "Sec-Fetch-Site": "none",
+            "Upgrade-Insecure-Requests": "1"
+        }
+        tmp_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex}.part")
+        started = time.time()
+        written = 0
 
-            # Execute curl
-            result = subprocess.run(curl_cmd, capture_output=True, timeout=90)
+        try:
+            with open(tmp_path, "wb") as f:
+                def write_chunk(chunk: bytes):
+                    # curl 每收到一块数据就直接写盘，内存占用与文件大小无关
+                    nonlocal written
+                    written += len(chunk)
+                    if max_size and written > max_size:
+                        return CURL_WRITEFUNC_ERROR  # 中止传输
+                    return f.write(chunk)
 
-            if result.returncode == 0 and file_path.exists():
-                file_size = file_path.stat().st_size
-                if file_size > 0:
-                    debug_logger.log_info(f"File cached (curl): {filename} ({file_size} bytes)")
-                    return filename
-                else:
-                    raise Exception("Downloaded file is empty")
-            else:
-                error_msg = result.stderr.decode('utf-8', errors='ignore') if result.stderr else "Unknown error"
-                raise Exception(f"curl command failed: {error_msg}")
+                try:
+                    async with AsyncSession() as session:
+                        response = await session.get(
+                            url,
+                            timeout=60,
+                            proxies=proxies,
+                            headers=headers,
+                            impersonate="chrome120",
+                            verify=False,
+                            content_callback=write_chunk
+                        )
+                except Exception:
+                    if max_size and written > max_size:
+                        raise FileTooLargeError(written, max_size)
+                    raise
+
+            if response.status_code != 200:
+                raise DownloadHTTPError(response.status_code)
+            size = tmp_path.stat().st_size
+            if size == 0:
+                raise Exception("Downloaded file is empty")
+            os.replace(tmp_path, file_path)
+        finally:
+            if tmp_path.exists():
+                try:
+                    tmp_path.unlink()
+                except Exception:
+                    pass
 
-        except Exception as e:
-            debug_logger.log_error(
-                error_message=f"Failed to download file: {str(e)}",
-                status_code=0,
-                response_text=str(e)
-            )
-            raise Exception(f"Failed to cache file: {str(e)}")
+        self._record_download("curl_cffi", size, time.time() - started)
+        return size
+
+    def _record_download(self, method: str, size: int, seconds: float):
+        """记录一次成功下载的字节数与吞吐量"""
+        self._download_stats["downloads"] += 1
+        self._download_stats["bytes"] += size
+        self._download_stats["seconds"] += seconds
+        self._download_stats["last"] = {
+            "method": method,
+            "bytes": size,
+            "seconds": round(seconds, 3),
+            "mbps": round(size / 1024 / 1024 / seconds, 2) if seconds > 0 else None
+        }
+
+    def _record_attempt(self, method: str, success: bool, seconds: float):
+        """记录单次下载尝试的结果与耗时"""
+        stats = self._download_stats["methods"].setdefault(
+            method, {"attempts": 0, "success": 0, "failed": 0, "seconds": 0.0}
+        )
+        stats["attempts"] += 1
+        stats["success" if success else "failed"] += 1
+        stats["seconds"] = round(stats["seconds"] + seconds, 3)
+
+    def get_download_stats(self) -> Dict[str, Any]:
+        """获取下载统计信息"""
+        stats = dict(self._download_stats)
+        seconds = stats["seconds"]
+        stats["seconds"] = round(seconds, 3)
+        stats["avg_mbps"] = round(stats["bytes"] / 1024 / 1024 / seconds, 2) if seconds > 0 else None
+        stats["methods"] = {method: dict(item) for method, item in stats["methods"].items()}
+        stats["max_download_size"] = config.cache_max_download_size
+        stats["single_flight"] = self._single_flight.get_stats()
+        return stats
 
     async def cache_base64_image(self, base64_data: str, resolution: str = "") -> str:
         """
@@ -275,23 +618,28 @@ class FileCache:
         Returns:
             Local cache filename
         """
-        import base64
-        import uuid
-
         # Generate unique filename
         unique_id = hashlib.md5(f"{uuid.uuid4()}{time.time()}".encode()).hexdigest()
         suffix = f"_{resolution}" if resolution else ""
         filename = f"{unique_id}{suffix}.jpg"
         file_path = self.cache_dir / filename
 
+        tmp_path = file_path.with_name(f"{filename}.{uuid.uuid4().hex}.part")
+
         try:
-            # Decode base64 and save to file
-            image_data = base64.b64decode(base64_data)
-            with open(file_path, 'wb') as f:
-                f.write(image_data)
+            # Decode base64 and save to file (解码和写盘都不在事件循环线程中执行；
+            # 写临时文件后重命名，读取方不会看到不完整的文件)
+            image_data = await media_workers.b64decode(base64_data)
+            await asyncio.to_thread(self._write_file, tmp_path, file_path, image_data)
+            self._add_entry(filename, len(image_data), "image")
             debug_logger.log_info(f"Base64 image cached: {filename} ({len(image_data)} bytes)")
             return filename
         except Exception as e:
+            if tmp_path.exists():
+                try:
+                    tmp_path.unlink()
+                except Exception:
+                    pass
             debug_logger.log_error(
                 error_message=f"Failed to cache base64 image: {str(e)}",
                 status_code=0,
@@ -299,13 +647,24 @@ class FileCache:
             )
             raise Exception(f"Failed to cache base64 image: {str(e)}")
 
+    @staticmethod
+    def _write_file(tmp_path: Path, file_path: Path, data: bytes):
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+
     def get_cache_path(self, filename: str) -> Path:
         """Get full path to cached file"""
         return self.cache_dir / filename
 
+    @property
+    def default_timeout(self) -> int:
+        """Cache timeout in seconds (未显式设置时跟随 config.cache_timeout 热更新)"""
+        return self._timeout if self._timeout is not None else config.cache_timeout
+
     def set_timeout(self, timeout: int):
         """Set cache timeout in seconds"""
-        self.default_timeout = timeout
+        self._timeout = timeout
         debug_logger.log_info(f"Cache timeout updated to {timeout} seconds")
 
     def get_timeout(self) -> int:
@@ -315,14 +674,11 @@ class FileCache:
     async def clear_all(self):
         """Clear all cached files"""
         try:
-            removed_count = 0
-            for file_path in self.cache_dir.iterdir():
-                if file_path.is_file():
-                    try:
-                        file_path.unlink()
-                        removed_count += 1
-                    except Exception:
-                        pass
+            filenames = list(self._index)
+            self._index.clear()
+            self._total_bytes = 0
+            await self._unlink_async(filenames)
+            removed_count = len(filenames)
 
             debug_logger.log_info(f"Cache cleared: removed {removed_count} files")
             return removed_count
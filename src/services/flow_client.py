@@ -3,11 +3,16 @@ import asyncio
 import time
 import uuid
 import random
-import base64
-from typing import Dict, Any, Optional, List
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, Tuple
 from curl_cffi.requests import AsyncSession
+from curl_cffi.requests.cookies import Cookies
 from ..core.logger import debug_logger
 from ..core.config import config
+from .single_flight import SingleFlight
+from .upload_cache import UploadCache
+from .media_worker import media_workers
+from .captcha_client import CaptchaClient
 import json
 
 TM_TASKS = {}
@@ -20,6 +25,135 @@ def _pp(obj, limit=4000):
         return s[:limit] + f"\n... (truncated, total {len(s)} chars)"
     return s
 
+
+class _NoStoreCookies(Cookies):
+    """不保存响应 Cookie 的 Cookie 容器
+
+    curl_cffi 会把每个响应的 Set-Cookie 合并进会话的 Cookie 容器，并在同一会话的
+    下一个请求中发送。池化会话被所有账号共享，因此容器必须始终为空：每个请求只携带
+    调用方自己在 headers 中传入的 Cookie。
+    """
+
+    def update_cookies_from_curl(self, morsels):
+        pass
+
+
+class _PooledSession:
+    """会话池中的单个长连接会话"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.in_use = 0
+        self.last_used = time.time()
+        self.stale = False
+
+
+class UpstreamSessionPool:
+    """上游 HTTP 长连接会话池
+
+    按 (代理URL, 浏览器指纹) 复用 curl_cffi AsyncSession，同一会话内的
+    keep-alive / HTTP2 连接由 libcurl multi 句柄负责复用，避免每次请求都
+    重新进行 TCP+TLS 握手。代理配置变化后旧会话会被标记失效并在空闲时关闭。
+    """
+
+    def __init__(self, idle_timeout: Optional[float] = None, max_clients: Optional[int] = None):
+        self.idle_timeout = idle_timeout if idle_timeout is not None else config.flow_session_idle_timeout
+        self.max_clients = max_clients if max_clients is not None else config.flow_session_max_clients
+        self._sessions: Dict[Tuple[Optional[str], str], _PooledSession] = {}
+        self._current_proxy: Optional[str] = None
+        self._stats = {
+            "requests": 0,       # 经过会话池的请求总数
+            "reused": 0,         # 复用已有会话的请求数
+            "handshakes": 0,     # 新建会话次数（每个新会话都需要完整的 TCP+TLS 握手）
+            "closed_idle": 0,    # 因空闲超时关闭的会话数
+            "rebuilt": 0,        # 因代理变化而失效重建的会话数
+        }
+
+    @asynccontextmanager
+    async def session(self, proxy_url: Optional[str], impersonate: str):
+        """借出一个会话，使用完毕后自动归还
+
+        Args:
+            proxy_url: 代理地址（None 表示直连）
+            impersonate: curl_cffi 浏览器指纹标识
+        """
+        entry = await self._acquire(proxy_url, impersonate)
+        entry.in_use += 1
+        try:
+            yield entry.session
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.time()
+            # 会话不保存 Cookie (_NoStoreCookies)，这里再清空一次作为兜底
+            entry.session.cookies.clear()
+            if entry.stale and entry.in_use == 0:
+                await self._close_entry(proxy_url, impersonate, entry)
+
+    async def _acquire(self, proxy_url: Optional[str], impersonate: str) -> _PooledSession:
+        """获取 (或创建) 指定 key 的会话"""
+        self._stats["requests"] += 1
+
+        if proxy_url != self._current_proxy:
+            # 代理配置变化：旧代理下的会话全部失效
+            for (key_proxy, _), entry in self._sessions.items():
+                if key_proxy != proxy_url and not entry.stale:
+                    entry.stale = True
+                    self._stats["rebuilt"] += 1
+            self._current_proxy = proxy_url
+
+        await self._close_idle_sessions()
+
+        key = (proxy_url, impersonate)
+        entry = self._sessions.get(key)
+        if entry is not None and not entry.stale:
+            self._stats["reused"] += 1
+            return entry
+
+        session = AsyncSession(max_clients=self.max_clients, impersonate=impersonate)
+        # 不在共享会话中保存 Cookie，避免并发请求之间串用不同账号的 Cookie
+        session.cookies = _NoStoreCookies()
+        entry = _PooledSession(session)
+        self._sessions[key] = entry
+        self._stats["handshakes"] += 1
+        debug_logger.log_info(f"[SessionPool] 新建上游会话 (proxy={proxy_url or 'direct'}, impersonate={impersonate})")
+        return entry
+
+    async def _close_idle_sessions(self):
+        """关闭空闲超时或已失效且未被占用的会话"""
+        now = time.time()
+        for key, entry in list(self._sessions.items()):
+            if entry.in_use > 0:
+                continue
+            if entry.stale:
+                await self._close_entry(key[0], key[1], entry)
+            elif now - entry.last_used > self.idle_timeout:
+                await self._close_entry(key[0], key[1], entry)
+                self._stats["closed_idle"] += 1
+
+    async def _close_entry(self, proxy_url: Optional[str], impersonate: str, entry: _PooledSession):
+        """从池中移除并关闭会话"""
+        key = (proxy_url, impersonate)
+        if self._sessions.get(key) is entry:
+            del self._sessions[key]
+        try:
+            await entry.session.close()
+        except Exception as e:
+            debug_logger.log_warning(f"[SessionPool] 关闭会话失败: {str(e)}")
+
+    async def close(self):
+        """关闭所有会话 (应用关闭时调用)"""
+        for key, entry in list(self._sessions.items()):
+            await self._close_entry(key[0], key[1], entry)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取会话池统计信息"""
+        return {
+            "pool_size": len(self._sessions),
+            "in_use": sum(entry.in_use for entry in self._sessions.values()),
+            **self._stats
+        }
+
+
 class FlowClient:
     """VideoFX API客户端"""
 
@@ -31,6 +165,13 @@ class FlowClient:
         self.timeout = config.flow_timeout
         # 缓存每个账号的 User-Agent
         self._user_agent_cache = {}
+        # 上游长连接会话池
+        self.session_pool = UpstreamSessionPool()
+        # 参考图上传缓存: (project_id, sha256) -> media_id
+        self.upload_cache = UploadCache()
+        self._upload_flight = SingleFlight()
+        # API 打码客户端 (共享会话，异步轮询)
+        self.captcha_client = CaptchaClient()
 
         # Default "real browser" headers (Android Chrome style) to reduce upstream 4xx/5xx instability.
         # These will be applied as defaults (won't override caller-provided headers).
@@ -380,7 +521,7 @@ class FlowClient:
         start_time = time.time()
 
         try:
-            async with AsyncSession() as session:
+            async with self.session_pool.session(proxy_url, "chrome110") as session:
                 if method.upper() == "GET":
                     response = await session.get(
                         url,
@@ -452,6 +593,19 @@ class FlowClient:
 
             raise Exception(f"Flow API request failed: {error_msg}")
 
+    async def close(self):
+        """关闭上游会话池和打码会话 (应用关闭时调用)"""
+        await self.session_pool.close()
+        await self.captcha_client.close()
+
+    def get_session_pool_stats(self) -> Dict[str, Any]:
+        """获取上游会话池统计 (池大小/复用次数/握手次数)"""
+        return self.session_pool.get_stats()
+
+    def get_upload_cache_stats(self) -> Dict[str, Any]:
+        """获取参考图上传缓存统计"""
+        return {**self.upload_cache.get_stats(), "single_flight": self._upload_flight.get_stats()}
+
     # ========== 认证相关 (使用ST) ==========
 
     async def st_to_at(self, st: str) -> dict:
@@ -529,6 +683,7 @@ class FlowClient:
             use_st=True,
             st_token=st
         )
+        self.upload_cache.invalidate_project(project_id)
 
     # ========== 余额查询 (使用AT) ==========
 
@@ -616,12 +771,59 @@ class FlowClient:
             aspect_ratio: str = "IMAGE_ASPECT_RATIO_LANDSCAPE",
             project_id: Optional[str] = None
     ) -> str:
-        """上传图片,返回mediaId"""
+        """上传图片,返回mediaId
+
+        传入 project_id 时，同一项目中相同内容的图片只上传一次 (按 sha256 缓存 media_id)。
+        """
         if aspect_ratio.startswith("VIDEO_"):
             aspect_ratio = aspect_ratio.replace("VIDEO_", "IMAGE_")
 
+        if project_id and self.upload_cache.enabled:
+            # 按原始数据计算哈希，命中时连缩放 / 编码都可以跳过
+            digest = await media_workers.sha256(image_bytes)
+            media_id = self.upload_cache.get(project_id, digest, len(image_bytes))
+            if media_id:
+                debug_logger.log_info(f"[UPLOAD] 复用已上传的图片: {media_id} (sha256={digest[:12]})")
+                return media_id
+            # 同一张图片的并发上传合并为一次
+            return await self._upload_flight.do(
+                "upload_image", (project_id, digest),
+                self._upload_image_cached, at, image_bytes, aspect_ratio, project_id, digest
+            )
+
+        return await self._upload_image(at, image_bytes, aspect_ratio, project_id)
+
+    async def _upload_image_cached(
+            self,
+            at: str,
+            image_bytes: bytes,
+            aspect_ratio: str,
+            project_id: str,
+            digest: str
+    ) -> str:
+        """上传图片并记录到上传缓存"""
+        media_id, cacheable = await self._upload_image(at, image_bytes, aspect_ratio, project_id, with_source=True)
+        if media_id and cacheable:
+            self.upload_cache.put(project_id, digest, media_id)
+        return media_id
+
+    async def _upload_image(
+            self,
+            at: str,
+            image_bytes: bytes,
+            aspect_ratio: str,
+            project_id: Optional[str],
+            with_source: bool = False
+    ):
+        """实际上传图片
+
+        Returns:
+            mediaId；with_source 为 True 时返回 (mediaId, 是否来自新版项目接口)
+        """
+        # 超大图片先缩小，base64 编码同样在工作池中执行，不阻塞事件循环
+        image_bytes = await media_workers.prepare_upload_image(image_bytes)
         mime_type = self._detect_image_mime_type(image_bytes)
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        image_base64 = await media_workers.b64encode(image_bytes)
 
         # 优先尝试新版上传接口 (关键点：必须传入 project_id 才能成功获取新版 ID)
         if project_id:
@@ -655,7 +857,7 @@ class FlowClient:
                         or new_result.get("mediaGenerationId", {}).get("mediaGenerationId")
                 )
                 if media_id:
-                    return media_id
+                    return (media_id, True) if with_source else media_id
             except Exception as new_upload_error:
                 debug_logger.log_warning(f"[UPLOAD] 新版上传接口失败, 降级至旧接口: {new_upload_error}")
 
@@ -686,7 +888,8 @@ class FlowClient:
                 legacy_result.get("mediaGenerationId", {}).get("mediaGenerationId")
                 or legacy_result.get("media", {}).get("name")
         )
-        return media_id
+        # 旧接口的结果与 aspect_ratio 相关且不属于项目，不写入缓存
+        return (media_id, False) if with_source else media_id
 
     # ========== 图片生成 (使用AT) - 同步返回 ==========
 
@@ -1465,90 +1668,11 @@ class FlowClient:
             return None, None
 
     async def _get_api_captcha_token(self, method: str, project_id: str, action: str = "IMAGE_GENERATION") -> Optional[str]:
-        """通用API打码服务
-        
+        """通用API打码服务 (由 CaptchaClient 异步轮询，不阻塞事件循环)
+
         Args:
             method: 打码服务类型
             project_id: 项目ID
             action: reCAPTCHA action类型 (IMAGE_GENERATION 或 VIDEO_GENERATION)
         """
-        # 获取配置
-        if method == "yescaptcha":
-            client_key = config.yescaptcha_api_key
-            base_url = config.yescaptcha_base_url
-            task_type = "RecaptchaV3TaskProxylessM1"
-        elif method == "capmonster":
-            client_key = config.capmonster_api_key
-            base_url = config.capmonster_base_url
-            task_type = "RecaptchaV3TaskProxyless"
-        elif method == "ezcaptcha":
-            client_key = config.ezcaptcha_api_key
-            base_url = config.ezcaptcha_base_url
-            task_type = "ReCaptchaV3TaskProxylessS9"
-        elif method == "capsolver":
-            client_key = config.capsolver_api_key
-            base_url = config.capsolver_base_url
-            task_type = "ReCaptchaV3EnterpriseTaskProxyLess"
-        else:
-            debug_logger.log_error(f"[reCAPTCHA] Unknown API method: {method}")
-            return None
-
-        if not client_key:
-            debug_logger.log_info(f"[reCAPTCHA] {method} API key not configured, skipping")
-            return None
-
-        website_key = "6LdsFiUsAAAAAIjVDZcuLhaHiDn5nnHVXVRQGeMV"
-        website_url = f"https://labs.google/fx/tools/flow/project/{project_id}"
-        page_action = action
-
-        try:
-            async with AsyncSession() as session:
-                create_url = f"{base_url}/createTask"
-                create_data = {
-                    "clientKey": client_key,
-                    "task": {
-                        "websiteURL": website_url,
-                        "websiteKey": website_key,
-                        "type": task_type,
-                        "pageAction": page_action
-                    }
-                }
-
-                result = await session.post(create_url, json=create_data, impersonate="chrome110")
-                result_json = result.json()
-                task_id = result_json.get('taskId')
-
-                debug_logger.log_info(f"[reCAPTCHA {method}] created task_id: {task_id}")
-
-                if not task_id:
-                    error_desc = result_json.get('errorDescription', 'Unknown error')
-                    debug_logger.log_error(f"[reCAPTCHA {method}] Failed to create task: {error_desc}")
-                    return None
-
-                get_url = f"{base_url}/getTaskResult"
-                for i in range(40):
-                    get_data = {
-                        "clientKey": client_key,
-                        "taskId": task_id
-                    }
-                    result = await session.post(get_url, json=get_data, impersonate="chrome110")
-                    result_json = result.json()
-
-                    debug_logger.log_info(f"[reCAPTCHA {method}] polling #{i+1}: {result_json}")
-
-                    status = result_json.get('status')
-                    if status == 'ready':
-                        solution = result_json.get('solution', {})
-                        response = solution.get('gRecaptchaResponse')
-                        if response:
-                            debug_logger.log_info(f"[reCAPTCHA {method}] Token获取成功")
-                            return response
-
-                    time.sleep(3)
-
-                debug_logger.log_error(f"[reCAPTCHA {method}] Timeout waiting for token")
-                return None
-
-        except Exception as e:
-            debug_logger.log_error(f"[reCAPTCHA {method}] error: {str(e)}")
-            return None
+        return await self.captcha_client.solve(method, project_id, action)
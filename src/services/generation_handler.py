@@ -3,11 +3,17 @@ import asyncio
 import base64
 import json
 import time
+from datetime import timezone
 from typing import Optional, AsyncGenerator, List, Dict, Any
 from ..core.logger import debug_logger
 from ..core.config import config
 from ..core.models import Task, RequestLog
 from .file_cache import FileCache
+from .concurrency_manager import TokenLease
+from .video_status_poller import VideoStatusPoller
+from .poll_scheduler import PollScheduler
+from .request_log_queue import RequestLogQueue
+from .log_retention import LogRetentionService
 
 
 # Model configuration
@@ -676,9 +682,12 @@ class GenerationHandler:
         self.concurrency_manager = concurrency_manager
         self.file_cache = FileCache(
             cache_dir="tmp",
-            default_timeout=config.cache_timeout,
             proxy_manager=proxy_manager
         )
+        self.video_poller = VideoStatusPoller(flow_client)
+        self.poll_scheduler = PollScheduler(db)
+        self.request_log_queue = RequestLogQueue(db)
+        self.log_retention = LogRetentionService(db)
 
     async def check_token_availability(self, is_image: bool, is_video: bool) -> bool:
         """检查Token可用性
@@ -701,7 +710,8 @@ class GenerationHandler:
         model: str,
         prompt: str,
         images: Optional[List[bytes]] = None,
-        stream: bool = False
+        stream: bool = False,
+        job_id: Optional[str] = None
     ) -> AsyncGenerator:
         """统一生成入口
 
@@ -710,9 +720,11 @@ class GenerationHandler:
             prompt: 提示词
             images: 图片列表 (bytes格式)
             stream: 是否流式输出
+            job_id: 异步视频任务ID (来自 /v1/videos)，用于回写任务状态
         """
         start_time = time.time()
         token = None
+        lease = None
 
         # 1. 验证模型
         if model not in MODEL_CONFIG:
@@ -752,15 +764,16 @@ class GenerationHandler:
                 role="assistant"
             )
 
-        # 2. 选择Token
+        # 2. 选择Token并占用并发槽位 (并发已满时排队等待)
         debug_logger.log_info(f"[GENERATION] 正在选择可用Token...")
 
-        if generation_type == "image":
-            token = await self.load_balancer.select_token(for_image_generation=True, model=model)
-        else:
-            token = await self.load_balancer.select_token(for_video_generation=True, model=model)
+        async for item in self._reserve_token_with_queue(generation_type, model, stream):
+            if isinstance(item, TokenLease):
+                lease = item
+            else:
+                yield item
 
-        if not token:
+        if not lease:
             error_msg = self._get_no_token_error_message(generation_type)
             debug_logger.log_error(f"[GENERATION] {error_msg}")
             if stream:
@@ -768,6 +781,7 @@ class GenerationHandler:
             yield self._create_error_response(error_msg)
             return
 
+        token = lease.token
         debug_logger.log_info(f"[GENERATION] 已选择Token: {token.id} ({token.email})")
 
         try:
@@ -797,13 +811,13 @@ class GenerationHandler:
             if generation_type == "image":
                 debug_logger.log_info(f"[GENERATION] 开始图片生成流程...")
                 async for chunk in self._handle_image_generation(
-                    token, project_id, model_config, prompt, images, stream
+                    token, project_id, model_config, prompt, images, stream, lease
                 ):
                     yield chunk
             else:  # video
                 debug_logger.log_info(f"[GENERATION] 开始视频生成流程...")
                 async for chunk in self._handle_video_generation(
-                    token, project_id, model_config, prompt, images, stream
+                    token, project_id, model_config, prompt, images, stream, job_id, lease
                 ):
                     yield chunk
 
@@ -818,6 +832,8 @@ class GenerationHandler:
 
             # 7. 记录成功日志
             duration = time.time() - start_time
+            # 不含排队时间的耗时，用于 ewma_latency 选择策略
+            self.load_balancer.record_latency(token.id, generation_type, time.time() - lease.acquired_at)
 
             # 构建响应数据，包含生成的URL
             response_data = {
@@ -862,6 +878,69 @@ class GenerationHandler:
                 duration
             )
 
+        finally:
+            # 生成流程提前退出时确保释放槽位
+            await lease.release()
+
+    async def _reserve_token_with_queue(
+        self,
+        generation_type: str,
+        model: str,
+        stream: bool
+    ) -> AsyncGenerator:
+        """预占Token槽位，所有Token并发已满时按到达顺序排队直到模型的截止时间
+
+        依次产出排队进度 (流式块)，成功时最后产出 TokenLease。
+        """
+        is_image = (generation_type == "image")
+
+        async def try_reserve() -> Optional[TokenLease]:
+            return await self.load_balancer.reserve_token(
+                for_image_generation=is_image,
+                for_video_generation=not is_image,
+                model=model
+            )
+
+        # 已有请求在排队时不插队
+        if self.concurrency_manager.queue_depth(generation_type) == 0:
+            lease = await try_reserve()
+            if lease:
+                yield lease
+                return
+
+        deadline = config.get_queue_timeout(model, generation_type)
+        if deadline <= 0 or not self.token_manager.get_eligible_tokens(generation_type):
+            return
+
+        ticket = self.concurrency_manager.enqueue(generation_type, model)
+        lease = None
+        last_position = None
+        try:
+            while True:
+                position = self.concurrency_manager.queue_position(ticket)
+                if position == 1:
+                    lease = await try_reserve()
+                    if lease:
+                        break
+
+                remaining = deadline - ticket.waited
+                if remaining <= 0:
+                    debug_logger.log_warning(f"[QUEUE] 排队超时 ({deadline}s) - 模型: {model}")
+                    break
+
+                if stream and position != last_position:
+                    yield self._create_stream_chunk(f"所有Token繁忙，排队中 (第 {position} 位)...\n")
+                    last_position = position
+
+                # 槽位释放时被唤醒；定期醒来以便新增/启用的Token也能被使用
+                await self.concurrency_manager.wait_turn(ticket, min(remaining, 5))
+        finally:
+            self.concurrency_manager.leave(ticket, admitted=lease is not None)
+
+        if lease:
+            debug_logger.log_info(f"[QUEUE] 排队 {ticket.waited:.1f}s 后获得Token {lease.token_id}")
+            yield lease
+
     def _get_no_token_error_message(self, generation_type: str) -> str:
         """获取无可用Token时的详细错误信息"""
         if generation_type == "image":
@@ -869,6 +948,59 @@ class GenerationHandler:
         else:
             return "没有可用的Token进行视频生成。所有Token都处于禁用、冷却、配额耗尽或已过期状态。"
 
+    async def _upload_images(
+        self,
+        at: str,
+        images: List[bytes],
+        aspect_ratio: str,
+        project_id: Optional[str],
+        media_ids: List[Optional[str]]
+    ) -> AsyncGenerator[int, None]:
+        """并行上传多张图片 (最多 config.flow_upload_concurrency 张同时上传)
+
+        media_ids[i] 写入第 i 张图片的 mediaId，每完成一张 yield 已完成数量，
+        供调用方输出进度。任一上传失败时取消其余上传并抛出异常。
+
+        Args:
+            at: Access Token
+            images: 图片数据列表
+            aspect_ratio: 宽高比
+            project_id: 项目ID
+            media_ids: 与 images 等长的结果列表
+        """
+        semaphore = asyncio.Semaphore(max(1, config.flow_upload_concurrency))
+
+        async def upload(idx: int, image_bytes: bytes):
+            async with semaphore:
+                media_ids[idx] = await self.flow_client.upload_image(
+                    at, image_bytes, aspect_ratio, project_id=project_id
+                )
+
+        tasks = [asyncio.create_task(upload(idx, image_bytes)) for idx, image_bytes in enumerate(images)]
+        try:
+            for done, finished in enumerate(asyncio.as_completed(tasks), start=1):
+                await finished
+                yield done
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            # 回收被取消 / 失败的任务，避免 "exception was never retrieved"
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _upload_all(
+        self,
+        at: str,
+        images: List[bytes],
+        aspect_ratio: str,
+        project_id: Optional[str]
+    ) -> List[str]:
+        """并行上传多张图片并按输入顺序返回 mediaId (不需要逐张输出进度时使用)"""
+        media_ids: List[Optional[str]] = [None] * len(images)
+        async for _ in self._upload_images(at, images, aspect_ratio, project_id, media_ids):
+            pass
+        return media_ids
+
     async def _handle_image_generation(
         self,
         token,
@@ -876,15 +1008,14 @@ class GenerationHandler:
         model_config: dict,
         prompt: str,
         images: Optional[List[bytes]],
-        stream: bool
+        stream: bool,
+        lease=None
     ) -> AsyncGenerator:
-        """处理图片生成 (同步返回)"""
+        """处理图片生成 (同步返回)
 
-        # 获取并发槽位
-        if self.concurrency_manager:
-            if not await self.concurrency_manager.acquire_image(token.id):
-                yield self._create_error_response("图片并发限制已达上限")
-                return
+        Args:
+            lease: 选择Token时已占用的并发槽位，生成结束后释放
+        """
 
         try:
             # 上传图片 (如果有)
@@ -893,20 +1024,21 @@ class GenerationHandler:
                 if stream:
                     yield self._create_stream_chunk(f"上传 {len(images)} 张参考图片...\n")
 
-                # 支持多图输入
-                for idx, image_bytes in enumerate(images):
-                    media_id = await self.flow_client.upload_image(
-                        token.at,
-                        image_bytes,
-                        model_config["aspect_ratio"],
-                        project_id=project_id  # <===== 致命修复：必须把 project_id 传进去！
-                    )
-                    image_inputs.append({
-                        "name": media_id,
-                        "imageInputType": "IMAGE_INPUT_TYPE_REFERENCE"
-                    })
+                # 支持多图输入 (并行上传，结果保持输入顺序)
+                media_ids: List[Optional[str]] = [None] * len(images)
+                async for done in self._upload_images(
+                    token.at,
+                    images,
+                    model_config["aspect_ratio"],
+                    project_id,  # <===== 致命修复：必须把 project_id 传进去！
+                    media_ids
+                ):
                     if stream:
-                        yield self._create_stream_chunk(f"已上传第 {idx + 1}/{len(images)} 张图片\n")
+                        yield self._create_stream_chunk(f"已上传第 {done}/{len(images)} 张图片\n")
+                image_inputs = [
+                    {"name": media_id, "imageInputType": "IMAGE_INPUT_TYPE_REFERENCE"}
+                    for media_id in media_ids
+                ]
 
             # 调用生成API
             if stream:
@@ -1055,8 +1187,8 @@ class GenerationHandler:
 
         finally:
             # 释放并发槽位
-            if self.concurrency_manager:
-                await self.concurrency_manager.release_image(token.id)
+            if lease:
+                await lease.release()
 
     async def _handle_video_generation(
         self,
@@ -1065,15 +1197,15 @@ class GenerationHandler:
         model_config: dict,
         prompt: str,
         images: Optional[List[bytes]],
-        stream: bool
+        stream: bool,
+        job_id: Optional[str] = None,
+        lease=None
     ) -> AsyncGenerator:
-        """处理视频生成 (异步轮询)"""
+        """处理视频生成 (异步轮询)
 
-        # 获取并发槽位
-        if self.concurrency_manager:
-            if not await self.concurrency_manager.acquire_video(token.id):
-                yield self._create_error_response("视频并发限制已达上限")
-                return
+        Args:
+            lease: 选择Token时已占用的并发槽位，生成结束后释放
+        """
 
         try:
             # 获取模型类型和配置
@@ -1169,11 +1301,8 @@ class GenerationHandler:
                     # 2张图: 首帧+尾帧
                     if stream:
                         yield self._create_stream_chunk("上传首帧和尾帧图片...\n")
-                    start_media_id = await self.flow_client.upload_image(
-                        token.at, images[0], model_config["aspect_ratio"],project_id=project_id
-                    )
-                    end_media_id = await self.flow_client.upload_image(
-                        token.at, images[1], model_config["aspect_ratio"],project_id=project_id
+                    start_media_id, end_media_id = await self._upload_all(
+                        token.at, images[:2], model_config["aspect_ratio"], project_id
                     )
                     debug_logger.log_info(f"[I2V] 上传首尾帧: {start_media_id}, {end_media_id}")
 
@@ -1182,14 +1311,17 @@ class GenerationHandler:
                 if stream:
                     yield self._create_stream_chunk(f"上传 {image_count} 张参考图片...\n")
 
-                for idx, img in enumerate(images):  # 上传所有图片,不限制数量
-                    media_id = await self.flow_client.upload_image(
-                        token.at, img, model_config["aspect_ratio"],project_id=project_id
-                    )
-                    reference_images.append({
-                        "imageUsageType": "IMAGE_USAGE_TYPE_ASSET",
-                        "mediaId": media_id
-                    })
+                # 上传所有图片,不限制数量 (并行上传，结果保持输入顺序)
+                media_ids: List[Optional[str]] = [None] * image_count
+                async for done in self._upload_images(
+                    token.at, images, model_config["aspect_ratio"], project_id, media_ids
+                ):
+                    if stream:
+                        yield self._create_stream_chunk(f"已上传第 {done}/{image_count} 张图片\n")
+                reference_images = [
+                    {"imageUsageType": "IMAGE_USAGE_TYPE_ASSET", "mediaId": media_id}
+                    for media_id in media_ids
+                ]
                 debug_logger.log_info(f"[R2V] 上传了 {len(reference_images)} 张参考图片")
 
             # ========== 调用生成API ==========
@@ -1271,6 +1403,8 @@ class GenerationHandler:
                 scene_id=scene_id
             )
             await self.db.create_task(task)
+            if job_id:
+                await self.db.update_video_job(job_id, status="processing", task_id=task_id, token_id=token.id)
 
             # 轮询结果
             if stream:
@@ -1279,13 +1413,16 @@ class GenerationHandler:
             # 检查是否需要放大
             upsample_config = model_config.get("upsample")
 
-            async for chunk in self._poll_video_result(token, project_id, operations, stream, upsample_config):
+            async for chunk in self._poll_video_result(
+                token, project_id, operations, stream, upsample_config,
+                model_key=model_config["model_key"], prompt=prompt, job_id=job_id
+            ):
                 yield chunk
 
         finally:
             # 释放并发槽位
-            if self.concurrency_manager:
-                await self.concurrency_manager.release_video(token.id)
+            if lease:
+                await lease.release()
 
     async def _poll_video_result(
         self,
@@ -1293,38 +1430,59 @@ class GenerationHandler:
         project_id: str,
         operations: List[Dict],
         stream: bool,
-        upsample_config: Optional[Dict] = None
+        upsample_config: Optional[Dict] = None,
+        model_key: Optional[str] = None,
+        prompt: str = "",
+        job_id: Optional[str] = None,
+        elapsed_offset: float = 0.0
     ) -> AsyncGenerator:
         """轮询视频生成结果
         
         Args:
             upsample_config: 放大配置 {"resolution": "VIDEO_RESOLUTION_4K", "model_key": "veo_3_1_upsampler_4k"}
+            model_key: 上游模型 key，用于按模型学习到的耗时分布调度轮询
+            prompt: 原始提示词（记录放大任务时使用）
+            job_id: 异步视频任务ID，完成/失败时回写
+            elapsed_offset: 任务在本次轮询开始前已运行的时间(秒)，重启后恢复轮询时使用
         """
 
-        max_attempts = config.max_poll_attempts
-        poll_interval = config.poll_interval
+        # 总轮询时长预算：max_poll_attempts * poll_interval
+        budget = config.max_poll_attempts * config.poll_interval
         
-        # 如果需要放大，轮询次数加倍（放大可能需要 30 分钟）
+        # 如果需要放大，预算加倍（放大可能需要 30 分钟）
         if upsample_config:
-            max_attempts = max_attempts * 3  # 放大需要更长时间
+            budget = budget * 3  # 放大需要更长时间
+
+        start_time = time.time()
+        attempt = 0
+        consecutive_errors = 0
+        last_progress_at = None
+        progress_update_interval = 20  # 每20秒报告一次进度
+
+        while True:
+            elapsed = time.time() - start_time
+            if elapsed >= budget:
+                break
 
-        for attempt in range(max_attempts):
-            await asyncio.sleep(poll_interval)
+            delay = self.poll_scheduler.next_delay(model_key, elapsed + elapsed_offset, consecutive_errors)
+            await asyncio.sleep(min(delay, budget - elapsed))
+            attempt += 1
 
             try:
-                result = await self.flow_client.check_video_status(token.at, operations)
-                checked_operations = result.get("operations", [])
+                # 通过批量轮询服务查询，同一 AT 下的所有在途任务合并为一次上游调用
+                operation = await self.video_poller.check(token.at, operations[0])
+                consecutive_errors = 0
 
-                if not checked_operations:
+                if not operation:
                     continue
 
-                operation = checked_operations[0]
                 status = operation.get("status")
 
-                # 状态更新 - 每20秒报告一次 (poll_interval=3秒, 20秒约7次轮询)
-                progress_update_interval = 7  # 每7次轮询 = 21秒
-                if stream and attempt % progress_update_interval == 0:  # 每20秒报告一次
-                    progress = min(int((attempt / max_attempts) * 100), 95)
+                # 状态更新
+                now = time.time()
+                if stream and (last_progress_at is None or now - last_progress_at >= progress_update_interval):
+                    last_progress_at = now
+                    progress = self.poll_scheduler.estimate_progress(model_key, now - start_time + elapsed_offset, budget)
                     yield self._create_stream_chunk(f"生成进度: {progress}%\n")
 
                 # 检查状态
@@ -1361,10 +1519,31 @@ class GenerationHandler:
                             if upsample_operations:
                                 if stream:
                                     yield self._create_stream_chunk("放大任务已提交，继续轮询...\n")
+
+                                # 原始视频已完成；放大任务单独记录，便于学习放大模型的耗时分布
+                                await self.db.update_task(
+                                    operation["operation"]["name"],
+                                    status="completed",
+                                    progress=100,
+                                    result_urls=[video_url],
+                                    completed_at=time.time()
+                                )
+                                upsample_operation = upsample_operations[0]
+                                await self.db.create_task(Task(
+                                    task_id=upsample_operation["operation"]["name"],
+                                    token_id=token.id,
+                                    model=upsample_config["model_key"],
+                                    prompt=prompt,
+                                    status="processing",
+                                    scene_id=upsample_operation.get("sceneId")
+                                ))
+                                if job_id:
+                                    await self.db.update_video_job(job_id, task_id=upsample_operation["operation"]["name"])
                                 
                                 # 递归轮询放大结果（不再放大）
                                 async for chunk in self._poll_video_result(
-                                    token, project_id, upsample_operations, stream, None
+                                    token, project_id, upsample_operations, stream, None,
+                                    model_key=upsample_config["model_key"], prompt=prompt, job_id=job_id
                                 ):
                                     yield chunk
                                 return
@@ -1405,6 +1584,13 @@ class GenerationHandler:
                         result_urls=[local_url],
                         completed_at=time.time()
                     )
+                    if job_id:
+                        await self.db.update_video_job(
+                            job_id,
+                            status="completed",
+                            result_url=local_url,
+                            completed_at=time.time()
+                        )
 
                     # 存储URL用于日志记录
                     self._last_generated_url = local_url
@@ -1439,6 +1625,13 @@ class GenerationHandler:
                     
                     # 返回友好的错误消息，提示用户重试
                     friendly_error = f"视频生成失败: {error_message}，请重试"
+                    if job_id:
+                        await self.db.update_video_job(
+                            job_id,
+                            status="failed",
+                            error_message=friendly_error,
+                            completed_at=time.time()
+                        )
                     if stream:
                         yield self._create_stream_chunk(f"❌ {friendly_error}\n")
                     yield self._create_error_response(friendly_error)
@@ -1446,15 +1639,62 @@ class GenerationHandler:
 
                 elif status.startswith("MEDIA_GENERATION_STATUS_ERROR"):
                     # 其他错误状态
+                    await self.db.update_task(
+                        operation["operation"]["name"],
+                        status="failed",
+                        error_message=status,
+                        completed_at=time.time()
+                    )
                     yield self._create_error_response(f"视频生成失败: {status}")
                     return
 
             except Exception as e:
+                consecutive_errors += 1
                 debug_logger.log_error(f"Poll error: {str(e)}")
                 continue
 
         # 超时
-        yield self._create_error_response(f"视频生成超时 (已轮询{max_attempts}次)")
+        await self.db.update_task(
+            operations[0]["operation"]["name"],
+            status="failed",
+            error_message="timeout",
+            completed_at=time.time()
+        )
+        yield self._create_error_response(f"视频生成超时 (已轮询{attempt}次)")
+
+    async def resume_video_task(
+        self,
+        token,
+        task: Task,
+        upsample_config: Optional[Dict] = None,
+        job_id: Optional[str] = None
+    ) -> AsyncGenerator:
+        """恢复轮询重启前仍在处理中的视频任务 (非流式输出)
+
+        Args:
+            token: 任务所属 Token (AT 需有效)
+            task: tasks 表中 status='processing' 的任务
+            upsample_config: 原始模型的放大配置（仅当该任务是放大前的原始视频时传入）
+            job_id: 关联的异步视频任务ID
+        """
+        operations = [{
+            "operation": {"name": task.task_id},
+            "sceneId": task.scene_id,
+            "status": "MEDIA_GENERATION_STATUS_PENDING"
+        }]
+        elapsed_offset = 0.0
+        if task.created_at:
+            created_at = task.created_at
+            if created_at.tzinfo is None:
+                # created_at 由 SQLite CURRENT_TIMESTAMP 写入，为 UTC 时间
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            elapsed_offset = max(0.0, time.time() - created_at.timestamp())
+
+        async for chunk in self._poll_video_result(
+            token, token.current_project_id, operations, False, upsample_config,
+            model_key=task.model, prompt=task.prompt, job_id=job_id, elapsed_offset=elapsed_offset
+        ):
+            yield chunk
 
     # ========== 响应格式化 ==========
 
@@ -1557,7 +1797,7 @@ class GenerationHandler:
         status_code: int,
         duration: float
     ):
-        """记录请求到数据库"""
+        """记录请求到数据库 (放入日志队列，由后台批量写入)"""
         try:
             log = RequestLog(
                 token_id=token_id,
@@ -1567,7 +1807,7 @@ class GenerationHandler:
                 status_code=status_code,
                 duration=duration
             )
-            await self.db.add_request_log(log)
+            await self.request_log_queue.put(log)
         except Exception as e:
             # 日志记录失败不影响主流程
             debug_logger.log_error(f"Failed to log request: {e}")
@@ -1,17 +1,90 @@
 """Load balancing module for Flow2API"""
 import random
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
+from ..core.config import config
 from ..core.models import Token
-from .concurrency_manager import ConcurrencyManager
+from .concurrency_manager import ConcurrencyManager, TokenLease
 from ..core.logger import debug_logger
 
+# 可选的Token选择策略
+STRATEGIES = ("random", "least_outstanding", "power_of_two", "ewma_latency", "credits_weighted")
+
 
 class LoadBalancer:
-    """Token load balancer with random selection"""
+    """Token load balancer with pluggable selection strategies
+
+    策略按生成类型 (image/video) 分别配置:
+    - random: 随机选择
+    - least_outstanding: 选择进行中请求最少的Token
+    - power_of_two: 随机抽取两个Token，选择进行中请求较少的一个
+    - ewma_latency: 按 EWMA 耗时 x (进行中请求 + 1) 选择预计最快完成的Token
+    - credits_weighted: 按剩余 credits 加权随机
+    """
 
-    def __init__(self, token_manager, concurrency_manager: Optional[ConcurrencyManager] = None):
+    def __init__(self, token_manager, concurrency_manager: Optional[ConcurrencyManager] = None, ewma_alpha: float = 0.3):
         self.token_manager = token_manager
         self.concurrency_manager = concurrency_manager
+        self.ewma_alpha = ewma_alpha
+        # (kind, token_id) -> EWMA 成功请求耗时(秒)
+        self._latency: Dict[Tuple[str, int], float] = {}
+
+    def record_latency(self, token_id: int, kind: str, seconds: float):
+        """记录一次成功请求的耗时，用于 ewma_latency 策略"""
+        key = (kind, token_id)
+        previous = self._latency.get(key)
+        if previous is None:
+            self._latency[key] = seconds
+        else:
+            self._latency[key] = self.ewma_alpha * seconds + (1 - self.ewma_alpha) * previous
+
+    def get_latency_stats(self) -> Dict[str, Dict[int, float]]:
+        """获取各Token的 EWMA 耗时"""
+        stats = {"image": {}, "video": {}}
+        for (kind, token_id), seconds in self._latency.items():
+            stats[kind][token_id] = round(seconds, 2)
+        return stats
+
+    def _in_flight(self, kind: str, token: Token) -> int:
+        return self.concurrency_manager.in_flight(kind, token.id) if self.concurrency_manager else 0
+
+    def _choose_least_outstanding(self, kind: str, tokens: List[Token]) -> Token:
+        fewest = min(self._in_flight(kind, t) for t in tokens)
+        return random.choice([t for t in tokens if self._in_flight(kind, t) == fewest])
+
+    def _choose_power_of_two(self, kind: str, tokens: List[Token]) -> Token:
+        if len(tokens) < 2:
+            return tokens[0]
+        first, second = random.sample(tokens, 2)
+        return first if self._in_flight(kind, first) <= self._in_flight(kind, second) else second
+
+    def _choose_ewma_latency(self, kind: str, tokens: List[Token]) -> Token:
+        known = [self._latency[(kind, t.id)] for t in tokens if (kind, t.id) in self._latency]
+        # 尚无耗时记录的Token按已知最快值估计，保证新Token也会被尝试
+        default = min(known) if known else 1.0
+
+        def expected_cost(token: Token) -> float:
+            return self._latency.get((kind, token.id), default) * (self._in_flight(kind, token) + 1)
+
+        best = min(expected_cost(t) for t in tokens)
+        return random.choice([t for t in tokens if expected_cost(t) == best])
+
+    def _choose_credits_weighted(self, kind: str, tokens: List[Token]) -> Token:
+        weights = [max(t.credits or 0, 0) + 1 for t in tokens]
+        return random.choices(tokens, weights=weights, k=1)[0]
+
+    def get_chooser(self, kind: str) -> Callable[[List[Token]], Token]:
+        """获取指定生成类型当前配置的选择函数"""
+        strategy = config.get_load_balance_strategy(kind)
+        choosers = {
+            "least_outstanding": self._choose_least_outstanding,
+            "power_of_two": self._choose_power_of_two,
+            "ewma_latency": self._choose_ewma_latency,
+            "credits_weighted": self._choose_credits_weighted,
+        }
+        chooser = choosers.get(strategy)
+        if not chooser:
+            return random.choice
+        return lambda tokens: chooser(kind, tokens)
 
     async def select_token(
         self,
@@ -32,47 +105,58 @@ class LoadBalancer:
         """
         debug_logger.log_info(f"[LOAD_BALANCER] 开始选择Token (图片生成={for_image_generation}, 视频生成={for_video_generation}, 模型={model})")
 
-        active_tokens = await self.token_manager.get_active_tokens()
-        debug_logger.log_info(f"[LOAD_BALANCER] 获取到 {len(active_tokens)} 个活跃Token")
-
-        if not active_tokens:
+        # 从内存注册表获取候选Token (已启用且对应功能已开启，无数据库访问)
+        if for_image_generation:
+            capability = "image"
+        elif for_video_generation:
+            capability = "video"
+        else:
+            capability = None
+        candidates = self.token_manager.get_eligible_tokens(capability)
+        debug_logger.log_info(f"[LOAD_BALANCER] 获取到 {len(candidates)} 个候选Token")
+
+        if not candidates:
             debug_logger.log_info(f"[LOAD_BALANCER] ❌ 没有活跃的Token")
             return None
 
-        # Filter tokens based on generation type
+        # Filter tokens based on AT freshness and concurrency
         available_tokens = []
+        stale_tokens = []  # AT 需要刷新但并发未满的Token
         filtered_reasons = {}  # 记录过滤原因
 
-        for token in active_tokens:
-            # Check if token has valid AT (not expired)
-            if not await self.token_manager.is_at_valid(token.id):
-                filtered_reasons[token.id] = "AT无效或已过期"
-                continue
-
-            # Filter for image generation
-            if for_image_generation:
-                if not token.image_enabled:
-                    filtered_reasons[token.id] = "图片生成已禁用"
-                    continue
-
-                # Check concurrency limit
-                if self.concurrency_manager and not await self.concurrency_manager.can_use_image(token.id):
+        for token in candidates:
+            # Check concurrency limit
+            if self.concurrency_manager:
+                if for_image_generation and not await self.concurrency_manager.can_use_image(token.id):
                     filtered_reasons[token.id] = "图片并发已满"
                     continue
-
-            # Filter for video generation
-            if for_video_generation:
-                if not token.video_enabled:
-                    filtered_reasons[token.id] = "视频生成已禁用"
-                    continue
-
-                # Check concurrency limit
-                if self.concurrency_manager and not await self.concurrency_manager.can_use_video(token.id):
+                if for_video_generation and not await self.concurrency_manager.can_use_video(token.id):
                     filtered_reasons[token.id] = "视频并发已满"
                     continue
 
+            # AT 即将过期的Token在后台刷新，本次请求优先使用AT有效的Token
+            if not self.token_manager.is_at_fresh(token):
+                filtered_reasons[token.id] = "AT无效或即将过期 (后台刷新)"
+                stale_tokens.append(token)
+                continue
+
             available_tokens.append(token)
 
+        if available_tokens:
+            for token in stale_tokens:
+                self.token_manager.schedule_refresh(token.id)
+        else:
+            # 没有AT有效的Token时才在请求路径上同步刷新
+            random.shuffle(stale_tokens)
+            for token in stale_tokens:
+                if await self.token_manager.is_at_valid(token.id):
+                    refreshed = await self.token_manager.get_token(token.id)
+                    if refreshed and refreshed.is_active:
+                        filtered_reasons.pop(token.id, None)
+                        available_tokens.append(refreshed)
+                        break
+                filtered_reasons[token.id] = "AT无效或已过期"
+
         # 输出过滤信息
         if filtered_reasons:
             debug_logger.log_info(f"[LOAD_BALANCER] 已过滤Token:")
@@ -87,3 +171,65 @@ class LoadBalancer:
         selected = random.choice(available_tokens)
         debug_logger.log_info(f"[LOAD_BALANCER] ✅ 已选择Token {selected.id} ({selected.email}) - 余额: {selected.credits}")
         return selected
+
+    async def reserve_token(
+        self,
+        for_image_generation: bool = False,
+        for_video_generation: bool = False,
+        model: Optional[str] = None
+    ) -> Optional[TokenLease]:
+        """
+        Select a token and take one of its concurrency slots in a single step
+
+        选择与占用槽位在 ConcurrencyManager 的锁内完成，突发请求不会同时选中
+        同一个已满的Token。返回的租约需通过 release() 或 async with 释放。
+
+        Args:
+            for_image_generation: Reserve an image generation slot
+            for_video_generation: Reserve a video generation slot
+            model: Model name (used for logging)
+
+        Returns:
+            TokenLease or None if no token has free capacity
+        """
+        if not self.concurrency_manager:
+            raise RuntimeError("reserve_token requires a concurrency manager")
+
+        kind = "image" if for_image_generation else "video"
+        debug_logger.log_info(f"[LOAD_BALANCER] 开始预占Token槽位 (类型={kind}, 模型={model}, 策略={config.get_load_balance_strategy(kind)})")
+
+        candidates = self.token_manager.get_eligible_tokens(kind)
+        if not candidates:
+            debug_logger.log_info(f"[LOAD_BALANCER] ❌ 没有活跃的Token")
+            return None
+
+        fresh_tokens = [token for token in candidates if self.token_manager.is_at_fresh(token)]
+        stale_tokens = [token for token in candidates if not self.token_manager.is_at_fresh(token)]
+
+        choose = self.get_chooser(kind)
+        lease = await self.concurrency_manager.reserve(fresh_tokens, kind, choose)
+        if lease:
+            for token in stale_tokens:
+                self.token_manager.schedule_refresh(token.id)
+            debug_logger.log_info(f"[LOAD_BALANCER] ✅ 已预占Token {lease.token_id} ({lease.token.email}) - 余额: {lease.token.credits}")
+            return lease
+
+        # 没有AT有效且有空闲槽位的Token时才在请求路径上同步刷新
+        random.shuffle(stale_tokens)
+        for token in stale_tokens:
+            if kind == "image" and not await self.concurrency_manager.can_use_image(token.id):
+                continue
+            if kind == "video" and not await self.concurrency_manager.can_use_video(token.id):
+                continue
+            if not await self.token_manager.is_at_valid(token.id):
+                debug_logger.log_info(f"[LOAD_BALANCER]   - Token {token.id}: AT无效或已过期")
+                continue
+            refreshed = await self.token_manager.get_token(token.id)
+            if refreshed and refreshed.is_active:
+                lease = await self.concurrency_manager.reserve([refreshed], kind, choose)
+                if lease:
+                    debug_logger.log_info(f"[LOAD_BALANCER] ✅ 已预占Token {lease.token_id} ({lease.token.email}) - 余额: {lease.token.credits}")
+                    return lease
+
+        debug_logger.log_info(f"[LOAD_BALANCER] ❌ 没有可用的Token (类型={kind}, 候选={len(candidates)}, 并发已满或AT无效)")
+        return None
@@ -0,0 +1,161 @@
+"""Time-based retention and archival for request logs"""
+import asyncio
+import gzip
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+class LogRetentionService:
+    """请求日志保留策略
+
+    定期删除超过 retention_days 天的 request_logs。每次只删除 batch_size 条
+    并在批次之间让出写锁，避免长时间锁库；开启归档时先把待删除的行以
+    JSONL 格式追加到 gzip 文件中再删除。retention_days 为 0 时不清理。
+    """
+
+    def __init__(
+        self,
+        db,
+        retention_days: Optional[int] = None,
+        interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        batch_pause: float = 0.05,
+        archive_enabled: Optional[bool] = None,
+        archive_dir: Optional[str] = None
+    ):
+        """
+        Args:
+            db: Database instance
+            retention_days: 日志保留天数 (0 表示不清理)
+            interval: 清理间隔(秒)
+            batch_size: 每个删除事务的最大行数
+            batch_pause: 批次之间的间隔(秒)，让其他写入有机会获取写锁
+            archive_enabled: 删除前是否归档
+            archive_dir: 归档目录
+        """
+        self.db = db
+        self.retention_days = retention_days if retention_days is not None else config.request_log_retention_days
+        self.interval = interval if interval is not None else config.request_log_cleanup_interval
+        self.batch_size = batch_size if batch_size is not None else config.request_log_cleanup_batch_size
+        self.batch_pause = batch_pause
+        self.archive_enabled = archive_enabled if archive_enabled is not None else config.request_log_archive_enabled
+        self.archive_dir = Path(archive_dir or config.request_log_archive_dir)
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._stats = {
+            "runs": 0,
+            "deleted": 0,
+            "archived": 0,
+            "failed": 0,
+            "last_run_at": None,
+            "last_run_seconds": 0.0,
+            "last_archive_file": None
+        }
+
+    async def start(self):
+        """Start periodic cleanup task"""
+        if self._task is None and self.retention_days > 0:
+            self._task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        """Stop periodic cleanup task"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _cleanup_loop(self):
+        """Background task: run cleanup every interval seconds"""
+        while True:
+            try:
+                await self.run_once()
+                await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self._stats["failed"] += 1
+                debug_logger.log_error(
+                    error_message=f"Request log cleanup error: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+                await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """按批删除 (并归档) 所有过期日志
+
+        Returns:
+            删除的行数
+        """
+        if self.retention_days <= 0:
+            return 0
+
+        async with self._lock:
+            started = time.time()
+            archive_path = None
+            deleted = 0
+
+            while True:
+                if self.archive_enabled:
+                    rows = await self.db.get_expired_request_logs(self.retention_days, self.batch_size)
+                    if not rows:
+                        break
+                    if archive_path is None:
+                        archive_path = self._new_archive_path()
+                    await asyncio.to_thread(self._append_archive, archive_path, rows)
+                    self._stats["archived"] += len(rows)
+                    count = await self.db.delete_request_logs([row["id"] for row in rows])
+                    batch_full = len(rows) >= self.batch_size
+                else:
+                    count = await self.db.delete_expired_request_logs(self.retention_days, self.batch_size)
+                    batch_full = count >= self.batch_size
+
+                deleted += count
+                if not batch_full:
+                    break
+                await asyncio.sleep(self.batch_pause)
+
+            elapsed = time.time() - started
+            self._stats["runs"] += 1
+            self._stats["deleted"] += deleted
+            self._stats["last_run_at"] = datetime.now().isoformat(timespec="seconds")
+            self._stats["last_run_seconds"] = round(elapsed, 3)
+            if archive_path is not None:
+                self._stats["last_archive_file"] = str(archive_path)
+            if deleted:
+                debug_logger.log_info(
+                    f"[LOG_RETENTION] 已删除 {deleted} 条超过 {self.retention_days} 天的请求日志 "
+                    f"(耗时 {elapsed:.2f}s{', 已归档到 ' + str(archive_path) if archive_path else ''})"
+                )
+            return deleted
+
+    def _new_archive_path(self) -> Path:
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        return self.archive_dir / f"request_logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl.gz"
+
+    @staticmethod
+    def _append_archive(path: Path, rows: List[Dict[str, Any]]):
+        """以 JSONL 格式追加到 gzip 文件 (在线程中执行)"""
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str))
+                f.write("\n")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取清理统计信息"""
+        return {
+            "retention_days": self.retention_days,
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "archive_enabled": self.archive_enabled,
+            "archive_dir": str(self.archive_dir),
+            **self._stats
+        }
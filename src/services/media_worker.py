@@ -0,0 +1,204 @@
+"""Off-loop worker pool for CPU-bound media work (base64, hashing, transcoding)"""
+import asyncio
+import base64
+import hashlib
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+from ..core.config import config
+from ..core.logger import debug_logger
+
+WORKER_MODES = ("thread", "process")
+
+
+# binascii 在一次调用内不释放 GIL：分块处理，让事件循环线程能在块之间运行
+_B64_CHUNK = 3 * 256 * 1024  # 编码块大小 (3 的倍数)，解码块为对应的 4/3 倍
+
+
+# 以下为模块级函数，进程池模式下需要可被 pickle
+
+def _b64encode(data: bytes) -> str:
+    if len(data) <= _B64_CHUNK:
+        return base64.b64encode(data).decode("utf-8")
+    view = memoryview(data)
+    return "".join(
+        base64.b64encode(view[i:i + _B64_CHUNK]).decode("utf-8")
+        for i in range(0, len(data), _B64_CHUNK)
+    )
+
+
+def _b64decode(data: str) -> bytes:
+    step = _B64_CHUNK // 3 * 4
+    if len(data) <= step or len(data) % 4:
+        return base64.b64decode(data)
+    try:
+        # validate=True 保证没有换行等非 base64 字符，否则分块会错位
+        return b"".join(
+            base64.b64decode(data[i:i + step], validate=True)
+            for i in range(0, len(data), step)
+        )
+    except ValueError:
+        return base64.b64decode(data)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _downscale_image(data: bytes, max_side: int, max_bytes: int, quality: int) -> Optional[bytes]:
+    """按最长边 / 字节数上限缩小并重新编码为 JPEG
+
+    Returns:
+        新的 JPEG 数据；无需处理时返回 None
+    """
+    from PIL import Image
+
+    img = Image.open(BytesIO(data))
+    width, height = img.size
+    too_wide = max_side and max(width, height) > max_side
+    too_big = max_bytes and len(data) > max_bytes
+    if not too_wide and not too_big:
+        return None
+
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if too_wide:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    # 仍超过字节上限时逐步降低质量，最后再缩小尺寸
+    while True:
+        output = BytesIO()
+        img.save(output, format="JPEG", quality=quality, optimize=True)
+        result = output.getvalue()
+        if not max_bytes or len(result) <= max_bytes:
+            return result
+        if quality > 60:
+            quality -= 10
+        elif min(img.size) > 256:
+            img = img.resize((img.width * 3 // 4, img.height * 3 // 4), Image.LANCZOS)
+        else:
+            return result
+
+
+class MediaWorkerPool:
+    """媒体 CPU 任务工作池
+
+    base64 编解码、sha256 和图片缩放都在线程池 (或可选的进程池) 中执行，
+    避免数 MB 的图片阻塞事件循环上的其他流式响应。小于 inline_threshold
+    字节的数据直接在当前线程处理，省去调度开销。
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        inline_threshold: Optional[int] = None
+    ):
+        """
+        Args:
+            mode: "thread" 或 "process"
+            max_workers: 工作线程/进程数
+            inline_threshold: 小于该字节数的数据直接在事件循环线程处理
+        """
+        self.mode = mode or config.media_worker_mode
+        if self.mode not in WORKER_MODES:
+            debug_logger.log_warning(f"[MEDIA_WORKER] 未知的工作池模式 {self.mode}，使用 thread")
+            self.mode = "thread"
+        self.max_workers = max_workers if max_workers is not None else config.media_worker_count
+        self.inline_threshold = inline_threshold if inline_threshold is not None else config.media_worker_inline_threshold
+        self._executor: Optional[Executor] = None
+        self._pil_missing_logged = False
+        self._stats = {
+            "offloaded": 0,      # 交给工作池执行的任务数
+            "inline": 0,         # 直接执行的小任务数
+            "seconds": 0.0,      # 工作池任务累计耗时 (含排队)
+            "downscaled": 0,     # 被缩小重新编码的上传图片数
+            "downscaled_bytes_saved": 0
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="media-worker")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args, size: Optional[int] = None) -> Any:
+        """在工作池中执行 fn(*args)
+
+        Args:
+            fn: 模块级函数 (进程池模式下需可 pickle)
+            size: 数据大小，小于 inline_threshold 时直接执行
+        """
+        if size is not None and size < self.inline_threshold:
+            self._stats["inline"] += 1
+            return fn(*args)
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._stats["offloaded"] += 1
+            self._stats["seconds"] += time.perf_counter() - started
+
+    async def b64encode(self, data: bytes) -> str:
+        return await self.run(_b64encode, data, size=len(data))
+
+    async def b64decode(self, data: str) -> bytes:
+        return await self.run(_b64decode, data, size=len(data))
+
+    async def sha256(self, data: bytes) -> str:
+        return await self.run(_sha256, data, size=len(data))
+
+    async def prepare_upload_image(self, data: bytes) -> bytes:
+        """上传前的图片策略：超过最长边或字节上限时缩小并重新编码为 JPEG
+
+        未安装 Pillow 或图片无法解析时原样返回。
+        """
+        max_side = config.media_upload_max_side
+        max_bytes = config.media_upload_max_bytes
+        if not max_side and not max_bytes:
+            return data
+
+        try:
+            result = await self.run(
+                _downscale_image, data, max_side, max_bytes, config.media_upload_jpeg_quality
+            )
+        except ImportError:
+            if not self._pil_missing_logged:
+                self._pil_missing_logged = True
+                debug_logger.log_warning("[MEDIA_WORKER] Pillow 未安装，跳过上传图片缩放 (pip install pillow)")
+            return data
+        except Exception as e:
+            debug_logger.log_warning(f"[MEDIA_WORKER] 图片缩放失败，使用原图上传: {str(e)}")
+            return data
+
+        if result is None:
+            return data
+        self._stats["downscaled"] += 1
+        self._stats["downscaled_bytes_saved"] += max(0, len(data) - len(result))
+        debug_logger.log_info(f"[MEDIA_WORKER] 上传图片已缩小: {len(data)} -> {len(result)} bytes")
+        return result
+
+    def shutdown(self):
+        """关闭工作池 (应用退出时调用)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取工作池统计信息"""
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "inline_threshold": self.inline_threshold,
+            **self._stats,
+            "seconds": round(self._stats["seconds"], 3)
+        }
+
+
+# 全局共享的工作池 (执行器在首次使用时创建)
+media_workers = MediaWorkerPool()
@@ -0,0 +1,151 @@
+"""Adaptive, model-aware poll scheduling for video tasks"""
+import asyncio
+import math
+import time
+from typing import Any, Dict, List, Optional
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of an already sorted list"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return sorted_values[low]
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+class PollScheduler:
+    """模型感知的视频轮询调度器
+
+    从 tasks 表学习每个模型的完成耗时分布 (created_at -> completed_at)，
+    在预计完成之前稀疏轮询，在 P10~P90 区间内密集轮询，查询失败时指数退避。
+    样本不足的模型退化为固定的 config.poll_interval。
+    """
+
+    PERCENTILES = (10, 50, 90, 99)
+
+    def __init__(self, db, refresh_interval: int = 600, min_samples: int = 5, max_interval: float = 30.0):
+        """
+        Args:
+            db: Database instance
+            refresh_interval: 重新学习耗时分布的间隔(秒)
+            min_samples: 启用自适应调度所需的最少样本数
+            max_interval: 单次轮询间隔上限(秒)
+        """
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.min_samples = min_samples
+        self.max_interval = max_interval
+        self._profiles: Dict[str, Dict[str, float]] = {}
+        self._refreshed_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Load initial profiles and start background refresh task"""
+        await self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """Stop background refresh task"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        """Background task to re-learn completion time distributions"""
+        while True:
+            try:
+                await asyncio.sleep(self.refresh_interval)
+                await self.refresh()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(
+                    error_message=f"Poll scheduler refresh error: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+
+    async def refresh(self):
+        """从 tasks 表重新计算各模型的耗时分位数"""
+        try:
+            durations = await self.db.get_task_durations()
+        except Exception as e:
+            debug_logger.log_warning(f"[PollScheduler] 读取任务耗时失败: {str(e)}")
+            return
+
+        profiles = {}
+        for model, values in durations.items():
+            values.sort()
+            profile = {f"p{pct}": round(_percentile(values, pct), 1) for pct in self.PERCENTILES}
+            profile["samples"] = len(values)
+            profiles[model] = profile
+
+        self._profiles = profiles
+        self._refreshed_at = time.time()
+        debug_logger.log_info(f"[PollScheduler] 已更新 {len(profiles)} 个模型的耗时分布")
+
+    def _get_profile(self, model: Optional[str]) -> Optional[Dict[str, float]]:
+        """获取样本充足的模型分布"""
+        profile = self._profiles.get(model) if model else None
+        if profile and profile["samples"] >= self.min_samples:
+            return profile
+        return None
+
+    def next_delay(self, model: Optional[str], elapsed: float, consecutive_errors: int = 0) -> float:
+        """计算距离下一次状态查询的等待时间
+
+        Args:
+            model: 上游模型 key (tasks.model)
+            elapsed: 任务已运行时间(秒)
+            consecutive_errors: 连续查询失败次数
+
+        Returns:
+            等待秒数
+        """
+        base = config.poll_interval
+
+        if consecutive_errors > 0:
+            return min(base * (2 ** consecutive_errors), self.max_interval)
+
+        profile = self._get_profile(model)
+        if not profile:
+            return base
+
+        if elapsed < profile["p10"]:
+            # 预计完成前：每次等待剩余时间的一半，逐步逼近 P10
+            delay = (profile["p10"] - elapsed) / 2
+        elif elapsed <= profile["p90"]:
+            delay = base
+        elif elapsed <= profile["p99"]:
+            delay = base * 2
+        else:
+            delay = base * 4
+
+        return max(base, min(delay, self.max_interval))
+
+    def estimate_progress(self, model: Optional[str], elapsed: float, budget: float) -> int:
+        """根据学习到的分布估算进度百分比 (最多 95%)"""
+        profile = self._get_profile(model)
+        expected = profile["p90"] if profile else budget
+        if expected <= 0:
+            return 0
+        return min(int(elapsed / expected * 100), 95)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取已学习的各模型耗时分位数"""
+        return {
+            "refreshed_at": self._refreshed_at,
+            "min_samples": self.min_samples,
+            "models": self._profiles
+        }
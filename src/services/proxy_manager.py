@@ -1,24 +1,30 @@
 """Proxy management module"""
 from typing import Optional
+from ..core.config import config
 from ..core.database import Database
 from ..core.models import ProxyConfig
 
 class ProxyManager:
-    """Proxy configuration manager"""
+    """Proxy configuration manager
+
+    The proxy settings used on the request path are read from the in-memory
+    config snapshot; the database is only touched by the admin endpoints.
+    """
 
     def __init__(self, db: Database):
         self.db = db
 
     async def get_proxy_url(self) -> Optional[str]:
         """Get proxy URL if enabled, otherwise return None"""
-        config = await self.db.get_proxy_config()
-        if config and config.enabled and config.proxy_url:
+        if config.proxy_enabled and config.proxy_url:
             return config.proxy_url
         return None
 
     async def update_proxy_config(self, enabled: bool, proxy_url: Optional[str]):
         """Update proxy configuration"""
         await self.db.update_proxy_config(enabled, proxy_url)
+        config.set_proxy_config(enabled, proxy_url)
+        config.bump_version()
 
     async def get_proxy_config(self) -> ProxyConfig:
         """Get proxy configuration"""
@@ -0,0 +1,171 @@
+"""Asynchronous batched writer for request logs"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from ..core.config import config
+from ..core.logger import debug_logger
+from ..core.models import RequestLog
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class RequestLogQueue:
+    """请求日志队列
+
+    请求路径只把日志放入内存队列，后台任务每 flush_interval 秒或队列达到
+    batch_size 条时，用 executemany 在一个事务中批量写入 request_logs。
+    队列已满时按 overflow_policy 处理:
+    - drop_oldest: 丢弃最旧的一条
+    - drop_newest: 丢弃新日志
+    - block: 等待写入线程腾出空间 (反压到请求路径)
+    """
+
+    def __init__(
+        self,
+        db,
+        max_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        overflow_policy: Optional[str] = None
+    ):
+        """
+        Args:
+            db: Database instance
+            max_size: 队列最大长度
+            batch_size: 单个事务最多写入的日志条数
+            flush_interval: 写入间隔(秒)
+            overflow_policy: 队列已满时的处理策略
+        """
+        self.db = db
+        self.max_size = max_size if max_size is not None else config.request_log_queue_size
+        self.batch_size = batch_size if batch_size is not None else config.request_log_batch_size
+        self.flush_interval = flush_interval if flush_interval is not None else config.request_log_flush_interval
+        self.overflow_policy = overflow_policy or config.request_log_overflow_policy
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            debug_logger.log_warning(
+                f"[REQUEST_LOG] 未知的溢出策略 {self.overflow_policy}，使用 drop_oldest"
+            )
+            self.overflow_policy = "drop_oldest"
+
+        self._queue: Deque[RequestLog] = deque()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._stats = {
+            "enqueued": 0,       # 入队日志数
+            "written": 0,        # 已写入数据库的日志数
+            "batches": 0,        # 写入事务数
+            "dropped": 0,        # 因队列已满被丢弃的日志数
+            "blocked": 0,        # block 策略下等待过空间的次数
+            "blocked_seconds": 0.0,
+            "failed": 0,         # 写入失败丢失的日志数
+            "max_depth": 0,
+            "last_flush_ms": 0.0
+        }
+
+    async def start(self):
+        """Start background writer task"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._writer_loop())
+
+    async def stop(self):
+        """Stop background writer and drain remaining logs"""
+        if self._task:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self._drain()
+        # 释放仍在等待空间的调用者
+        self._space.set()
+
+    async def put(self, log: RequestLog):
+        """将日志放入队列 (写入线程未运行时直接写库)"""
+        if self._task is None:
+            await self.db.add_request_logs([log])
+            self._stats["written"] += 1
+            return
+
+        if len(self._queue) >= self.max_size:
+            if self.overflow_policy == "drop_newest":
+                self._stats["dropped"] += 1
+                return
+            if self.overflow_policy == "drop_oldest":
+                self._queue.popleft()
+                self._stats["dropped"] += 1
+            else:
+                self._stats["blocked"] += 1
+                started = time.time()
+                while len(self._queue) >= self.max_size and not self._stopping:
+                    self._space.clear()
+                    self._wakeup.set()
+                    await self._space.wait()
+                self._stats["blocked_seconds"] += time.time() - started
+
+        self._queue.append(log)
+        self._stats["enqueued"] += 1
+        self._stats["max_depth"] = max(self._stats["max_depth"], len(self._queue))
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _writer_loop(self):
+        """Background task: write queued logs in batches"""
+        while not self._stopping:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self._drain()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(
+                    error_message=f"Request log writer error: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+                await asyncio.sleep(1)
+
+    async def _drain(self):
+        """写入队列中的全部日志 (每 batch_size 条一个事务)"""
+        while self._queue:
+            batch: List[RequestLog] = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            self._space.set()
+
+            started = time.perf_counter()
+            try:
+                await self.db.add_request_logs(batch)
+            except Exception as e:
+                # 日志写入失败不影响主流程，丢弃该批次
+                self._stats["failed"] += len(batch)
+                debug_logger.log_error(
+                    error_message=f"Failed to write {len(batch)} request logs: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+                continue
+
+            self._stats["written"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计信息"""
+        batches = self._stats["batches"]
+        return {
+            "depth": len(self._queue),
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "overflow_policy": self.overflow_policy,
+            "avg_batch_size": round(self._stats["written"] / batches, 1) if batches else 0,
+            **self._stats,
+            "blocked_seconds": round(self._stats["blocked_seconds"], 3)
+        }
@@ -0,0 +1,52 @@
+"""Single-flight coalescing of concurrent upstream calls"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """合并相同键的并发调用
+
+    同一 (operation, key) 正在执行时，后续调用者等待同一个任务，
+    共享其结果或异常，而不是各自发起上游请求。调用结束后立即移除，
+    之后的调用会重新执行。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self._stats = {"calls": 0, "shared": 0}
+
+    async def do(self, operation: str, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """执行 fn，或等待正在执行的同键调用
+
+        Args:
+            operation: 操作名称 (如 "refresh_at")
+            key: 区分调用的键 (如 token_id)
+            fn: 异步函数
+            *args, **kwargs: 传给 fn 的参数
+
+        Returns:
+            fn 的返回值
+        """
+        flight_key = (operation, key)
+        task = self._inflight.get(flight_key)
+        if task is None:
+            self._stats["calls"] += 1
+            # 在独立任务中执行，首个调用者被取消不影响其他等待者
+            task = asyncio.create_task(fn(*args, **kwargs))
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda t: self._forget(flight_key, t))
+        else:
+            self._stats["shared"] += 1
+
+        return await asyncio.shield(task)
+
+    def _forget(self, flight_key: Tuple[str, Hashable], task: asyncio.Task):
+        if self._inflight.get(flight_key) is task:
+            del self._inflight[flight_key]
+        # 所有等待者都已离开时，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        return {"inflight": len(self._inflight), **self._stats}
@@ -1,50 +1,163 @@
 """Token manager for Flow2API with AT auto-refresh"""
 import asyncio
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List
+from typing import Optional, List, Dict, Set
 from ..core.database import Database
-from ..core.models import Token, Project
+from ..core.models import Token, Project, TokenStats
 from ..core.logger import debug_logger
+from ..core.config import config
+from .at_refresh_scheduler import ATRefreshScheduler
+from .single_flight import SingleFlight
+from .token_stats_buffer import TokenStatsBuffer
 from .flow_client import FlowClient
 from .proxy_manager import ProxyManager
 
 
+# AT 剩余有效期低于该值时在后台刷新 (秒)
+AT_REFRESH_THRESHOLD = 3600
+# AT 剩余有效期低于该值时必须在请求路径上同步刷新 (秒)
+AT_MIN_REMAINING = 300
+
+
 class TokenManager:
-    """Token lifecycle manager with AT auto-refresh"""
+    """Token lifecycle manager with AT auto-refresh
+
+    所有 Token 在启动时加载到内存注册表中，并在每条写路径上同步更新，
+    选择 Token 时无需访问数据库。
+    """
 
     def __init__(self, db: Database, flow_client: FlowClient):
         self.db = db
         self.flow_client = flow_client
-        self._lock = asyncio.Lock()
+        # 按 (操作, token_id) 合并并发的上游调用，单个 Token 的慢刷新不阻塞其他 Token
+        self.single_flight = SingleFlight()
+        # 内存 Token 注册表: token_id -> Token
+        self._tokens: Dict[int, Token] = {}
+        # 按能力划分的可用集合 (已启用且对应功能开关打开)
+        self._eligible: Dict[str, Set[int]] = {"image": set(), "video": set()}
+        self._loaded = False
+        # 注册表每次变更时递增，用于判断基于 Token 列表的缓存是否失效
+        self.version = 0
+        self.refresh_scheduler = ATRefreshScheduler(self)
+        # 使用统计先累积在内存中，由后台任务批量写库
+        self.stats_buffer = TokenStatsBuffer(db)
+
+    # ========== 内存注册表 ==========
+
+    async def load(self):
+        """从数据库加载全部 Token 到内存注册表 (启动时调用)"""
+        tokens = await self.db.get_all_tokens()
+        self._tokens = {token.id: token for token in tokens}
+        self._eligible = {"image": set(), "video": set()}
+        for token in tokens:
+            self._index(token)
+        self._loaded = True
+        self.version += 1
+        await self.stats_buffer.load()
+        debug_logger.log_info(f"[TOKEN_REGISTRY] 已加载 {len(tokens)} 个Token")
+
+    async def _ensure_loaded(self):
+        """注册表尚未加载时从数据库加载"""
+        if not self._loaded:
+            await self.load()
+
+    def _index(self, token: Token):
+        """重新计算单个 Token 的可用集合归属"""
+        for capability, enabled in (("image", token.image_enabled), ("video", token.video_enabled)):
+            if token.is_active and enabled:
+                self._eligible[capability].add(token.id)
+            else:
+                self._eligible[capability].discard(token.id)
+
+    def _apply(self, token_id: int, **fields):
+        """将已写入数据库的字段同步到注册表 (与 Database.update_token 一致，忽略 None 值)"""
+        token = self._tokens.get(token_id)
+        if not token:
+            return
+        for key, value in fields.items():
+            if value is not None:
+                setattr(token, key, value)
+        self._index(token)
+        self.version += 1
+        if self.refresh_scheduler.running and fields.keys() & {"at", "at_expires", "is_active"}:
+            self.refresh_scheduler.schedule(token)
+
+    async def _update_token(self, token_id: int, **fields):
+        """写数据库并同步注册表"""
+        await self.db.update_token(token_id, **fields)
+        self._apply(token_id, **fields)
+
+    def get_eligible_tokens(self, capability: Optional[str] = None) -> List[Token]:
+        """获取可用于指定能力的 Token (纯内存操作)
+
+        Args:
+            capability: "image" / "video"，None 表示所有已启用的 Token
+        """
+        if capability in self._eligible:
+            return [self._tokens[token_id] for token_id in self._eligible[capability]]
+        return [token for token in self._tokens.values() if token.is_active]
+
+    @staticmethod
+    def _seconds_until_expiry(token: Token) -> Optional[float]:
+        """AT 剩余有效秒数 (AT 或过期时间未知时返回 None)"""
+        if not token.at or not token.at_expires:
+            return None
+        at_expires = token.at_expires
+        if at_expires.tzinfo is None:
+            at_expires = at_expires.replace(tzinfo=timezone.utc)
+        return (at_expires - datetime.now(timezone.utc)).total_seconds()
+
+    def is_at_fresh(self, token: Token) -> bool:
+        """AT 是否可直接使用而无需同步刷新 (纯内存判断)"""
+        remaining = self._seconds_until_expiry(token)
+        return remaining is not None and remaining >= AT_MIN_REMAINING
+
+    def schedule_refresh(self, token_id: int):
+        """在后台刷新 AT，不阻塞当前请求"""
+        self.refresh_scheduler.request_refresh(token_id)
 
     # ========== Token CRUD ==========
 
     async def get_all_tokens(self) -> List[Token]:
         """Get all tokens"""
-        return await self.db.get_all_tokens()
+        await self._ensure_loaded()
+        # 与 Database.get_all_tokens 相同: 按创建时间倒序
+        return sorted(
+            self._tokens.values(),
+            key=lambda t: (t.created_at is not None, t.created_at or datetime.min, t.id),
+            reverse=True
+        )
 
     async def get_active_tokens(self) -> List[Token]:
         """Get all active tokens"""
-        return await self.db.get_active_tokens()
+        await self._ensure_loaded()
+        return [token for token in self._tokens.values() if token.is_active]
 
     async def get_token(self, token_id: int) -> Optional[Token]:
         """Get token by ID"""
-        return await self.db.get_token(token_id)
+        await self._ensure_loaded()
+        return self._tokens.get(token_id)
 
     async def delete_token(self, token_id: int):
         """Delete token"""
         await self.db.delete_token(token_id)
+        self._tokens.pop(token_id, None)
+        for ids in self._eligible.values():
+            ids.discard(token_id)
+        self.refresh_scheduler.unschedule(token_id)
+        self.stats_buffer.forget(token_id)
+        self.version += 1
 
     async def enable_token(self, token_id: int):
         """Enable a token and reset error count"""
         # Enable the token
-        await self.db.update_token(token_id, is_active=True)
-        # Reset error count when enabling (only reset total error_count, keep today_error_count)
-        await self.db.reset_error_count(token_id)
+        await self._update_token(token_id, is_active=True)
+        # Reset consecutive error count when enabling (keep error_count and today_error_count)
+        self.stats_buffer.reset_consecutive(token_id)
 
     async def disable_token(self, token_id: int):
         """Disable a token"""
-        await self.db.update_token(token_id, is_active=False)
+        await self._update_token(token_id, is_active=False)
 
     # ========== Token添加 (支持Project创建) ==========
 
@@ -153,6 +266,14 @@ class TokenManager:
         token_id = await self.db.add_token(token)
         token.id = token_id
 
+        # 从数据库重新读取 (包含 created_at 等默认字段) 并加入注册表
+        await self._ensure_loaded()
+        self._tokens[token_id] = await self.db.get_token(token_id) or token
+        self._index(self._tokens[token_id])
+        self.version += 1
+        if self.refresh_scheduler.running:
+            self.refresh_scheduler.schedule(self._tokens[token_id])
+
         # Step 7: 保存Project到数据库
         project = Project(
             project_id=project_id,
@@ -207,7 +328,7 @@ class TokenManager:
             update_fields["video_concurrency"] = video_concurrency
 
         # 检查token是否因429被禁用，如果是且未过期，则清空429状态
-        token = await self.db.get_token(token_id)
+        token = await self.get_token(token_id)
         if token and token.ban_reason == "429_rate_limit":
             # 检查token是否过期
             is_expired = False
@@ -226,7 +347,7 @@ class TokenManager:
                 update_fields["banned_at"] = None
 
         if update_fields:
-            await self.db.update_token(token_id, **update_fields)
+            await self._update_token(token_id, **update_fields)
 
     # ========== AT自动刷新逻辑 (核心) ==========
 
@@ -237,7 +358,7 @@ class TokenManager:
             True if AT is valid or refreshed successfully
             False if AT cannot be refreshed
         """
-        token = await self.db.get_token(token_id)
+        token = await self.get_token(token_id)
         if not token:
             return False
 
@@ -251,58 +372,62 @@ class TokenManager:
             debug_logger.log_info(f"[AT_CHECK] Token {token_id}: AT过期时间未知,尝试刷新")
             return await self._refresh_at(token_id)
 
-        # 检查是否即将过期 (提前1小时刷新)
-        now = datetime.now(timezone.utc)
-        # 确保at_expires也是timezone-aware
-        if token.at_expires.tzinfo is None:
-            at_expires_aware = token.at_expires.replace(tzinfo=timezone.utc)
-        else:
-            at_expires_aware = token.at_expires
+        time_until_expiry = self._seconds_until_expiry(token)
 
-        time_until_expiry = at_expires_aware - now
-
-        if time_until_expiry.total_seconds() < 3600:  # 1 hour (3600 seconds)
-            debug_logger.log_info(f"[AT_CHECK] Token {token_id}: AT即将过期 (剩余 {time_until_expiry.total_seconds():.0f} 秒),需要刷新")
+        # 即将失效，无法等待后台刷新
+        if time_until_expiry < AT_MIN_REMAINING:
+            debug_logger.log_info(f"[AT_CHECK] Token {token_id}: AT即将过期 (剩余 {time_until_expiry:.0f} 秒),需要刷新")
             return await self._refresh_at(token_id)
 
+        # 剩余不足1小时: 交给后台调度器尽快刷新，本次请求继续使用当前AT
+        if time_until_expiry < AT_REFRESH_THRESHOLD:
+            debug_logger.log_info(f"[AT_CHECK] Token {token_id}: AT剩余 {time_until_expiry:.0f} 秒,已安排后台刷新")
+            self.schedule_refresh(token_id)
+
         # AT有效
         return True
 
+    async def refresh_at(self, token_id: int) -> bool:
+        """立即刷新AT (后台调度器使用)"""
+        return await self._refresh_at(token_id)
+
 
     async def _refresh_at(self, token_id: int) -> bool:
         """内部方法: 刷新AT
 
         如果 AT 刷新失败（ST 可能过期），会尝试通过浏览器自动刷新 ST，
-        然后重试 AT 刷新。
+        然后重试 AT 刷新。同一 Token 的并发刷新合并为一次。
 
         Returns:
             True if refresh successful, False otherwise
         """
-        async with self._lock:
-            token = await self.db.get_token(token_id)
-            if not token:
-                return False
+        return await self.single_flight.do("refresh_at", token_id, self._refresh_at_once, token_id)
+
+    async def _refresh_at_once(self, token_id: int) -> bool:
+        token = await self.get_token(token_id)
+        if not token:
+            return False
+
+        # 第一次尝试刷新 AT
+        result = await self._do_refresh_at(token_id, token.st)
+        if result:
+            return True
 
-            # 第一次尝试刷新 AT
-            result = await self._do_refresh_at(token_id, token.st)
+        # AT 刷新失败，尝试自动更新 ST
+        debug_logger.log_info(f"[AT_REFRESH] Token {token_id}: 第一次 AT 刷新失败，尝试自动更新 ST...")
+
+        new_st = await self._try_refresh_st(token_id, token)
+        if new_st:
+            # ST 更新成功，重试 AT 刷新
+            debug_logger.log_info(f"[AT_REFRESH] Token {token_id}: ST 已更新，重试 AT 刷新...")
+            result = await self._do_refresh_at(token_id, new_st)
             if result:
                 return True
 
-            # AT 刷新失败，尝试自动更新 ST
-            debug_logger.log_info(f"[AT_REFRESH] Token {token_id}: 第一次 AT 刷新失败，尝试自动更新 ST...")
-            
-            new_st = await self._try_refresh_st(token_id, token)
-            if new_st:
-                # ST 更新成功，重试 AT 刷新
-                debug_logger.log_info(f"[AT_REFRESH] Token {token_id}: ST 已更新，重试 AT 刷新...")
-                result = await self._do_refresh_at(token_id, new_st)
-                if result:
-                    return True
-
-            # 所有刷新尝试都失败，禁用 Token
-            debug_logger.log_error(f"[AT_REFRESH] Token {token_id}: 所有刷新尝试失败，禁用 Token")
-            await self.disable_token(token_id)
-            return False
+        # 所有刷新尝试都失败，禁用 Token
+        debug_logger.log_error(f"[AT_REFRESH] Token {token_id}: 所有刷新尝试失败，禁用 Token")
+        await self.disable_token(token_id)
+        return False
 
     async def _do_refresh_at(self, token_id: int, st: str) -> bool:
         """执行 AT 刷新的核心逻辑
@@ -331,7 +456,7 @@ class TokenManager:
                     pass
 
             # 更新数据库
-            await self.db.update_token(
+            await self._update_token(
                 token_id,
                 at=new_at,
                 at_expires=new_at_expires
@@ -343,7 +468,7 @@ class TokenManager:
             # 验证 AT 有效性：通过 get_credits 测试
             try:
                 credits_result = await self.flow_client.get_credits(new_at)
-                await self.db.update_token(
+                await self._update_token(
                     token_id,
                     credits=credits_result.get("credits", 0)
                 )
@@ -396,7 +521,7 @@ class TokenManager:
             new_st = await service.refresh_session_token(token.current_project_id)
             if new_st and new_st != token.st:
                 # 更新数据库中的 ST
-                await self.db.update_token(token_id, st=new_st)
+                await self._update_token(token_id, st=new_st)
                 debug_logger.log_info(f"[ST_REFRESH] Token {token_id}: ST 已自动更新")
                 return new_st
             elif new_st == token.st:
@@ -416,7 +541,7 @@ class TokenManager:
         Returns:
             project_id
         """
-        token = await self.db.get_token(token_id)
+        token = await self.get_token(token_id)
         if not token:
             raise ValueError("Token not found")
 
@@ -424,6 +549,13 @@ class TokenManager:
         if token.current_project_id:
             return token.current_project_id
 
+        # 并发请求共享同一次创建，避免重复创建Project
+        return await self.single_flight.do("create_project", token_id, self._create_project, token)
+
+    async def _create_project(self, token: Token) -> str:
+        """为Token创建新Project并设为当前Project"""
+        token_id = token.id
+
         # 创建新Project
         now = datetime.now()
         project_name = now.strftime("%b %d - %H:%M")
@@ -433,7 +565,7 @@ class TokenManager:
             debug_logger.log_info(f"[PROJECT] Created project for token {token_id}: {project_name}")
 
             # 更新Token
-            await self.db.update_token(
+            await self._update_token(
                 token_id,
                 current_project_id=project_id,
                 current_project_name=project_name
@@ -454,37 +586,42 @@ class TokenManager:
 
     # ========== Token使用统计 ==========
 
-    async def record_usage(self, token_id: int, is_video: bool = False):
-        """Record token usage"""
-        await self.db.update_token(token_id, use_count=1, last_used_at=datetime.now())
+    async def get_all_token_stats(self) -> Dict[int, TokenStats]:
+        """获取所有 Token 的统计 (一次查询，并叠加内存中尚未写库的增量)"""
+        stats = await self.db.get_all_token_stats()
+        for item in stats.values():
+            self.stats_buffer.overlay(item)
+        return stats
 
-        if is_video:
-            await self.db.increment_token_stats(token_id, "video")
-        else:
-            await self.db.increment_token_stats(token_id, "image")
+    async def record_usage(self, token_id: int, is_video: bool = False):
+        """Record token usage (buffered, flushed to database in batches)"""
+        now = datetime.now()
+        token = self._tokens.get(token_id)
+        if token:
+            token.use_count = (token.use_count or 0) + 1
+            token.last_used_at = now
+        self.stats_buffer.record_usage(token_id, is_video, now)
 
     async def record_error(self, token_id: int):
         """Record token error and auto-disable if threshold reached"""
-        await self.db.increment_token_stats(token_id, "error")
+        consecutive = self.stats_buffer.record_error(token_id)
 
-        # Check if should auto-disable token (based on consecutive errors)
-        stats = await self.db.get_token_stats(token_id)
-        admin_config = await self.db.get_admin_config()
-
-        if stats and stats.consecutive_error_count >= admin_config.error_ban_threshold:
+        # Check if should auto-disable token (based on in-memory consecutive errors)
+        threshold = config.error_ban_threshold
+        if consecutive >= threshold:
             debug_logger.log_warning(
-                f"[TOKEN_BAN] Token {token_id} consecutive error count ({stats.consecutive_error_count}) "
-                f"reached threshold ({admin_config.error_ban_threshold}), auto-disabling"
+                f"[TOKEN_BAN] Token {token_id} consecutive error count ({consecutive}) "
+                f"reached threshold ({threshold}), auto-disabling"
             )
             await self.disable_token(token_id)
 
     async def record_success(self, token_id: int):
         """Record successful request (reset consecutive error count)
 
-        This method resets error_count to 0, which is used for auto-disable threshold checking.
+        This method resets consecutive_error_count to 0, which is used for auto-disable threshold checking.
         Note: today_error_count and historical statistics are NOT reset.
         """
-        await self.db.reset_error_count(token_id)
+        self.stats_buffer.reset_consecutive(token_id)
 
     async def ban_token_for_429(self, token_id: int):
         """因429错误立即禁用token
@@ -493,7 +630,7 @@ class TokenManager:
             token_id: Token ID
         """
         debug_logger.log_warning(f"[429_BAN] 禁用Token {token_id} (原因: 429 Rate Limit)")
-        await self.db.update_token(
+        await self._update_token(
             token_id,
             is_active=False,
             ban_reason="429_rate_limit",
@@ -508,7 +645,7 @@ class TokenManager:
         - 仅解禁未过期的token
         - 仅解禁因429被禁用的token
         """
-        all_tokens = await self.db.get_all_tokens()
+        all_tokens = await self.get_all_tokens()
         now = datetime.now(timezone.utc)
 
         for token in all_tokens:
@@ -550,24 +687,27 @@ class TokenManager:
                     f"[AUTO_UNBAN] 解禁Token {token.id} (禁用时间: {banned_at_aware}, "
                     f"已过 {time_since_ban.total_seconds() / 3600:.1f} 小时)"
                 )
-                await self.db.update_token(
+                await self._update_token(
                     token.id,
                     is_active=True,
                     ban_reason=None,
                     banned_at=None
                 )
                 # 重置错误计数
-                await self.db.reset_error_count(token.id)
+                self.stats_buffer.reset_consecutive(token.id)
 
     # ========== 余额刷新 ==========
 
     async def refresh_credits(self, token_id: int) -> int:
-        """刷新Token余额
+        """刷新Token余额 (同一Token的并发刷新合并为一次上游调用)
 
         Returns:
             credits
         """
-        token = await self.db.get_token(token_id)
+        return await self.single_flight.do("refresh_credits", token_id, self._refresh_credits_once, token_id)
+
+    async def _refresh_credits_once(self, token_id: int) -> int:
+        token = await self.get_token(token_id)
         if not token:
             return 0
 
@@ -576,14 +716,14 @@ class TokenManager:
             return 0
 
         # 重新获取token (AT可能已刷新)
-        token = await self.db.get_token(token_id)
+        token = await self.get_token(token_id)
 
         try:
             result = await self.flow_client.get_credits(token.at)
             credits = result.get("credits", 0)
 
             # 更新数据库
-            await self.db.update_token(token_id, credits=credits)
+            await self._update_token(token_id, credits=credits)
 
             return credits
         except Exception as e:
@@ -0,0 +1,225 @@
+"""Write-behind buffer for token usage statistics"""
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+@dataclass
+class StatsDelta:
+    """单个 Token 尚未写入数据库的统计增量"""
+    image: int = 0
+    video: int = 0
+    error: int = 0
+    # 本批次中最后一次成功之后的错误数 (reset_consecutive 为 True 时从 0 开始累加)
+    consecutive: int = 0
+    reset_consecutive: bool = False
+    use_count: int = 0
+    last_used_at: Optional[datetime] = None
+    last_error_at: Optional[str] = None
+
+
+class TokenStatsBuffer:
+    """Token 统计的内存缓冲
+
+    请求路径只修改内存中的增量，后台任务每 flush_interval 秒或累计
+    max_pending 个事件时，在一个事务中将所有增量写入 token_stats 和 tokens。
+    连续错误计数同时保存在内存中，供自动禁用阈值立即判断。
+    """
+
+    def __init__(self, db, flush_interval: Optional[float] = None, max_pending: Optional[int] = None):
+        """
+        Args:
+            db: Database instance
+            flush_interval: 刷写间隔(秒)
+            max_pending: 累计多少个事件后立即刷写
+        """
+        self.db = db
+        self.flush_interval = flush_interval if flush_interval is not None else config.token_stats_flush_interval
+        self.max_pending = max_pending if max_pending is not None else config.token_stats_flush_max_events
+        self._pending: Dict[int, StatsDelta] = {}
+        self._pending_events = 0
+        # token_id -> 当前连续错误数 (内存中的权威值)
+        self._consecutive: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._stats = {
+            "events": 0,        # 累计记录的事件数
+            "flushes": 0,       # 刷写事务数
+            "flushed_rows": 0,  # 写入的 Token 行数
+            "failed": 0,        # 刷写失败次数
+            "last_flush_ms": 0.0
+        }
+
+    async def load(self):
+        """从数据库加载连续错误计数 (启动时调用)"""
+        self._consecutive = await self.db.get_consecutive_error_counts()
+
+    async def start(self):
+        """Start background flush task"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop background flush task and write remaining deltas"""
+        if self._task:
+            # 不直接取消任务，避免中断正在进行的刷写事务
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def _delta(self, token_id: int) -> StatsDelta:
+        delta = self._pending.get(token_id)
+        if delta is None:
+            delta = self._pending[token_id] = StatsDelta()
+        return delta
+
+    def _mark(self):
+        self._pending_events += 1
+        self._stats["events"] += 1
+        if self._pending_events >= self.max_pending:
+            self._wakeup.set()
+
+    def record_usage(self, token_id: int, is_video: bool, used_at: datetime):
+        """记录一次生成 (图片或视频计数 + tokens.use_count/last_used_at)"""
+        delta = self._delta(token_id)
+        if is_video:
+            delta.video += 1
+        else:
+            delta.image += 1
+        delta.use_count += 1
+        delta.last_used_at = used_at
+        self._mark()
+
+    def record_error(self, token_id: int) -> int:
+        """记录一次错误
+
+        Returns:
+            记录后的连续错误数
+        """
+        delta = self._delta(token_id)
+        delta.error += 1
+        delta.consecutive += 1
+        delta.last_error_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self._consecutive[token_id] = self._consecutive.get(token_id, 0) + 1
+        self._mark()
+        return self._consecutive[token_id]
+
+    def reset_consecutive(self, token_id: int):
+        """清零连续错误数 (请求成功或手动启用时)"""
+        if not self._consecutive.get(token_id) and token_id not in self._pending:
+            # 已经为 0 且没有待写入的错误，无需写库
+            return
+        delta = self._delta(token_id)
+        delta.reset_consecutive = True
+        delta.consecutive = 0
+        self._consecutive[token_id] = 0
+        self._mark()
+
+    def forget(self, token_id: int):
+        """丢弃已删除 Token 的内存状态"""
+        self._pending.pop(token_id, None)
+        self._consecutive.pop(token_id, None)
+
+    def get_consecutive_errors(self, token_id: int) -> int:
+        return self._consecutive.get(token_id, 0)
+
+    def overlay(self, stats):
+        """把尚未写库的增量叠加到从数据库读取的 TokenStats 上 (原地修改)"""
+        stats.consecutive_error_count = self._consecutive.get(stats.token_id, stats.consecutive_error_count)
+        delta = self._pending.get(stats.token_id)
+        if delta is None:
+            return stats
+        stats.image_count += delta.image
+        stats.video_count += delta.video
+        stats.error_count += delta.error
+        stats.today_image_count += delta.image
+        stats.today_video_count += delta.video
+        stats.today_error_count += delta.error
+        return stats
+
+    async def flush(self):
+        """将当前所有增量在一个事务中写入数据库"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            self._pending_events = 0
+
+            started = time.perf_counter()
+            try:
+                await self.db.apply_token_stats_deltas(pending)
+            except asyncio.CancelledError:
+                for token_id, delta in pending.items():
+                    self._merge_back(token_id, delta)
+                raise
+            except Exception as e:
+                # 写入失败时把增量合并回去，下次重试
+                for token_id, delta in pending.items():
+                    self._merge_back(token_id, delta)
+                self._stats["failed"] += 1
+                debug_logger.log_error(
+                    error_message=f"Token stats flush failed: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+                return
+
+            self._stats["flushes"] += 1
+            self._stats["flushed_rows"] += len(pending)
+            self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _merge_back(self, token_id: int, old: StatsDelta):
+        """把写入失败的旧增量合并到 flush 期间产生的新增量之前"""
+        new = self._pending.get(token_id)
+        if new is None:
+            self._pending[token_id] = old
+            self._pending_events += 1
+            return
+        new.image += old.image
+        new.video += old.video
+        new.error += old.error
+        new.use_count += old.use_count
+        new.last_used_at = new.last_used_at or old.last_used_at
+        new.last_error_at = new.last_error_at or old.last_error_at
+        if not new.reset_consecutive:
+            new.consecutive += old.consecutive
+            new.reset_consecutive = old.reset_consecutive
+
+    async def _flush_loop(self):
+        """Background task: flush deltas periodically or when enough events pile up"""
+        while not self._stopping:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(
+                    error_message=f"Token stats flush loop error: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+                await asyncio.sleep(1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓冲统计信息"""
+        return {
+            "pending_tokens": len(self._pending),
+            "pending_events": self._pending_events,
+            "flush_interval": self.flush_interval,
+            "max_pending": self.max_pending,
+            **self._stats
+        }
@@ -0,0 +1,83 @@
+"""Content-addressed cache of uploaded reference images"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from ..core.config import config
+
+CacheKey = Tuple[str, str]
+
+
+class UploadCache:
+    """参考图上传缓存
+
+    以 (project_id, 图片 sha256) 为键记录上传后返回的 media_id，同一项目中
+    重复引用同一张图片时直接复用，不再重新上传。条目超过 ttl 秒后失效，
+    数量超过 max_entries 时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        """
+        Args:
+            ttl: 条目有效期(秒)，0 表示禁用缓存
+            max_entries: 最大条目数
+        """
+        self.ttl = ttl if ttl is not None else config.flow_upload_cache_ttl
+        self.max_entries = max_entries if max_entries is not None else config.flow_upload_cache_max_entries
+        # key -> (media_id, 写入时间)，最久未使用的在最前
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evicted": 0,
+            "bytes_saved": 0   # 命中时省去上传的图片字节数
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, project_id: str, digest: str, size: int = 0) -> Optional[str]:
+        """查询 media_id (命中时计入 bytes_saved)"""
+        key = (project_id, digest)
+        item = self._entries.get(key)
+        if item is None:
+            self._stats["misses"] += 1
+            return None
+        media_id, stored_at = item
+        if time.time() - stored_at >= self.ttl:
+            del self._entries[key]
+            self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        self._stats["bytes_saved"] += size
+        return media_id
+
+    def put(self, project_id: str, digest: str, media_id: str):
+        """记录上传结果"""
+        if not self.enabled:
+            return
+        key = (project_id, digest)
+        self._entries[key] = (media_id, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evicted"] += 1
+
+    def invalidate_project(self, project_id: str):
+        """删除某个项目的全部条目 (项目被替换或删除时)"""
+        for key in [key for key in self._entries if key[0] == project_id]:
+            del self._entries[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else None,
+            **self._stats
+        }
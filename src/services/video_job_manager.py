@@ -0,0 +1,225 @@
+"""Durable async video job service"""
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Set
+from curl_cffi.requests import AsyncSession
+from ..core.logger import debug_logger
+from ..core.models import Task, VideoJob
+from .generation_handler import MODEL_CONFIG
+
+
+def _to_epoch(value: Optional[datetime]) -> Optional[int]:
+    """转换为 unix 时间戳 (SQLite CURRENT_TIMESTAMP 写入的是不带时区的 UTC 时间)"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+class VideoJobManager:
+    """异步视频任务管理
+
+    /v1/videos 提交的任务在后台执行，状态持久化在 video_jobs 表中；
+    应用重启后根据 tasks 表中 status='processing' 的任务恢复轮询，
+    完成后可通过 webhook 回调通知调用方。
+    """
+
+    def __init__(self, generation_handler, token_manager, db, resume_max_age: int = 86400):
+        """
+        Args:
+            generation_handler: GenerationHandler instance
+            token_manager: TokenManager instance
+            db: Database instance
+            resume_max_age: 重启后仅恢复创建时间在该范围(秒)内的任务，更早的直接标记失败
+        """
+        self.generation_handler = generation_handler
+        self.token_manager = token_manager
+        self.db = db
+        self.resume_max_age = resume_max_age
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _spawn(self, coro):
+        """启动后台协程并跟踪，关闭时统一取消"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def submit(
+        self,
+        model: str,
+        prompt: str,
+        images: Optional[List[bytes]] = None,
+        webhook_url: Optional[str] = None
+    ) -> VideoJob:
+        """提交视频任务并立即返回任务记录"""
+        job = VideoJob(
+            job_id=f"video-{uuid.uuid4().hex}",
+            model=model,
+            prompt=prompt,
+            status="queued",
+            webhook_url=webhook_url
+        )
+        await self.db.create_video_job(job)
+        self._spawn(self._run_job(job.job_id, model, prompt, images))
+        return await self.db.get_video_job(job.job_id)
+
+    async def get_job(self, job_id: str) -> Optional[VideoJob]:
+        """查询任务状态"""
+        return await self.db.get_video_job(job_id)
+
+    async def _run_job(self, job_id: str, model: str, prompt: str, images: Optional[List[bytes]]):
+        """后台执行生成流程（复用流式生成链路）"""
+        last_error = None
+        try:
+            async for chunk in self.generation_handler.handle_generation(
+                model=model,
+                prompt=prompt,
+                images=images,
+                stream=True,
+                job_id=job_id
+            ):
+                last_error = self._extract_error(chunk) or last_error
+        except asyncio.CancelledError:
+            # 应用关闭：任务保持 processing，下次启动时从 tasks 表恢复
+            raise
+        except Exception as e:
+            last_error = str(e)
+
+        await self._finalize(job_id, last_error)
+
+    @staticmethod
+    def _extract_error(chunk: str) -> Optional[str]:
+        """从生成链路输出中提取错误信息 (错误响应为非 SSE 的 JSON)"""
+        if chunk.startswith("data: "):
+            return None
+        try:
+            payload = json.loads(chunk)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        if isinstance(payload, dict) and "error" in payload:
+            return payload["error"].get("message")
+        return None
+
+    async def _finalize(self, job_id: str, fallback_error: Optional[str] = None):
+        """确保任务进入终态并投递 webhook"""
+        job = await self.db.get_video_job(job_id)
+        if not job:
+            return
+
+        if job.status not in ("completed", "failed"):
+            await self.db.update_video_job(
+                job_id,
+                status="failed",
+                error_message=fallback_error or "视频生成失败",
+                completed_at=time.time()
+            )
+            job = await self.db.get_video_job(job_id)
+
+        if job.webhook_url and not job.webhook_status:
+            await self._deliver_webhook(job)
+
+    async def _deliver_webhook(self, job: VideoJob, max_retries: int = 3):
+        """投递完成回调，失败时指数退避重试"""
+        payload = self.to_response(job)
+        for attempt in range(max_retries):
+            try:
+                async with AsyncSession() as session:
+                    response = await session.post(job.webhook_url, json=payload, timeout=15)
+                if response.status_code < 400:
+                    await self.db.update_video_job(job.job_id, webhook_status="delivered")
+                    debug_logger.log_info(f"[VideoJob] Webhook 已投递: {job.job_id}")
+                    return
+                debug_logger.log_warning(f"[VideoJob] Webhook HTTP {response.status_code}: {job.job_id}")
+            except Exception as e:
+                debug_logger.log_warning(f"[VideoJob] Webhook 投递失败 ({attempt + 1}/{max_retries}): {str(e)}")
+            await asyncio.sleep(2 ** attempt)
+
+        await self.db.update_video_job(job.job_id, webhook_status="failed")
+
+    async def resume_pending(self):
+        """启动时恢复重启前未完成的任务"""
+        # 提交阶段被中断的任务无法确认上游是否已创建，直接标记失败
+        for job in await self.db.get_queued_video_jobs():
+            await self.db.update_video_job(
+                job.job_id,
+                status="failed",
+                error_message="服务重启，任务提交被中断，请重新提交",
+                completed_at=time.time()
+            )
+            self._spawn(self._finalize(job.job_id))
+
+        tasks = await self.db.get_processing_tasks()
+        resumed = 0
+        for task in tasks:
+            if task.created_at and time.time() - _to_epoch(task.created_at) > self.resume_max_age:
+                await self.db.update_task(task.task_id, status="failed", error_message="expired before resume", completed_at=time.time())
+                job = await self.db.get_video_job_by_task(task.task_id)
+                if job:
+                    await self.db.update_video_job(job.job_id, status="failed", error_message="任务已过期", completed_at=time.time())
+                    self._spawn(self._finalize(job.job_id))
+                continue
+
+            self._spawn(self._resume_task(task))
+            resumed += 1
+
+        if resumed:
+            print(f"✓ Resumed polling for {resumed} unfinished video task(s)")
+
+    async def _resume_task(self, task: Task):
+        """恢复单个任务的轮询"""
+        job = await self.db.get_video_job_by_task(task.task_id)
+        job_id = job.job_id if job else None
+        last_error = None
+
+        try:
+            token = await self.token_manager.get_token(task.token_id)
+            if not token or not await self.token_manager.is_at_valid(task.token_id):
+                raise Exception("任务所属 Token 不可用，无法恢复轮询")
+            token = await self.token_manager.get_token(task.token_id)
+
+            # 原始视频尚未放大时，按任务所属模型继续执行放大
+            upsample_config = None
+            if job:
+                model_config = MODEL_CONFIG.get(job.model, {})
+                if model_config.get("upsample") and task.model == model_config.get("model_key"):
+                    upsample_config = model_config["upsample"]
+
+            debug_logger.log_info(f"[VideoJob] 恢复轮询任务: {task.task_id}")
+            async for chunk in self.generation_handler.resume_video_task(token, task, upsample_config, job_id):
+                last_error = self._extract_error(chunk) or last_error
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            last_error = str(e)
+            debug_logger.log_error(f"[VideoJob] 恢复任务失败 {task.task_id}: {last_error}")
+            await self.db.update_task(task.task_id, status="failed", error_message=last_error, completed_at=time.time())
+
+        if job_id:
+            await self._finalize(job_id, last_error)
+
+    async def shutdown(self):
+        """取消所有后台任务（未完成的任务将在下次启动时恢复）"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def to_response(job: VideoJob) -> dict:
+        """转换为 API 响应格式"""
+        return {
+            "id": job.job_id,
+            "object": "video.job",
+            "model": job.model,
+            "status": job.status,
+            "result_url": job.result_url,
+            "error": job.error_message,
+            "created_at": _to_epoch(job.created_at),
+            "completed_at": _to_epoch(job.completed_at)
+        }
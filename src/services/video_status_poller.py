@@ -0,0 +1,154 @@
+"""Batched video generation status poller"""
+import asyncio
+from typing import Any, Dict, List, Optional
+from ..core.config import config
+from ..core.logger import debug_logger
+
+
+class _PendingCheck:
+    """等待下一次批量查询的单个视频操作"""
+
+    def __init__(self, operation: Dict, future: asyncio.Future):
+        self.operation = operation
+        self.future = future
+
+
+class VideoStatusPoller:
+    """跨请求的视频状态批量轮询服务
+
+    所有正在等待的视频操作按 Access Token 分组，每个轮询周期对每个 AT 只调用
+    一次 video:batchCheckAsyncVideoGenerationStatus，再通过 future 把各自的
+    状态分发给等待中的请求。
+    """
+
+    def __init__(self, flow_client, batch_window: Optional[float] = None, max_batch_size: Optional[int] = None):
+        """
+        Args:
+            flow_client: FlowClient instance
+            batch_window: 聚合窗口(秒)，窗口内登记的查询合并为一次上游调用
+            max_batch_size: 单次上游调用最多携带的操作数
+        """
+        self.flow_client = flow_client
+        self.batch_window = batch_window if batch_window is not None else config.poll_batch_window
+        self.max_batch_size = max_batch_size if max_batch_size is not None else config.poll_batch_size
+        # at -> {operation_name: _PendingCheck}
+        self._pending: Dict[str, Dict[str, _PendingCheck]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "ticks": 0,               # 轮询周期数
+            "upstream_calls": 0,      # 实际发出的批量查询次数
+            "operations_checked": 0,  # 查询过的操作总数
+            "errors": 0               # 批量查询失败次数
+        }
+
+    async def start(self):
+        """Start background polling task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        """Stop background polling task"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # 唤醒仍在等待的请求，避免其永久挂起
+        pending, self._pending = self._pending, {}
+        for entries in pending.values():
+            for entry in entries.values():
+                if not entry.future.done():
+                    entry.future.cancel()
+
+    async def check(self, at: str, operation: Dict) -> Optional[Dict]:
+        """登记一个操作并等待下一次批量查询的结果
+
+        Args:
+            at: Access Token
+            operation: 操作 {"operation": {"name": "task_id"}, "sceneId": "...", "status": "..."}
+
+        Returns:
+            上游返回的该操作最新状态；本轮结果中不包含该操作时返回 None
+        """
+        if self._task is None:
+            await self.start()
+
+        name = operation["operation"]["name"]
+        entries = self._pending.setdefault(at, {})
+        entry = entries.get(name)
+        if entry is None:
+            future = asyncio.get_running_loop().create_future()
+            # 所有等待者都已离开时，避免 "exception was never retrieved" 警告
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            entry = _PendingCheck(operation, future)
+            entries[name] = entry
+
+        self._wakeup.set()
+        # 同一操作的多个等待者共享 future，单个等待者取消不影响其他人
+        return await asyncio.shield(entry.future)
+
+    async def _poll_loop(self):
+        """Background task: flush pending checks once per batch window"""
+        while True:
+            try:
+                await self._wakeup.wait()
+                await asyncio.sleep(self.batch_window)
+                self._wakeup.clear()
+
+                pending, self._pending = self._pending, {}
+                if not pending:
+                    continue
+
+                self._stats["ticks"] += 1
+                await asyncio.gather(*[
+                    self._check_batch(at, list(entries.values()))
+                    for at, entries in pending.items()
+                ])
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                debug_logger.log_error(
+                    error_message=f"Video status poller error: {str(e)}",
+                    status_code=0,
+                    response_text=""
+                )
+
+    async def _check_batch(self, at: str, entries: List[_PendingCheck]):
+        """对同一 AT 下的操作发起批量查询并分发结果"""
+        for i in range(0, len(entries), self.max_batch_size):
+            chunk = entries[i:i + self.max_batch_size]
+            try:
+                result = await self.flow_client.check_video_status(at, [e.operation for e in chunk])
+                self._stats["upstream_calls"] += 1
+                self._stats["operations_checked"] += len(chunk)
+
+                checked_operations = result.get("operations", [])
+                checked = {}
+                for op in checked_operations:
+                    op_name = op.get("operation", {}).get("name")
+                    if op_name:
+                        checked[op_name] = op
+                # 单操作查询时上游可能不回传 name，按位置匹配
+                if len(chunk) == 1 and len(checked_operations) == 1 and not checked:
+                    checked[chunk[0].operation["operation"]["name"]] = checked_operations[0]
+
+                for entry in chunk:
+                    if not entry.future.done():
+                        entry.future.set_result(checked.get(entry.operation["operation"]["name"]))
+            except Exception as e:
+                self._stats["errors"] += 1
+                for entry in chunk:
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取轮询统计信息"""
+        return {
+            "pending_operations": sum(len(entries) for entries in self._pending.values()),
+            "pending_tokens": len(self._pending),
+            **self._stats
+        }